@@ -0,0 +1,100 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+Message = Union[str, bytes]
+
+
+class EventCoalescer:
+    """
+    Keeps only the latest event of every token and publishes the pending
+    ones once per interval. The events processor keeps only the newest event
+    of a token per window anyway, so the replaced events are never published
+
+    The pending events are published right away when there are too many
+    tokens, so the memory is bounded
+    """
+    def __init__(
+        self,
+        publish: Callable[[Message, Dict[str, str]], Awaitable[str]],
+        interval_secs: float = 1,
+        max_tokens: int = 10_000
+    ):
+        assert max_tokens > 0
+
+        self.publish = publish
+        self.interval_secs = interval_secs
+        self.max_tokens = max_tokens
+
+        self._pending: Dict[str, Tuple[Message, Dict[str, str]]] = {}
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+        # Keeps references to in-flight flush tasks, so they are not garbage
+        # collected before completion
+        self._flush_tasks: Set[asyncio.Task] = set()
+
+        self.received = 0
+        # Events replaced by a newer one of the same token before publishing
+        self.coalesced = 0
+        self.published = 0
+        self.failed = 0
+
+    def submit(self, token: str, message: Message, attributes: Dict[str, str]) -> None:
+        self.received += 1
+
+        if token in self._pending:
+            self.coalesced += 1
+
+        self._pending[token] = (message, attributes)
+
+        if len(self._pending) >= self.max_tokens:
+            self._flush()
+        elif self._flush_timer is None:
+            self._flush_timer = asyncio.get_running_loop().call_later(self.interval_secs, self._flush)
+
+    async def flush(self) -> None:
+        """Publishes pending events right away and waits for all in-flight ones"""
+        self._flush()
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+
+    def _flush(self) -> None:
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+
+        if not self._pending:
+            return
+
+        pending = self._pending
+        self._pending = {}
+
+        task = asyncio.ensure_future(self._publish_pending(pending))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _publish_pending(self, pending: Dict[str, Tuple[Message, Dict[str, str]]]) -> None:
+        # The publisher batches concurrent messages into Pub/Sub requests
+        results = await asyncio.gather(
+            *[self.publish(message, attributes) for message, attributes in pending.values()],
+            return_exceptions=True
+        )
+
+        failed = sum(1 for r in results if isinstance(r, BaseException) or not r)
+        self.published += len(results) - failed
+        self.failed += failed
+
+        if failed:
+            logger.warning(f"Coalesced events were not published: {failed} of {len(results)}")
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        return {
+            "received": self.received,
+            "coalesced": self.coalesced,
+            "published": self.published,
+            "failed": self.failed,
+            "pending": len(self._pending),
+            # Received events per published one
+            "coalescing_ratio": round(self.received / self.published, 2) if self.published else 0.0,
+        }
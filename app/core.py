@@ -1,243 +1,302 @@
 import json
-import time
+import re
 from datetime import datetime, timezone
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Tuple, Union
 
 from pydantic import BaseModel
 
-from common.helpers import convert_to_int
+from app.coalescer import EventCoalescer
+from common.cache import TTLCache
+from common.metrics import JSON_PARSE_SECONDS, MATCH_RENDER_SECONDS, PUBSUB_PUBLISH_SECONDS, STORAGE_READ_SECONDS
 from common.pubsub import PubSub
 from common.settings import Settings
-from events_processor.libs.firestore import FirestoreDb
+from events_processor.libs.codec import CONTENT_ENCODING_ATTRIBUTE, compress_message, project_event
+from events_processor.libs.firestore import GsiEvent, MatchTrends
+from events_processor.libs.stats import Match, build_match, render_match_snapshot
+from events_processor.libs.storage import get_async_storage_db
+from events_processor.libs.trends import TrendSeries, trends_report
 
 settings = Settings()
 
-TEAM_KEYS = {"team2": "radiant", "team3": "dire"}
+# Routing keys of a raw GSI event: auth.token and map.matchid (a string in GSI)
+TOKEN_PATTERN = re.compile(rb'"auth"\s*:\s*\{[^{}]*?"token"\s*:\s*"([^"\\]{1,128})"')
+MATCH_ID_PATTERN = re.compile(rb'"matchid"\s*:\s*"?(\d{1,20})')
 
-# TODO: check event_data.get("timestamp", 0) is UTC
+# Per-worker cache of the latest stored events by token
+gsi_events_cache = TTLCache(
+    ttl_secs=settings.stats_cache_ttl_secs,
+    max_size=settings.stats_cache_max_size
+)
 
-# See Player's the full list of features here https://snyk.io/advisor/npm-package/dotagsi
-FEATURES = [
-    "activity",
-    "assists",
-    "camps_stacked",
-    "consumable_gold_spent",
-    "deaths",
-    "denies",
-    "gold",
-    "gold_from_creep_kills",
-    "gold_from_hero_kills",
-    "gold_from_income",
-    "gold_from_shared",
-    "gold_lost_to_death",
-    "gold_reliable",
-    "gold_spent_on_buybacks",
-    "gold_unreliable",
-    "gpm",
-    "hero_damage",
-    "hero_healing",
-    "item_gold_spent",
-    "kill_streak",
-    "kills",
-    "last_hits",
-    "net_worth",
-    "runes_activated",
-    "support_gold_spent",
-    "tower_damage",
-    "wards_destroyed",
-    "wards_placed",
-    "wards_purchased",
-    "xpm",
-]
-
-
-class Player(BaseModel):
-    player_name: str = ""
-    # Actions per minute (such as moving units, issuing commands, or using abilities)
-    apm: int = 0
-    # Player"s slot in the event
-    slot: int = 0
-    # Player"s side: radiant or dire
-    side: str = ""
-    # Player's team name
-    team_name: str = ""
-    # Player's Steam ID is the full identifier. Steam uses it universally across all platforms
-    steam_id: int = 0
-    # Player's Account ID is a shorter version for Dota 2 platform
-    account_id: int = 0
-    # Key-Value feature
-    features: Dict[str, str] = {}
-    # Items
-    items: Dict[int, str] = {}
-    # Hero name
-    hero_name: str = ""
-    # Hero level from 1 to 30
-    hero_level: int = 0
-
-    def __init__(
-        self,
-        clock_time: int,
-        slot: int,
-        team_name: str,
-        player_data: Dict,
-        items_data: Dict,
-        hero_data: Dict,
-        *args,
-        **kwargs
-    ):
-        super().__init__(*args, **kwargs)
-
-        # Retrieve mandatory attributes of a player
-
-        # APM
-        _, commands_issued = convert_to_int(
-            player_data.get("commands_issued", "0"),
-            0
-        )
+# Trends are the same for all the spectators of a match
+match_trends_cache = TTLCache(
+    ttl_secs=settings.stats_cache_ttl_secs,
+    max_size=settings.stats_cache_max_size
+)
+
+
+class RegEventStatus(BaseModel):
+    registered: bool = False
+    reg_id: str = ""
 
-        if clock_time > 0:
-            self.apm = 60 * int(commands_issued / clock_time)
 
-        # Steam and Account IDs
-        _, self.steam_id = convert_to_int(
-            player_data.get("steamid", "0"),
-            0
+async def load_gsi_event(token: str) -> Optional[GsiEvent]:
+    with STORAGE_READ_SECONDS.labels(settings.gsi_events_collection_name).time():
+        return await get_async_storage_db(
+            backend=settings.storage_backend,
+            project_id=settings.google_project_id,
+            database_name=settings.firestore_database_name,
+            redis_url=settings.redis_url
+        ).query_document( # type: ignore[return-value]
+            document_id=token,
+            collection_name=settings.gsi_events_collection_name
         )
-        if self.steam_id > 0:
-            self.account_id = self.steam_id - 76561197960265728
 
-        # The rest attributes
-        self.player_name = player_data.get("name", "")
-        self.slot = slot
-        self.side = team_name
-        self.team_name = player_data.get("team_name", "")
 
-        # Retrieve non-mandatory features of a player
-        for f in FEATURES:
-            f_val = player_data.get(f) or ""
-            self.features[f] = str(f_val)
+async def query_gsi_event(token: str) -> Optional[GsiEvent]:
+    return await gsi_events_cache.get_or_load(token, lambda: load_gsi_event(token))
+
 
-        # Retrieve Items
-        for s in range(10):
-            slot_data = items_data.get(f"slot{s}")
+async def query_match_trends(match_id: int) -> Optional[MatchTrends]:
+    async def load() -> Optional[MatchTrends]:
+        with STORAGE_READ_SECONDS.labels(settings.match_trends_collection_name).time():
+            return await get_async_storage_db(
+                backend=settings.storage_backend,
+                project_id=settings.google_project_id,
+                database_name=settings.firestore_database_name,
+                redis_url=settings.redis_url
+            ).query_document( # type: ignore[return-value]
+                document_id=str(match_id),
+                collection_name=settings.match_trends_collection_name
+            )
 
-            item_name = ""
-            if isinstance(slot_data, dict):
-                item_name = slot_data.get("name", "")
+    return await match_trends_cache.get_or_load(match_id, load)
 
-            self.items[s] = item_name
 
-        # Retrieve Hero info
-        self.hero_name= hero_data.get("name", "")
-        _, self.hero_level = convert_to_int(hero_data.get("level", "0"), 0)
+async def refresh_gsi_event(token: str) -> Optional[GsiEvent]:
+    # Reading the stored event bypassing the cache, the cache gets the fresh
+    # one for the requests of the same token
+    gsi_event = await load_gsi_event(token)
+    gsi_events_cache.set(token, gsi_event)
 
+    return gsi_event
 
-class Match(BaseModel):
-    # model_config = ConfigDict(arbitrary_types_allowed=True)
 
-    match_id: int = -1
-    clock_time: str = "..."
-    win_team: str = ""
-    players: dict[str, Player] = {}
-    # How old is the provided match information is (in seconds). -1 means the
-    # age is unknown
-    event_age_seconds: int = -1
-    message: str = "We have not got any incoming events for your token yet"
+# TODO: check event_data.get("timestamp", 0) is UTC
+def event_age_seconds(gsi_event: GsiEvent) -> int:
+    if gsi_event.timestamp > 0:
+        utc = datetime.now(timezone.utc).timestamp()
+        # TODO: check if timestamp is UTC
+        return int(utc) - gsi_event.timestamp
 
+    return -1
 
-class RegEventStatus(BaseModel):
-    registered: bool = False
-    reg_id: str = ""
 
+def event_version(gsi_event: Optional[GsiEvent]) -> str:
+    """
+    Version of the stored event of a token, the same for the ETag, the
+    stream and the delta cursor. The pipeline replaces the stored event at
+    most once per window, the GSI timestamp and game time identify it
+    """
+    if not gsi_event:
+        return ""
 
-async def live_match_stat(token: str) -> Match:
-    match_data = Match()
+    return f"{gsi_event.timestamp}-{gsi_event.game_time}"
 
-    gsi_event = FirestoreDb( # type: ignore[attr-defined]
-        project_id=settings.google_project_id,
-        database_name=settings.firestore_database_name,
-    ).query_document(
-        document_id=token,
-        collection_name=settings.gsi_events_collection_name
+
+def event_etag(gsi_event: Optional[GsiEvent]) -> str:
+    # The ETag is weak since the event age in the stats still changes
+    version = event_version(gsi_event)
+
+    return f'W/"{version}"' if version else ""
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not (if_none_match and etag):
+        return False
+
+    if if_none_match.strip() == "*":
+        return True
+
+    # Weak comparison, as a client may send the tags with or without "W/"
+    opaque_tag = etag.removeprefix("W/")
+
+    return any(
+        tag.strip().removeprefix("W/") == opaque_tag
+        for tag in if_none_match.split(",")
     )
 
+
+def build_live_match(gsi_event: GsiEvent) -> Match:
+    # Building the stats from the raw GSI data. It's only needed for events
+    # stored without a pre-rendered snapshot
     try:
         event_match_data = json.loads(gsi_event.match_data)
     except ValueError:
         event_match_data = {}
 
     if not event_match_data.keys():
-        match_data.message = (
-            "Try again a bit later, we are almost ready to provide the stats for you"
+        return Match(
+            message="Try again a bit later, we are almost ready to provide the stats for you"
         )
-        return match_data
-
-    timestamp = gsi_event.timestamp
 
-    if timestamp > 0:
-        utc = datetime.now(timezone.utc).timestamp()
-        # TODO: check if timestamp is UTC
-        match_data.event_age_seconds = int(utc) - timestamp
-
-    clock_time = 0
-    # Ok, now we retrieve all the stats from the different sections of the event
-    map_data = event_match_data.get("map")
-
-    if isinstance(map_data, dict):
-        _, match_data.match_id = convert_to_int(map_data.get("matchid"), 0)
-        _, clock_time = convert_to_int(map_data.get("clock_time"),0)
-        match_data.win_team = map_data.get("win_team", "")
-
-    player = event_match_data.get("player")
-    items = event_match_data.get("items")
-    hero = event_match_data.get("hero")
-
-    if isinstance(player, dict):
-        for team_key, team_name in TEAM_KEYS.items():
-            player_data = player.get(team_key)
-            items_data = items.get(team_key, {}) if isinstance(items, dict) else {}
-            hero_data = hero.get(team_key, {}) if isinstance(hero, dict) else {}
-
-            if isinstance(player_data, dict):
-                # each event has 20 random slots for both teams cumulatively to
-                # store a player information
-                for slot in range(20):
-                    player_name = f"player{slot}"
-                    player_n = player_data.get(player_name)
-                    player_n_items = items_data.get(player_name) or {}
-                    player_n_hero = hero_data.get(player_name) or {}
-
-                    if isinstance(player_n, dict):
-                        match_data.players[player_name] = Player(
-                            clock_time=clock_time,
-                            slot=slot,
-                            team_name=team_name,
-                            player_data=player_n,
-                            items_data=player_n_items,
-                            hero_data=player_n_hero,
-                        )
-
-    mask = "%H:%M:%S" if clock_time >= 3600 else "%M:%S" # noqa: PLR2004
-    match_data.clock_time = time.strftime(mask, time.gmtime(clock_time))
-    match_data.message = ""
+    with MATCH_RENDER_SECONDS.labels("build").time():
+        match_data = build_match(event_match_data)
+    match_data.event_age_seconds = event_age_seconds(gsi_event)
 
     return match_data
 
 
-async def reg_dota2_event(event_data: Dict[str, Any]) -> RegEventStatus:
-    cleaned_data = json.dumps(event_data, ensure_ascii=True)
+def render_live_match(gsi_event: Optional[GsiEvent]) -> bytes:
+    """
+    Returns the JSON-serialized Match of the event. The events processor
+    stores it pre-rendered, so it's served without parsing the event
+    """
+    if not gsi_event:
+        return Match().model_dump_json().encode("utf-8")
+
+    if gsi_event.match_stats:
+        with MATCH_RENDER_SECONDS.labels("snapshot").time():
+            return render_match_snapshot(gsi_event.match_stats, event_age_seconds(gsi_event))
+
+    match_data = build_live_match(gsi_event)
+
+    with MATCH_RENDER_SECONDS.labels("serialize").time():
+        return match_data.model_dump_json().encode("utf-8")
+
+
+async def live_match_stat(token: str) -> bytes:
+    return render_live_match(await query_gsi_event(token))
 
+
+async def live_match_trends(token: str, points: int) -> Dict[str, Any]:
+    """
+    Returns the trends of the player features of the match the token is
+    watching, downsampled to the number of points
+    """
+    gsi_event = await query_gsi_event(token)
+    match_trends = await query_match_trends(gsi_event.match_id) if gsi_event else None
+
+    if not match_trends:
+        return {"match_id": -1, "clock_times": [], "players": {}}
+
+    return {
+        "match_id": match_trends.match_id,
+        **trends_report(TrendSeries.from_base64(match_trends.series), points)
+    }
+
+
+def get_pub_sub() -> PubSub.Client:
     # It's a singleton, so it's okay to call it an immense number of times
-    pub_sub = PubSub(
+    return PubSub(
         project_id=settings.google_project_id,
-        topic_name=settings.pubsub_topic_name
+        topic_name=settings.pubsub_topic_name,
+        batch_max_messages=settings.pubsub_batch_max_messages,
+        batch_max_bytes=settings.pubsub_batch_max_bytes,
+        batch_max_latency_ms=settings.pubsub_batch_max_latency_ms
     )
 
-    message_id = await pub_sub.publish_messages( # type: ignore[attr-defined]
-        message=cleaned_data,
-    )
+
+async def send_event(message: Union[str, bytes], attributes: Optional[Dict[str, str]] = None) -> str:
+    """
+    Publishes an event, projected and compressed as configured. It's done
+    right before publishing, so coalesced events are not processed in vain
+    """
+    if settings.ingest_projection and isinstance(message, bytes):
+        with JSON_PARSE_SECONDS.labels("project_event").time():
+            message = json.dumps(
+                project_event(json.loads(message)),
+                ensure_ascii=False,
+                separators=(",", ":")
+            ).encode("utf-8")
+
+    if settings.ingest_compression:
+        message = compress_message(
+            message if isinstance(message, bytes) else message.encode("utf-8"),
+            settings.ingest_compression
+        )
+        attributes = {**(attributes or {}), CONTENT_ENCODING_ATTRIBUTE: settings.ingest_compression}
+
+    with PUBSUB_PUBLISH_SECONDS.time():
+        return await get_pub_sub().publish_messages(
+            message=message,
+            attributes=attributes
+        )
+
+
+# Latest events of the tokens waiting to be published, when coalescing is on
+event_coalescer = EventCoalescer(
+    publish=send_event,
+    interval_secs=settings.ingest_coalesce_interval_ms / 1000,
+    max_tokens=settings.ingest_coalesce_max_tokens
+)
+
+
+async def publish_event(
+    token: str,
+    message: Union[str, bytes],
+    attributes: Optional[Dict[str, str]] = None
+) -> RegEventStatus:
+    if token and settings.ingest_coalesce_interval_ms > 0:
+        event_coalescer.submit(token, message, attributes or {})
+        # Acknowledged at once, the message ID is not known yet
+        return RegEventStatus(registered=True)
+
+    message_id = await send_event(message, attributes)
 
     return RegEventStatus(
         registered=bool(message_id),
         reg_id=message_id
     )
+
+
+async def reg_dota2_event(event_data: Dict[str, Any]) -> RegEventStatus:
+    if settings.ingest_projection and isinstance(event_data, dict):
+        event_data = project_event(event_data)
+
+    with JSON_PARSE_SECONDS.labels("dump_event").time():
+        cleaned_data = json.dumps(event_data, ensure_ascii=True)
+
+    auth = event_data.get("auth") if isinstance(event_data, dict) else None
+    token = auth.get("token", "") if isinstance(auth, dict) else ""
+
+    return await publish_event(str(token), cleaned_data)
+
+
+def extract_routing_keys(body: bytes) -> Tuple[str, str]:
+    """
+    Returns the token and the match ID of a raw GSI event without parsing it.
+    Raises ValueError if the body is not a JSON object with a token
+    """
+    # Only the ends are stripped, copying the whole body is not needed
+    if not (body[:64].lstrip().startswith(b"{") and body[-64:].rstrip().endswith(b"}")):
+        raise ValueError("GSI event must be a JSON object")
+
+    # The keys are found with a fast substring search first, Dota 2 sends the
+    # auth section at the end of the event
+    token_match = TOKEN_PATTERN.search(body, max(0, body.rfind(b'"auth"'))) or TOKEN_PATTERN.search(body)
+
+    if not token_match:
+        raise ValueError("GSI event has no auth token")
+
+    match_id_match = MATCH_ID_PATTERN.search(body, max(0, body.find(b'"matchid"')))
+
+    return (
+        token_match.group(1).decode("utf-8", errors="replace"),
+        match_id_match.group(1).decode("ascii") if match_id_match else ""
+    )
+
+
+async def reg_dota2_raw_event(body: bytes) -> RegEventStatus:
+    """
+    Publishes the GSI event as it was received. The events processor decodes
+    it anyway, so only the routing keys are extracted for the attributes
+    """
+    with JSON_PARSE_SECONDS.labels("extract_routing_keys").time():
+        token, match_id = extract_routing_keys(body)
+
+    attributes = {"token": token}
+    if match_id:
+        attributes["match_id"] = match_id
+
+    return await publish_event(token, body, attributes)
@@ -0,0 +1,117 @@
+import json
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from app import core
+from common.cache import TTLCache
+from common.settings import Settings
+from events_processor.libs.firestore import GsiEvent
+
+settings = Settings()
+
+# Recent snapshots of the tokens to diff the stats against
+snapshot_rings = TTLCache(
+    ttl_secs=settings.stats_delta_ring_ttl_secs,
+    max_size=settings.stats_cache_max_size
+)
+
+
+class SnapshotRing:
+    """
+    The last few versions of the stats of a token, by the version of the
+    stored event (see core.event_version)
+    """
+    def __init__(self, size: int):
+        self._snapshots: Deque[Tuple[str, Dict[str, Any]]] = deque(maxlen=size)
+
+    def get(self, version: str) -> Optional[Dict[str, Any]]:
+        for snapshot_version, snapshot in self._snapshots:
+            if snapshot_version == version:
+                return snapshot
+
+        return None
+
+    def add(self, version: str, snapshot: Dict[str, Any]) -> None:
+        if self.get(version) is None:
+            self._snapshots.append((version, snapshot))
+
+
+def diff_fields(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    # Nested dicts (features, items) are diffed by their keys as well
+    delta = {}
+
+    for key, value in new.items():
+        old_value = old.get(key)
+
+        if isinstance(value, dict) and isinstance(old_value, dict):
+            nested = {k: v for k, v in value.items() if old_value.get(k) != v}
+            if nested:
+                delta[key] = nested
+        elif old_value != value:
+            delta[key] = value
+
+    return delta
+
+
+def diff_match(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Returns the fields of the Match changed from the old to the new one: the
+    top-level ones, the changed fields of every player (new players in full)
+    and the names of the players gone
+    """
+    old_players = old.get("players", {})
+    new_players = new.get("players", {})
+
+    delta = {k: v for k, v in new.items() if k != "players" and old.get(k) != v}
+    delta["players"] = {}
+
+    for name, player in new_players.items():
+        if name not in old_players:
+            delta["players"][name] = player
+        elif changed := diff_fields(old_players[name], player):
+            delta["players"][name] = changed
+
+    removed_players = [name for name in old_players if name not in new_players]
+    if removed_players:
+        delta["removed_players"] = removed_players
+
+    return delta
+
+
+def live_match_delta(gsi_event: Optional[GsiEvent], since: str) -> Tuple[bytes, bool]:
+    """
+    Returns the stats of the event changed since the version and whether it's
+    a delta. The full stats are returned (a resync) if the version is not
+    among the recent ones of this worker
+    """
+    if not gsi_event:
+        return core.render_live_match(gsi_event), False
+
+    token = gsi_event.token
+    version = core.event_version(gsi_event)
+    stats: Optional[bytes] = None
+
+    ring = snapshot_rings.get(token)
+    if ring is None:
+        ring = SnapshotRing(settings.stats_delta_ring_size)
+    # Set on every access, so the ring of a polled token doesn't expire and
+    # only the rings of tokens nobody asks for are dropped
+    snapshot_rings.set(token, ring)
+
+    # A version is parsed once, the requests of the other viewers diff the
+    # stored snapshot
+    snapshot = ring.get(version)
+    if snapshot is None:
+        stats = core.render_live_match(gsi_event)
+        snapshot = json.loads(stats)
+        # The age is sent in every response as it changes each second
+        snapshot.pop("event_age_seconds", None)
+        ring.add(version, snapshot)
+
+    base = ring.get(since)
+    if base is None:
+        return stats or core.render_live_match(gsi_event), False
+
+    delta = {"event_age_seconds": core.event_age_seconds(gsi_event), **diff_match(base, snapshot)}
+
+    return json.dumps(delta, separators=(",", ":")).encode("utf-8"), True
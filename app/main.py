@@ -1,13 +1,26 @@
 import json
-from typing import Dict
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
 
-from fastapi import FastAPI, HTTPException, Query, Request, status
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 
-from app import core
+from app import core, deltas, streaming
 from common.helpers import get_version_from_pyproject, jsonify
+from common.metrics import JSON_PARSE_SECONDS, register_stats, render_metrics
 from common.settings import Settings
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Coalesced and batched events are published before the worker stops
+    await core.event_coalescer.flush()
+    await core.get_pub_sub().flush()
+
+
 app = FastAPI(
+    lifespan=lifespan,
     docs_url="/dota2-gsi/docs",
     openapi_url="/dota2-gsi/openapi.json",
     redoc_url=None
@@ -31,29 +44,151 @@ async def version() -> Dict[str, str]:
 async def health_check() -> Dict[str, str]:
     return jsonify({"status": "healthy"})
 
+async def read_body(request: Request, max_bytes: int) -> bytes:
+    # The body is read by chunks, so a too large one is rejected early
+    body = bytearray()
+
+    async for chunk in request.stream():
+        body += chunk
+
+        if len(body) > max_bytes:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                detail="The event is too large")
+
+    return bytes(body)
+
+# The stats are read at scrape time, so the current singletons are exported
+register_stats(
+    "dota2_ingest_coalescer", "Events coalesced by the worker", lambda: core.event_coalescer.stats()
+)
+register_stats(
+    "dota2_gsi_events_cache", "Cache of the stored events by token", lambda: core.gsi_events_cache.stats()
+)
+register_stats(
+    "dota2_match_trends_cache", "Cache of the match trends", lambda: core.match_trends_cache.stats()
+)
+register_stats(
+    "dota2_live_match_streams", "Live match streams of the worker", lambda: streaming.live_match_streams.stats()
+)
+
+@app.get("/dota2-gsi/metrics")
+async def metrics() -> Response:
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+@app.get("/dota2-gsi/ingest/stats")
+async def ingest_stats() -> Dict[str, float]:
+    # Counters of the events coalesced by this worker
+    return core.event_coalescer.stats()
+
 @app.post("/dota2-gsi/dota2-event")
 async def reg_dota2_event(request: Request) -> core.RegEventStatus:
+    body = await read_body(request, settings.ingest_max_body_bytes)
+
     try:
-        event_data = await request.json()
+        if settings.ingest_raw_events:
+            return await core.reg_dota2_raw_event(body)
+
+        with JSON_PARSE_SECONDS.labels("parse_event").time():
+            event_data = json.loads(body)
         return await core.reg_dota2_event(event_data)
-    except json.JSONDecodeError:
+    except ValueError:
+        # json.JSONDecodeError is a ValueError as well
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail="Invalid JSON format")
     except Exception:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail="An error occurred while processing the event")
 
-@app.get("/dota2-gsi/live-match/stats")
+@app.get("/dota2-gsi/live-match/stats", response_model=core.Match)
 async def live_match_stats(
     token: str = Query(
         default="",
         description="Provide your personal spectator's token",
         pattern="^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
     ),
-) -> core.Match:
+    since: Optional[str] = Query(
+        default=None,
+        description="Version of the stats the client has (the X-Stats-Version "
+                    "header of the previous response) to get only the changes"
+    ),
+    if_none_match: str = Header(default=""),
+) -> Response:
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Token is required and cannot be empty"
+        )
+
+    gsi_event = await core.query_gsi_event(token)
+    etag = core.event_etag(gsi_event)
+    headers = {}
+
+    if gsi_event:
+        # Clients have to revalidate, the stats are live
+        headers = {
+            "ETag": etag,
+            "Cache-Control": "no-cache",
+            "X-Stats-Version": core.event_version(gsi_event)
+        }
+
+    # The stored event is the same as the client has, so the stats aren't
+    # rendered at all
+    if core.etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if since is not None:
+        content, is_delta = deltas.live_match_delta(gsi_event, since)
+        headers["X-Stats-Delta"] = str(is_delta).lower()
+    else:
+        content = core.render_live_match(gsi_event)
+
+    return Response(
+        content=content,
+        media_type="application/json",
+        headers=headers
+    )
+
+@app.get("/dota2-gsi/live-match/stream")
+async def live_match_stream(
+    token: str = Query(
+        default="",
+        description="Provide your personal spectator's token",
+        pattern="^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+    ),
+) -> StreamingResponse:
+    """
+    Server-Sent Events stream of the live match stats: a new Match is sent
+    each time the stored event of the token changes
+    """
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Token is required and cannot be empty"
+        )
+    return StreamingResponse(
+        streaming.sse_events(token),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/dota2-gsi/live-match/trends")
+async def live_match_trends(
+    token: str = Query(
+        default="",
+        description="Provide your personal spectator's token",
+        pattern="^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+    ),
+    points: int = Query(
+        default=60,
+        ge=2,
+        le=720,
+        description="Number of points of the series, they are evenly spaced over the match"
+    ),
+) -> Dict:
     if not token:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Token is required and cannot be empty"
         )
-    return await core.live_match_stat(token)
+    return await core.live_match_trends(token, points)
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Set
+
+from app import core
+from common.settings import Settings
+from events_processor.libs.firestore import GsiEvent
+
+settings = Settings()
+logger = logging.getLogger(__name__)
+
+
+class LiveMatchStreams:
+    """
+    Fan-out of the live match stats to the stream subscribers
+
+    All subscribers of a token on the worker share one poller of the stored
+    event, so the storage reads scale with the number of distinct tokens, not
+    the number of connected viewers. A new payload is pushed only when the
+    stored event changes
+    """
+    def __init__(
+        self,
+        load: Callable[[str], Awaitable[Optional[GsiEvent]]],
+        render: Callable[[Optional[GsiEvent]], bytes],
+        poll_interval_secs: float = 1
+    ):
+        self.load = load
+        self.render = render
+        self.poll_interval_secs = poll_interval_secs
+
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._pollers: Dict[str, asyncio.Task] = {}
+        # The last pushed payload of a token, sent to the new subscribers at once
+        self._latest: Dict[str, bytes] = {}
+
+        self.reads = 0
+        self.pushes = 0
+
+    def subscribers(self, token: str) -> int:
+        return len(self._subscribers.get(token, ()))
+
+    def pollers(self) -> int:
+        return len(self._pollers)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pollers": self.pollers(),
+            "subscribers": sum(len(queues) for queues in self._subscribers.values()),
+            "reads": self.reads,
+            "pushes": self.pushes,
+        }
+
+    async def subscribe(self, token: str, timeout: Optional[float] = None) -> AsyncIterator[Optional[bytes]]:
+        """
+        Yields the Match payloads of the token as they change. None is yielded
+        if nothing has changed within the timeout
+        """
+        # Only the newest payload matters, a slow subscriber skips the older ones
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self._subscribers.setdefault(token, set()).add(queue)
+
+        if token in self._latest:
+            queue.put_nowait(self._latest[token])
+
+        if token not in self._pollers:
+            self._pollers[token] = asyncio.ensure_future(self._poll(token))
+
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self._unsubscribe(token, queue)
+
+    def _unsubscribe(self, token: str, queue: asyncio.Queue) -> None:
+        subscribers = self._subscribers.get(token)
+
+        if subscribers is None:
+            return
+
+        subscribers.discard(queue)
+
+        if not subscribers:
+            del self._subscribers[token]
+            self._latest.pop(token, None)
+            self._pollers.pop(token).cancel()
+
+    def _push(self, token: str, payload: bytes) -> None:
+        self._latest[token] = payload
+        self.pushes += 1
+
+        for queue in self._subscribers.get(token, ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(payload)
+
+    async def _poll(self, token: str) -> None:
+        version = ""
+        first = True
+
+        while True:
+            try:
+                gsi_event = await self.load(token)
+                self.reads += 1
+
+                if first or core.event_version(gsi_event) != version:
+                    first = False
+                    version = core.event_version(gsi_event)
+                    self._push(token, self.render(gsi_event))
+            except Exception as ex:
+                logger.warning(f"Live match stream poller of a token failed: {repr(ex)}")
+
+            await asyncio.sleep(self.poll_interval_secs)
+
+
+# One per worker, shared by all the stream connections
+live_match_streams = LiveMatchStreams(
+    load=core.refresh_gsi_event,
+    render=core.render_live_match,
+    poll_interval_secs=settings.stream_poll_interval_secs
+)
+
+
+async def sse_events(token: str, streams: LiveMatchStreams = live_match_streams) -> AsyncIterator[bytes]:
+    # Server-Sent Events: one "data" line per Match payload and comments to
+    # keep idle connections open behind proxies
+    async for payload in streams.subscribe(token, timeout=settings.stream_keepalive_secs):
+        if payload is None:
+            yield b": keep-alive\n\n"
+        else:
+            yield b"data: " + payload + b"\n\n"
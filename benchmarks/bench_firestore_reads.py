@@ -0,0 +1,140 @@
+"""
+Latency of concurrent stored-event reads inside the event loop: the blocking
+FirestoreDb vs the AsyncFirestoreDb. Firestore is replaced with a local fake
+that answers after a fixed network delay.
+
+Run from the repository root:
+    PYTHONPATH=. python benchmarks/bench_firestore_reads.py
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from unittest import mock
+
+from events_processor.libs import firestore as fs
+
+
+class FakeSnapshot:
+    exists = True
+
+    def __init__(self, document_id: str):
+        self.document_id = document_id
+
+    def to_dict(self):
+        return {"token": self.document_id, "match_id": 1, "match_data": "{}"}
+
+
+class FakeDocumentRef:
+    def __init__(self, document_id: str, delay: float):
+        self.document_id = document_id
+        self.delay = delay
+
+    def get(self):
+        time.sleep(self.delay)
+        return FakeSnapshot(self.document_id)
+
+
+class FakeAsyncDocumentRef(FakeDocumentRef):
+    async def get(self): # type: ignore[override]
+        await asyncio.sleep(self.delay)
+        return FakeSnapshot(self.document_id)
+
+
+class FakeClient:
+    document_ref_class = FakeDocumentRef
+    delay = 0.0
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def collection(self, name: str):
+        return self
+
+    def document(self, document_id: str):
+        return self.document_ref_class(document_id, self.delay)
+
+
+class FakeAsyncClient(FakeClient):
+    document_ref_class = FakeAsyncDocumentRef
+
+
+async def measure(read, concurrency: int, requests: int):
+    latencies = []
+    max_lag = 0.0
+    running = True
+
+    # Heartbeat shows how long the event loop can't serve anything else
+    async def heartbeat(interval: float = 0.001):
+        nonlocal max_lag
+        while running:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            max_lag = max(max_lag, time.perf_counter() - started - interval)
+
+    async def handler(i: int):
+        started = time.perf_counter()
+        await read(f"token-{i}")
+        latencies.append(time.perf_counter() - started)
+
+    heartbeat_task = asyncio.ensure_future(heartbeat())
+    await asyncio.sleep(0)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(i: int):
+        async with semaphore:
+            await handler(i)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[limited(i) for i in range(requests)])
+    elapsed = time.perf_counter() - started
+
+    running = False
+    await heartbeat_task
+
+    latencies.sort()
+    return {
+        "rps": requests / elapsed,
+        "p50_ms": 1000 * statistics.median(latencies),
+        "p99_ms": 1000 * latencies[int(0.99 * (len(latencies) - 1))],
+        "max_loop_lag_ms": 1000 * max_lag,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--delay_ms", type=float, default=5, help="Simulated Firestore round trip")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    FakeClient.delay = args.delay_ms / 1000
+
+    with (
+        mock.patch.object(fs.firestore, "Client", FakeClient),
+        mock.patch.object(fs.firestore, "AsyncClient", FakeAsyncClient)
+    ):
+        sync_db = fs.FirestoreDb.Client(project_id="bench", database_name="bench")
+        async_db = fs.AsyncFirestoreDb.Client(project_id="bench", database_name="bench")
+
+    async def sync_read(token: str):
+        return sync_db.query_document(document_id=token, collection_name="gsi-events")
+
+    async def async_read(token: str):
+        return await async_db.query_document(document_id=token, collection_name="gsi-events")
+
+    print(
+        f"{args.requests} reads, concurrency {args.concurrency}, "
+        f"simulated round trip {args.delay_ms} ms"
+    )
+    for name, read in (("FirestoreDb (blocking)", sync_read), ("AsyncFirestoreDb", async_read)):
+        res = asyncio.run(measure(read, args.concurrency, args.requests))
+        print(
+            f"{name:<24} {res['rps']:>9.0f} req/s   p50 {res['p50_ms']:>8.2f} ms   "
+            f"p99 {res['p99_ms']:>8.2f} ms   max loop lag {res['max_loop_lag_ms']:>8.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+CPU cost per ingested GSI event before publishing: parsing the body and
+dumping it again vs the raw ingest extracting only the routing keys.
+
+Run from the repository root:
+    PYTHONPATH=. python benchmarks/bench_ingest.py
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+from app.core import extract_routing_keys
+
+DATA_PATH = Path(__file__).parent.parent / "tests" / "data" / "gsi_event.json"
+
+
+def parsed_ingest(body: bytes):
+    # request.json() and json.dumps in reg_dota2_event
+    return json.dumps(json.loads(body), ensure_ascii=True)
+
+
+def raw_ingest(body: bytes):
+    return extract_routing_keys(body)
+
+
+def cpu_per_event(func, body: bytes, n: int) -> float:
+    started = time.process_time()
+    for _ in range(n):
+        func(body)
+    return (time.process_time() - started) / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=2000)
+    args = parser.parse_args()
+
+    with open(DATA_PATH, "rb") as f:
+        body = f.read()
+
+    parsed_cpu = cpu_per_event(parsed_ingest, body, args.events)
+    raw_cpu = cpu_per_event(raw_ingest, body, args.events)
+
+    print(f"Event of {len(body) / 1024:.1f} KiB, {args.events} events")
+    print(f"json.loads + json.dumps  {1e6 * parsed_cpu:>8.1f} us CPU/event")
+    print(f"Routing keys only        {1e6 * raw_cpu:>8.1f} us CPU/event")
+    print(f"Speedup: x{parsed_cpu / raw_cpu:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Cost of building and serializing the live match stats: Player assigning its
+attributes one by one in an overridden __init__ vs Player.from_event
+validating them in one pass. The JSON of both is checked to be the same
+byte for byte.
+
+Requests per second are of one worker serving the stats of events stored
+without a pre-rendered snapshot, the storage read is not included.
+
+Run from the repository root:
+    PYTHONPATH=. python benchmarks/bench_match_build.py
+"""
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Dict
+from unittest import mock
+
+from app import core
+from events_processor.libs import stats
+from events_processor.libs.firestore import GsiEvent
+from events_processor.libs.helpers import convert_to_int
+
+DATA_PATH = Path(__file__).parent.parent / "tests" / "data" / "gsi_event.json"
+
+
+class LegacyPlayer(stats.Player):
+    # The construction Player had before from_event
+    def __init__(
+        self,
+        clock_time: int,
+        slot: int,
+        team_name: str,
+        player_data: Dict,
+        items_data: Dict,
+        hero_data: Dict,
+        *args,
+        **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+
+        _, commands_issued = convert_to_int(player_data.get("commands_issued", "0"), 0)
+
+        if clock_time > 0:
+            self.apm = 60 * int(commands_issued / clock_time)
+
+        _, self.steam_id = convert_to_int(player_data.get("steamid", "0"), 0)
+        if self.steam_id > 0:
+            self.account_id = self.steam_id - 76561197960265728
+
+        self.player_name = player_data.get("name", "")
+        self.slot = slot
+        self.side = team_name
+        self.team_name = player_data.get("team_name", "")
+
+        for f in stats.FEATURES:
+            f_val = player_data.get(f) or ""
+            self.features[f] = str(f_val)
+
+        for s in range(10):
+            slot_data = items_data.get(f"slot{s}")
+
+            item_name = ""
+            if isinstance(slot_data, dict):
+                item_name = slot_data.get("name", "")
+
+            self.items[s] = item_name
+
+        self.hero_name = hero_data.get("name", "")
+        _, self.hero_level = convert_to_int(hero_data.get("level", "0"), 0)
+
+    @classmethod
+    def from_event(cls, **kwargs): # type: ignore[override]
+        return cls(**kwargs)
+
+
+def make_events(n: int):
+    with open(DATA_PATH) as f:
+        event_data = json.load(f)
+
+    events = []
+    for i in range(n):
+        event_data["map"]["clock_time"] += 1
+        for team in ("team2", "team3"):
+            for player in event_data["player"][team].values():
+                player["gpm"] += 1
+        events.append(GsiEvent(token=f"token-{i}", timestamp=1732101234 + i, match_data=json.dumps(event_data)))
+
+    return events
+
+
+def requests_per_sec(events, repeat: int) -> float:
+    async def serve():
+        for _ in range(repeat):
+            for gsi_event in events:
+                with mock.patch.object(core, "query_gsi_event", mock.AsyncMock(return_value=gsi_event)):
+                    await core.live_match_stat(gsi_event.token)
+
+    started = time.perf_counter()
+    asyncio.run(serve())
+    return repeat * len(events) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    events = make_events(args.events)
+    event_dicts = [json.loads(e.match_data) for e in events]
+
+    with mock.patch.object(stats, "Player", LegacyPlayer):
+        legacy = [stats.build_match(d).model_dump_json() for d in event_dicts]
+        legacy_build = min(
+            timed(lambda: [stats.build_match(d) for d in event_dicts]) for _ in range(args.repeat)
+        )
+        legacy_rps = requests_per_sec(events, args.repeat)
+
+    current = [stats.build_match(d).model_dump_json() for d in event_dicts]
+    assert current == legacy, "The JSON of the stats differs"
+
+    current_build = min(
+        timed(lambda: [stats.build_match(d) for d in event_dicts]) for _ in range(args.repeat)
+    )
+    current_rps = requests_per_sec(events, args.repeat)
+
+    print(f"{args.events} events, identical JSON of {len(current[0]) / 1024:.1f} KiB")
+    print(f"{'':<26} {'build_match':>14} {'requests/s':>12}")
+    for name, build, rps in (
+        ("Player.__init__ (before)", legacy_build, legacy_rps),
+        ("Player.from_event", current_build, current_rps),
+    ):
+        print(f"{name:<26} {1e6 * build / args.events:>11.1f} us {rps:>12.0f}")
+    print(f"Speedup: x{legacy_build / current_build:.2f} build, x{current_rps / legacy_rps:.2f} requests/s")
+
+
+def timed(func) -> float:
+    started = time.perf_counter()
+    func()
+    return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    main()
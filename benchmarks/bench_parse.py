@@ -0,0 +1,76 @@
+"""
+Throughput of the Parse DoFn decoding: charset detection on every message vs
+the strict UTF-8 fast path with orjson. Messages are GSI events of the test
+data published the same way as the ingest API does it.
+
+Run from the repository root:
+    PYTHONPATH=.:events_processor python benchmarks/bench_parse.py
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import chardet
+from dataflow_job import Parse  # type: ignore[import-not-found]
+
+DATA_PATH = Path(__file__).parent.parent / "tests" / "data" / "gsi_event.json"
+
+
+def make_messages(n: int):
+    with open(DATA_PATH) as f:
+        event_data = json.load(f)
+
+    messages = []
+    for i in range(n):
+        event_data["auth"]["token"] = f"00000000-0000-4000-8000-{i:012d}"
+        event_data["provider"]["timestamp"] += 1
+        messages.append(json.dumps(event_data, ensure_ascii=True).encode("utf-8"))
+
+    return messages
+
+
+def decode_with_chardet(message: bytes):
+    encoding = chardet.detect(message)["encoding"]
+    match_data = message.decode(encoding) # type: ignore[arg-type]
+    return json.loads(match_data)
+
+
+def decode_fast_path(message: bytes):
+    from libs.codec import decode_message, json_loads  # type: ignore[import-not-found]
+
+    return json_loads(decode_message(message))
+
+
+def rate(func, messages, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            func(message)
+    return repeat * len(messages) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages)
+    parse = Parse()
+
+    print(f"{args.messages} messages of {len(messages[0]) / 1024:.1f} KiB")
+    results = {
+        "chardet + json": rate(decode_with_chardet, messages, args.repeat),
+        "utf-8 + orjson": rate(decode_fast_path, messages, args.repeat),
+        "Parse.process": rate(lambda m: list(parse.process(m)), messages, args.repeat),
+    }
+    for name, msg_per_sec in results.items():
+        print(f"{name:<16} {msg_per_sec:>10.0f} msg/s")
+
+    speedup = results["utf-8 + orjson"] / results["chardet + json"]
+    print(f"Decoding speedup: x{speedup:.0f}")
+
+
+if __name__ == "__main__":
+    main()
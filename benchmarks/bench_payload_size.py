@@ -0,0 +1,62 @@
+"""
+Size of the published GSI events and the CPU cost at ingest: the raw event
+vs the projection on the sections read downstream, with and without gzip
+or zstd compression.
+
+The backlog has no recorded GSI events, so the test event is used.
+
+Run from the repository root:
+    PYTHONPATH=. python benchmarks/bench_payload_size.py
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+from events_processor.libs.codec import compress_message, decompress_message, project_event
+
+DATA_PATH = Path(__file__).parent.parent / "tests" / "data" / "gsi_event.json"
+
+
+def projected(body: bytes) -> bytes:
+    return json.dumps(project_event(json.loads(body)), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def cpu_per_event(func, n: int) -> float:
+    started = time.process_time()
+    for _ in range(n):
+        func()
+    return (time.process_time() - started) / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=200)
+    args = parser.parse_args()
+
+    with open(DATA_PATH, "rb") as f:
+        # As Dota 2 sends it, without the indentation of the test file
+        body = json.dumps(json.load(f)).encode("utf-8")
+
+    variants = {
+        "raw": lambda: body,
+        "projected": lambda: projected(body),
+        "raw + gzip": lambda: compress_message(body, "gzip"),
+        "raw + zstd": lambda: compress_message(body, "zstd"),
+        "projected + gzip": lambda: compress_message(projected(body), "gzip"),
+        "projected + zstd": lambda: compress_message(projected(body), "zstd"),
+    }
+
+    print(f"{'':<18} {'bytes':>8} {'of raw':>7} {'ingest CPU':>12}")
+    for name, func in variants.items():
+        size = len(func())
+        cpu = cpu_per_event(func, args.events)
+        print(f"{name:<18} {size:>8} {size / len(body):>7.0%} {1e6 * cpu:>9.0f} us")
+
+    compressed = compress_message(projected(body), "zstd")
+    cpu = cpu_per_event(lambda: decompress_message(compressed, "zstd"), args.events)
+    print(f"Decompression of projected + zstd in Parse: {1e6 * cpu:.0f} us")
+
+
+if __name__ == "__main__":
+    main()
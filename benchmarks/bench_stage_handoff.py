@@ -0,0 +1,67 @@
+"""
+CPU cost per event of handing GsiEvent over between the pipeline stages
+(Parse -> MatchIDSplit -> EnrichWrite): JSON dumps with two re-validations
+vs GsiEventCoder rows.
+
+Run from the repository root:
+    PYTHONPATH=.:events_processor python benchmarks/bench_stage_handoff.py
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+from libs.coders import GsiEventCoder  # type: ignore[import-not-found]
+from libs.firestore import GsiEvent  # type: ignore[import-not-found]
+
+DATA_PATH = Path(__file__).parent.parent / "tests" / "data" / "gsi_event.json"
+
+
+def json_handoff(gsi_event):
+    # Parse dumps the event, MatchIDSplit and EnrichWrite validate it again
+    gsi_event_json = gsi_event.model_dump_json()
+    GsiEvent.model_validate_json(gsi_event_json)
+    return GsiEvent.model_validate_json(gsi_event_json)
+
+
+def coder_handoff(gsi_event, coder=GsiEventCoder()):
+    # Parse -> MatchIDSplit and the shuffle before EnrichWrite
+    return coder.decode(coder.encode(coder.decode(coder.encode(gsi_event))))
+
+
+def cpu_per_event(func, gsi_event, n: int) -> float:
+    started = time.process_time()
+    for _ in range(n):
+        func(gsi_event)
+    return (time.process_time() - started) / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=2000)
+    args = parser.parse_args()
+
+    with open(DATA_PATH) as f:
+        match_data = json.dumps(json.load(f))
+
+    gsi_event = GsiEvent(
+        token="0b4c7f5e-2d1a-4f3b-9c8e-6a5d4c3b2a10",
+        match_id=8036203164,
+        timestamp=1732101234,
+        clock_time=2285,
+        game_time=2380,
+        match_data=match_data
+    )
+    assert json_handoff(gsi_event) == coder_handoff(gsi_event) == gsi_event
+
+    json_cpu = cpu_per_event(json_handoff, gsi_event, args.events)
+    coder_cpu = cpu_per_event(coder_handoff, gsi_event, args.events)
+
+    print(f"Event of {len(match_data) / 1024:.1f} KiB, {args.events} events")
+    print(f"JSON + validation  {1e6 * json_cpu:>8.1f} us CPU/event")
+    print(f"GsiEventCoder      {1e6 * coder_cpu:>8.1f} us CPU/event")
+    print(f"Saved              {1e6 * (json_cpu - coder_cpu):>8.1f} us CPU/event")
+
+
+if __name__ == "__main__":
+    main()
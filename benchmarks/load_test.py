@@ -0,0 +1,242 @@
+"""
+End-to-end load test of ingest -> events processor -> live match stats,
+with no GCP: Pub/Sub is replaced by an in-memory queue and the storage by
+the "memory" backend.
+
+GSI events are replayed through the FastAPI ingest endpoint, the queued
+messages go through the Beam pipeline (build_pipeline on the DirectRunner)
+and the stats of every token are read from /live-match/stats. Events are
+either recorded ones (--events_file, a JSON event per line) or variants of
+the test event, scaled to --tokens spectators of --matches matches.
+
+The stages run one after another, so the freshness includes the replay
+time of all the events and is only comparable between runs of the same
+size.
+
+Run from the repository root:
+    PYTHONPATH=. python benchmarks/load_test.py --tokens 100 --matches 10 --events_per_token 20
+"""
+import argparse
+import copy
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import apache_beam as beam
+from apache_beam.io.gcp.pubsub import PubsubMessage
+from apache_beam.options.pipeline_options import PipelineOptions
+from fastapi.testclient import TestClient
+
+from app import core
+from app.main import app
+from events_processor.libs import memory_db
+from events_processor.libs.firestore import LiveMatches, LiveMatchInfo
+
+# The events processor imports "libs" as a top-level package, the pipeline
+# must use the same in-memory storage as the API
+sys.path.append(str(Path(__file__).parent.parent / "events_processor"))
+sys.modules["libs.memory_db"] = memory_db
+
+from dataflow_job import build_pipeline  # type: ignore[import-not-found]  # noqa: E402
+
+DATA_PATH = Path(__file__).parent.parent / "tests" / "data" / "gsi_event.json"
+STATS_URL = "/dota2-gsi/live-match/stats"
+
+
+class InMemoryPubSub:
+    """Stand-in for the Pub/Sub client of the API, keeping the published messages"""
+    def __init__(self):
+        self.messages: List[PubsubMessage] = []
+
+    async def publish_messages(self, message, attributes: Optional[Dict[str, str]] = None) -> str:
+        data = message.encode("utf-8") if isinstance(message, str) else message
+        self.messages.append(PubsubMessage(data, attributes))
+        return str(len(self.messages))
+
+    async def flush(self) -> None:
+        pass
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def load_events(events_file: Optional[str]) -> List[Dict[str, Any]]:
+    if not events_file:
+        with open(DATA_PATH) as f:
+            return [json.load(f)]
+
+    with open(events_file) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def scale_events(
+    base_events: List[Dict[str, Any]],
+    tokens: int,
+    matches: int,
+    events_per_token: int
+) -> List[Tuple[str, int, bytes]]:
+    """
+    Events of every token, interleaved like spectators sending at the same
+    time: (token, timestamp, body). The timestamp tells the events of a token
+    apart, the clock and the gold grow every round
+    """
+    events = []
+    started_at = int(time.time()) - events_per_token
+
+    for r in range(events_per_token):
+        base = base_events[r % len(base_events)]
+        base_match_id = int(base["map"]["matchid"])
+
+        for t in range(tokens):
+            event = copy.deepcopy(base)
+            # Tokens are UUIDs like the ones of Dota 2 spectators
+            token = f"00000000-0000-4000-8000-{t:012d}"
+            event["auth"]["token"] = token
+            event["map"]["matchid"] = str(base_match_id + t % matches)
+            event["map"]["clock_time"] += r
+            event["map"]["game_time"] += r
+            event["provider"]["timestamp"] = started_at + r
+
+            for team in event.get("player", {}).values():
+                for player in team.values():
+                    player["gold"] = player.get("gold", 0) + 10 * r
+                    player["net_worth"] = player.get("net_worth", 0) + 10 * r
+
+            events.append((token, started_at + r, json.dumps(event).encode("utf-8")))
+
+    return events
+
+
+def report(stage: str, count: int, secs: float, latencies: List[float], unit: str = "events"):
+    print(
+        f"{stage:<10} {count:>8} {unit:<7} {count / secs if secs else 0:>9.0f}/s"
+        f" p50 {1e3 * percentile(latencies, 50):>8.1f} ms p99 {1e3 * percentile(latencies, 99):>8.1f} ms"
+    )
+
+
+def run_ingest(client: TestClient, events: List[Tuple[str, int, bytes]]) -> Tuple[Dict[Tuple[str, int], float], float]:
+    ingested_at = {}
+    latencies = []
+    started = time.monotonic()
+
+    for token, timestamp, body in events:
+        sent = time.monotonic()
+        response = client.post("/dota2-gsi/dota2-event", content=body)
+        response.raise_for_status()
+        ingested_at[(token, timestamp)] = time.monotonic()
+        latencies.append(ingested_at[(token, timestamp)] - sent)
+
+    secs = time.monotonic() - started
+    report("ingest", len(events), secs, latencies)
+    return ingested_at, secs
+
+
+def run_pipeline(messages: List[PubsubMessage], refresh_rate_secs: int) -> float:
+    options = PipelineOptions(["--direct_running_mode=in_memory", "--direct_num_workers=1"])
+    started = time.monotonic()
+
+    with beam.Pipeline(options=options) as p:
+        build_pipeline(
+            p | "Messages" >> beam.Create(messages),
+            storage_backend="memory",
+            refresh_rate_secs=refresh_rate_secs
+        )
+
+    secs = time.monotonic() - started
+    # Time from the start of the pipeline until the stored event of a token
+    # is updated
+    write_latencies = [
+        written_at - started
+        for written_at, collection_name, _ in memory_db.store.writes or []
+        if collection_name == "gsi-events"
+    ]
+    report("pipeline", len(messages), secs, write_latencies, unit="msgs")
+    return secs
+
+
+def run_reads(
+    client: TestClient,
+    tokens: List[str],
+    reads_per_token: int,
+    ingested_at: Dict[Tuple[str, int], float]
+) -> None:
+    latencies = []
+    freshness = []
+    missing = 0
+    started = time.monotonic()
+
+    for i in range(reads_per_token):
+        for token in tokens:
+            sent = time.monotonic()
+            response = client.get(STATS_URL, params={"token": token})
+            read_at = time.monotonic()
+            response.raise_for_status()
+            latencies.append(read_at - sent)
+
+            etag = response.headers.get("ETag", "")
+            if not etag:
+                missing += i == 0
+                continue
+
+            # W/"<timestamp>-<game time>" of the served event
+            timestamp = int(etag.strip('W/"').split("-")[0])
+            if i == 0 and (token, timestamp) in ingested_at:
+                freshness.append(read_at - ingested_at[(token, timestamp)])
+
+    secs = time.monotonic() - started
+    report("read", len(latencies), secs, latencies, unit="reads")
+    print(
+        f"{'freshness':<10} {len(freshness):>8} tokens"
+        f"  p50 {percentile(freshness, 50):>8.2f} s  p99 {percentile(freshness, 99):>8.2f} s"
+        f"  ({missing} tokens without stats)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events_file", type=str, default="", help="Recorded GSI events, one JSON per line")
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--matches", type=int, default=5)
+    parser.add_argument("--events_per_token", type=int, default=10)
+    parser.add_argument("--reads_per_token", type=int, default=5)
+    parser.add_argument("--refresh_rate_secs", type=int, default=3)
+    parser.add_argument("--coalesce_interval_ms", type=int, default=0, help="0 publishes every event")
+    args = parser.parse_args()
+
+    pub_sub = InMemoryPubSub()
+    core.get_pub_sub = lambda: pub_sub # type: ignore[assignment,return-value]
+    core.settings.storage_backend = "memory"
+    core.settings.ingest_coalesce_interval_ms = args.coalesce_interval_ms
+    memory_db.store.clear(log_writes=True)
+
+    events = scale_events(load_events(args.events_file), args.tokens, args.matches, args.events_per_token)
+    tokens = sorted({token for token, _, _ in events})
+
+    # Team names of the matches, as saved by the crawler
+    match_ids = sorted({int(json.loads(body)["map"]["matchid"]) for _, _, body in events[:len(tokens)]})
+    memory_db.MemoryDb().save_documents(
+        docs=[LiveMatches(matches=[LiveMatchInfo(match_id=m, radiant_team_name="Radiant", dire_team_name="Dire")
+                                   for m in match_ids])],
+        collection_name="live-matches"
+    )
+
+    print(f"{len(events)} events of {len(tokens)} tokens in {len(match_ids)} matches")
+
+    # The coalesced events are published on the shutdown of the API
+    with TestClient(app) as client:
+        ingested_at, _ = run_ingest(client, events)
+
+    run_pipeline(pub_sub.messages, args.refresh_rate_secs)
+
+    with TestClient(app) as client:
+        run_reads(client, tokens, args.reads_per_token, ingested_at)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class TTLCache:
+    """
+    In-process LRU cache with time-based expiry of entries
+
+    Concurrent misses of the same key are coalesced: only the first caller runs
+    the loader, the others wait for its result (single-flight)
+    """
+    def __init__(self, ttl_secs: float, max_size: int = 1024):
+        assert max_size > 0
+
+        self.ttl_secs = ttl_secs
+        self.max_size = max_size
+        self._items: OrderedDict[Hashable, Tuple[float, Any]] = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        # Misses served by an already running load of the same key
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._items.get(key)
+
+        if item is None:
+            return default
+
+        expires_at, value = item
+
+        if expires_at <= time.monotonic():
+            del self._items[key]
+            return default
+
+        self._items.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._items[key] = (time.monotonic() + self.ttl_secs, value)
+        self._items.move_to_end(key)
+
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        self._items.pop(key, None)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        missing = object()
+        value = self.get(key, missing)
+
+        if value is not missing:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+
+        inflight = self._inflight.get(key)
+
+        if inflight is not None:
+            self.coalesced += 1
+            # Shielding, so a cancelled waiter does not cancel the load for others
+            return await asyncio.shield(inflight)
+
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as ex:
+            future.set_exception(ex)
+            # The exception is re-raised to the caller, waiters (if any) get it
+            # from the future. Marking it retrieved avoids "never retrieved" logs
+            future.exception()
+            raise
+        else:
+            self.set(key, value)
+            future.set_result(value)
+        finally:
+            del self._inflight[key]
+
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
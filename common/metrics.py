@@ -0,0 +1,79 @@
+import os
+from typing import Callable, Iterator, List, Mapping, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Histogram, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+# From 50 us for parsing to 1 s for storage reads and publishing
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0
+)
+
+JSON_PARSE_SECONDS = Histogram(
+    "dota2_json_parse_seconds",
+    "Parsing of the ingested GSI events by operation",
+    ["operation"],
+    buckets=LATENCY_BUCKETS
+)
+
+PUBSUB_PUBLISH_SECONDS = Histogram(
+    "dota2_pubsub_publish_seconds",
+    "Publishing of an event to Pub/Sub, including the wait for its batch",
+    buckets=LATENCY_BUCKETS
+)
+
+STORAGE_READ_SECONDS = Histogram(
+    "dota2_storage_read_seconds",
+    "Reads of the stored documents by collection, cache hits excluded",
+    ["collection"],
+    buckets=LATENCY_BUCKETS
+)
+
+MATCH_RENDER_SECONDS = Histogram(
+    "dota2_match_render_seconds",
+    "Construction of the Player and Match models of the live stats and their serialization",
+    ["stage"],
+    buckets=LATENCY_BUCKETS
+)
+
+
+class StatsCollector(Collector):
+    """
+    Exports the stats of a component (a dict of numbers) as gauges, read at
+    scrape time. The stats are of the worker process serving the scrape
+    """
+    def __init__(self, prefix: str, documentation: str, stats: Callable[[], Mapping[str, float]]):
+        self.prefix = prefix
+        self.documentation = documentation
+        self.stats = stats
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        for key, value in self.stats().items():
+            yield GaugeMetricFamily(f"{self.prefix}_{key}", f"{self.documentation}: {key}", value=value)
+
+
+stats_collectors: List[StatsCollector] = []
+
+
+def register_stats(prefix: str, documentation: str, stats: Callable[[], Mapping[str, float]]) -> None:
+    collector = StatsCollector(prefix, documentation, stats)
+    stats_collectors.append(collector)
+    REGISTRY.register(collector)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    Returns the metrics in the Prometheus text format and its content type.
+    With PROMETHEUS_MULTIPROC_DIR set, the histograms of all the Gunicorn
+    workers are aggregated, the stats are still of the serving worker
+    """
+    registry = REGISTRY
+
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        for collector in stats_collectors:
+            registry.register(collector)
+
+    return generate_latest(registry), CONTENT_TYPE_LATEST
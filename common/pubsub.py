@@ -1,19 +1,51 @@
-from typing import Optional
+import asyncio
+from typing import Dict, List, Optional, Set, Tuple, Union
 
 from google.pubsub_v1.services.publisher.async_client import PublisherAsyncClient
 from google.pubsub_v1.types import PubsubMessage
 
+# Pub/Sub rejects publish requests with more than 1000 messages or 10 MB
+MAX_BATCH_MESSAGES = 1000
+MAX_BATCH_BYTES = 10_000_000
+
 
 class PubSub(object):
     client = None
 
     class Client:
-        def __init__(self, project_id: str, topic_name: str, *args, **kwargs):
+        def __init__(
+            self,
+            project_id: str,
+            topic_name: str,
+            batch_max_messages: int = 1,
+            batch_max_bytes: int = 1_000_000,
+            batch_max_latency_ms: int = 10,
+            *args,
+            **kwargs
+        ):
             self.publisher: Optional[PublisherAsyncClient] = None
             self.project_id = project_id
             self.topic_name: str = topic_name
             self.topic_path: str = ""
 
+            # Batching mode is on when more than one message is allowed per
+            # publish request. Messages of concurrent callers are collected
+            # until one of the limits is hit
+            self.batch_max_messages = min(max(1, batch_max_messages), MAX_BATCH_MESSAGES)
+            self.batch_max_bytes = min(max(1, batch_max_bytes), MAX_BATCH_BYTES)
+            self.batch_max_latency_secs = max(0, batch_max_latency_ms) / 1000
+
+            self._pending: List[Tuple[PubsubMessage, asyncio.Future]] = []
+            self._pending_bytes = 0
+            self._flush_timer: Optional[asyncio.TimerHandle] = None
+            # Keeps references to in-flight publish tasks, so they are not
+            # garbage collected before completion
+            self._publish_tasks: Set[asyncio.Task] = set()
+
+        @property
+        def batching_enabled(self) -> bool:
+            return self.batch_max_messages > 1
+
         async def publisher_connected(self) -> bool:
             if self.publisher and self.topic_path:
                 return True
@@ -27,21 +59,98 @@ class PubSub(object):
 
             return False
 
-        async def publish_messages(self, message: str) -> str:
+        async def publish_messages(
+            self,
+            message: Union[str, bytes],
+            attributes: Optional[Dict[str, str]] = None
+        ) -> str:
             if await self.publisher_connected():
-                pub_resp = await self.publisher.publish( # type: ignore[union-attr]
-                    topic=self.topic_path,
-                    messages=[
-                        PubsubMessage(
-                            data=message.encode('utf-8')
-                        ),
-                    ]
-                )
-                for msg_id in pub_resp.message_ids:
+                # Bytes are published as they are, without re-encoding
+                data = message if isinstance(message, bytes) else message.encode('utf-8')
+                pubsub_message = PubsubMessage(data=data, attributes=attributes or {})
+
+                if self.batching_enabled:
+                    return await self._enqueue(pubsub_message)
+
+                for msg_id in await self._publish([pubsub_message, ]):
                     return msg_id
 
             return ""
 
+        async def flush(self) -> None:
+            """Publishes pending messages right away and waits for all in-flight batches"""
+            self._flush()
+            if self._publish_tasks:
+                await asyncio.gather(*self._publish_tasks, return_exceptions=True)
+
+        async def _publish(self, messages: List[PubsubMessage]) -> List[str]:
+            pub_resp = await self.publisher.publish( # type: ignore[union-attr]
+                topic=self.topic_path,
+                messages=messages
+            )
+            return list(pub_resp.message_ids)
+
+        async def _enqueue(self, message: PubsubMessage) -> str:
+            loop = asyncio.get_running_loop()
+            future: asyncio.Future = loop.create_future()
+            message_size = len(message.data) + sum(len(k) + len(v) for k, v in message.attributes.items())
+
+            # The message does not fit the current batch, so the batch is sent first
+            if self._pending and self._pending_bytes + message_size > self.batch_max_bytes:
+                self._flush()
+
+            self._pending.append((message, future))
+            self._pending_bytes += message_size
+
+            if (
+                len(self._pending) >= self.batch_max_messages or
+                self._pending_bytes >= self.batch_max_bytes
+            ):
+                self._flush()
+            elif self._flush_timer is None:
+                self._flush_timer = loop.call_later(self.batch_max_latency_secs, self._flush)
+
+            return await future
+
+        def _flush(self) -> None:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+
+            if not self._pending:
+                return
+
+            batch = self._pending
+            self._pending = []
+            self._pending_bytes = 0
+
+            task = asyncio.ensure_future(self._publish_batch(batch))
+            self._publish_tasks.add(task)
+            task.add_done_callback(self._publish_tasks.discard)
+
+        async def _publish_batch(self, batch: List[Tuple[PubsubMessage, asyncio.Future]]) -> None:
+            try:
+                message_ids = await self._publish([message for message, _ in batch])
+            except BaseException as ex:
+                # A cancelled publish (e.g. on shutdown) cancels the callers,
+                # otherwise they would wait for their futures forever
+                for _, future in batch:
+                    if future.done():
+                        continue
+                    if isinstance(ex, asyncio.CancelledError):
+                        future.cancel()
+                    else:
+                        future.set_exception(ex)
+
+                if not isinstance(ex, Exception):
+                    raise
+                return
+
+            # Pub/Sub returns IDs in the same order as the messages were sent
+            for i, (_, future) in enumerate(batch):
+                if not future.done():
+                    future.set_result(message_ids[i] if i < len(message_ids) else "")
+
     def __new__(cls, project_id: str, topic_name: str, *args, **kwargs) -> Client: # type: ignore[misc]
         if cls.client is None:
             cls.client = cls.Client(
@@ -15,8 +15,69 @@ class Settings(BaseSettings):
     google_project_number: str = ""
     service_name: str = ""
     pubsub_topic_name: str = ""
+    # Events of concurrent requests are published in batches. A batch is sent
+    # once any of the limits is reached. Set max messages to 1 to disable it
+    pubsub_batch_max_messages: int = 100
+    pubsub_batch_max_bytes: int = 1_000_000
+    pubsub_batch_max_latency_ms: int = 10
+    # Raw ingest (opt-in) publishes the request body of an event as it is,
+    # without parsing and re-encoding the JSON. Only the braces and the token
+    # are checked, malformed JSON is dropped by the events processor instead
+    # of getting 400. Larger bodies are rejected in both modes
+    ingest_raw_events: bool = False
+    ingest_max_body_bytes: int = 1_000_000
+    # Coalescing mode, off (0) by default: only the latest event of a token is
+    # published once per interval, the events processor drops the older ones
+    # anyway. Events are acknowledged before they are published, so there is
+    # no message ID and a failed publish isn't reported to the sender
+    ingest_coalesce_interval_ms: int = 0
+    ingest_coalesce_max_tokens: int = 10_000
+    # Projection keeps only the sections of events read downstream (see
+    # events_processor.libs.codec.EVENT_SECTIONS), at the cost of parsing
+    # them. Compression of the published events: "", "gzip" or "zstd"
+    ingest_projection: bool = False
+    ingest_compression: str = ""
     steam_api_keys_secret_name: str = ""
+    # A rate limited Steam API key is skipped for the cooldown
+    steam_api_key_cooldown_secs: float = 60
+    steam_api_request_timeout_secs: float = 1
+    steam_api_max_retries: int = 2
     firestore_database_name: str = ""
+    # Storage of the processed events and live matches: "firestore", "redis"
+    # or "memory" (shared only within a process, for local runs)
+    storage_backend: str = "firestore"
+    redis_url: str = "redis://localhost:6379/0"
     live_matches_collection_name: str = "live-matches"
     gsi_events_collection_name: str = "gsi-events"
+    match_trends_collection_name: str = "match-trends"
+    # Stored events are updated once per window of the events processor, so
+    # the TTL must be equal to the --refresh_rate_secs of the Dataflow job
+    # (3 by default, see events_processor/dataflow_job.py). The job is
+    # deployed on its own, change both together. A longer TTL serves stale
+    # stats, a shorter one reads the storage for unchanged events
+    stats_cache_ttl_secs: float = 3
+    stats_cache_max_size: int = 10_000
+    # Delta responses diff against the last versions of the stats kept per
+    # token, a cursor older than that gets the full stats
+    stats_delta_ring_size: int = 10
+    stats_delta_ring_ttl_secs: float = 60
+    # Stats streams: how often the shared poller of a token reads the stored
+    # event and how often idle connections get a keep-alive comment
+    stream_poll_interval_secs: float = 1
+    stream_keepalive_secs: float = 15
+    # The crawler polls live matches every min interval while they change and
+    # backs off to the max one while they don't. Unchanged matches are still
+    # saved every refresh interval, it must be shorter than the storage TTL
+    crawler_min_interval_secs: float = 3
+    crawler_max_interval_secs: float = 30
+    crawler_refresh_secs: float = 600
+    # Realtime stats of every live match are fetched concurrently, with up to
+    # steam_api_concurrency_per_key requests per healthy key. A crawl cycle
+    # takes at most the budget, the rest of the requests are cancelled. The
+    # stats change on every poll, so they are saved every realtime stats
+    # interval rather than on every change
+    crawler_realtime_stats: bool = True
+    crawler_realtime_stats_interval_secs: float = 15
+    crawler_cycle_budget_secs: float = 4
+    steam_api_concurrency_per_key: int = 4
     github_actions_ci_cd: bool = False
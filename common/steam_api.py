@@ -1,8 +1,11 @@
+import asyncio
 import json
+import random
+import time
 from collections import deque
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
-import requests
+import httpx
 
 from common.helpers import convert_to_int
 from common.secret_keys import get_secret_value
@@ -13,10 +16,38 @@ settings = Settings()
 
 keys: List[str] = []
 
+STEAM_API_URL = "https://api.steampowered.com"
+LIVE_LEAGUE_GAMES_PATH = "/IDOTA2Match_570/GetLiveLeagueGames/V001/"
+REALTIME_STATS_PATH = "/IDOTA2MatchStats_570/GetRealtimeStats/v1/"
 
-class ApiKeys:
+RADIANT_TEAM_NUMBER = 2
+DIRE_TEAM_NUMBER = 3
+
+# Status codes worth another attempt, with the same or the next key
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class KeyHealth:
     def __init__(self):
-        self.keys_rotator = ApiKeys.launch_keys_rotator()
+        self.requests = 0
+        self.rate_limited = 0
+        self.failed = 0
+        self.cooldown_until = 0.0
+        self.evicted = False
+
+    def is_healthy(self, now: float) -> bool:
+        return not self.evicted and now >= self.cooldown_until
+
+
+class ApiKeys:
+    """
+    Rotates Steam API keys skipping unhealthy ones: a rate limited (429) key
+    cools down for a while and a rejected (403) one is evicted for good
+    """
+    def __init__(self, api_keys: Optional[List[str]] = None, cooldown_secs: float = 60):
+        self.keys_rotator = deque(api_keys) if api_keys is not None else ApiKeys.launch_keys_rotator()
+        self.cooldown_secs = cooldown_secs
+        self.health: Dict[str, KeyHealth] = {key: KeyHealth() for key in self.keys_rotator}
         self.current_key = next(iter(self.keys_rotator), "")
 
     @staticmethod
@@ -42,30 +73,122 @@ class ApiKeys:
         return deque([key.strip() for key in keys if key.strip()])
 
     def get_next_key(self) -> str:
-        self.current_key = self.keys_rotator[0] if len(self.keys_rotator) > 0 else ""
-        self.keys_rotator.rotate(-1)  # Rotate left
+        """Returns the next healthy key or an empty string if there is none"""
+        now = time.monotonic()
+        self.current_key = ""
+
+        for _ in range(len(self.keys_rotator)):
+            key = self.keys_rotator[0]
+            self.keys_rotator.rotate(-1)  # Rotate left
+            if self.health[key].is_healthy(now):
+                self.current_key = key
+                break
+
         return self.current_key
 
+    def report(self, key: str, status_code: Optional[int]) -> None:
+        """Updates the key health with the response status, None for a failed request"""
+        health = self.health[key]
+        health.requests += 1
+
+        if status_code == 429: # noqa: PLR2004
+            health.rate_limited += 1
+            health.cooldown_until = time.monotonic() + self.cooldown_secs
+        elif status_code == 403: # noqa: PLR2004
+            health.evicted = True
+            print("Steam API key is evicted after 403 Forbidden")
+        elif status_code is None or status_code >= 400: # noqa: PLR2004
+            health.failed += 1
+
+    def healthy_keys(self) -> int:
+        now = time.monotonic()
+        return sum(1 for health in self.health.values() if health.is_healthy(now))
+
+    def stats(self) -> List[Dict[str, Any]]:
+        # Keys are secrets, only their last characters are shown
+        return [
+            {
+                "key": f"...{key[-4:]}",
+                "requests": health.requests,
+                "rate_limited": health.rate_limited,
+                "failed": health.failed,
+                "evicted": health.evicted,
+                "cooling_down": not health.evicted and not health.is_healthy(time.monotonic()),
+            }
+            for key, health in self.health.items()
+        ]
+
 
 class SteamApi:
-    def __init__(self, request_timeout: int = 1):
-        self.api_keys = ApiKeys()
-        self.request_timeout = request_timeout
+    """
+    Async Steam Web API client. A single pooled connection is reused by the
+    requests, failed ones are retried with jittered exponential backoff
+    """
+    def __init__(
+        self,
+        api_keys: Optional[ApiKeys] = None,
+        request_timeout: float = 1,
+        max_retries: int = 2,
+        backoff_secs: float = 0.5,
+        base_url: str = STEAM_API_URL,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.api_keys = api_keys or ApiKeys(cooldown_secs=settings.steam_api_key_cooldown_secs)
+        self.max_retries = max_retries
+        self.backoff_secs = backoff_secs
+        self.client = httpx.AsyncClient(base_url=base_url, timeout=request_timeout, transport=transport)
+
+    async def close(self) -> None:
+        await self.client.aclose()
 
-    def send_request(self, url) -> Tuple[Dict[str, Any], str]:
-        api_key = self.api_keys.get_next_key()
-        url += f"{'&' if '?' in url else '?'}key={api_key}"
+    async def backoff(self, attempt: int) -> None:
+        # Full jitter, so concurrent requests don't retry at the same time
+        await asyncio.sleep(random.uniform(0, self.backoff_secs * 2 ** attempt))
 
-        try:
-            response = requests.get(url, timeout=self.request_timeout)
-            response.raise_for_status()
-            return response.json(), ""
-        except requests.RequestException as e:
-            return {}, str(e)
+    async def send_request(self, path: str, params: Optional[Dict[str, str]] = None) -> Tuple[Dict[str, Any], str]:
+        error_msg = ""
+        attempt = 0
+
+        while attempt <= self.max_retries:
+            api_key = self.api_keys.get_next_key()
+            if not api_key:
+                return {}, error_msg or "No healthy Steam API keys"
+
+            try:
+                response = await self.client.get(path, params={**(params or {}), "key": api_key})
+            except httpx.HTTPError as e:
+                # The error message doesn't include the URL, it has the key
+                self.api_keys.report(api_key, None)
+                error_msg = f"{type(e).__name__}: {e}"
+                await self.backoff(attempt)
+                attempt += 1
+                continue
+
+            self.api_keys.report(api_key, response.status_code)
+
+            if response.is_success:
+                try:
+                    return response.json(), ""
+                except ValueError as e:
+                    return {}, f"Invalid Steam API response: {e}"
 
-    def get_live_matches(self) -> LiveMatches:
-        url = 'https://api.steampowered.com/IDOTA2Match_570/GetLiveLeagueGames/V001/?format=json'
-        data, error_msg = self.send_request(url)
+            error_msg = f"{response.status_code} {response.reason_phrase}"
+
+            if response.status_code == 403: # noqa: PLR2004
+                # The key is evicted, the next one is tried right away and
+                # doesn't cost a retry
+                continue
+            if response.status_code not in RETRY_STATUS_CODES:
+                break
+
+            await self.backoff(attempt)
+            attempt += 1
+
+        return {}, error_msg
+
+    async def get_live_matches(self) -> Tuple[LiveMatches, str]:
+        # The error is returned, so a failed request is not taken for no matches
+        data, error_msg = await self.send_request(LIVE_LEAGUE_GAMES_PATH, params={"format": "json"})
 
         if error_msg:
             print(f"Steam API get_live_matches request error: {error_msg}")
@@ -74,16 +197,86 @@ class SteamApi:
         for game in data.get("result", {}).get("games", []):
             match_id = convert_to_int(game.get("match_id"), 0)[1]
             if match_id > 0:
+                scoreboard = game.get("scoreboard", {})
                 live_matches.matches.append(
                     LiveMatchInfo(
                         match_id=match_id,
                         radiant_team_name=game.get("radiant_team", {}).get(
                             "team_name", ""),
                         dire_team_name=game.get("dire_team", {}).get(
-                            "team_name", "")
+                            "team_name", ""),
+                        server_steam_id=convert_to_int(game.get("server_steam_id"), 0)[1],
+                        league_id=convert_to_int(game.get("league_id"), 0)[1],
+                        spectators=convert_to_int(game.get("spectators"), 0)[1],
+                        radiant_tower_state=convert_to_int(
+                            scoreboard.get("radiant", {}).get("tower_state"), 0)[1],
+                        dire_tower_state=convert_to_int(
+                            scoreboard.get("dire", {}).get("tower_state"), 0)[1]
                     )
                 )
-        return live_matches
+        return live_matches, error_msg
+
+    async def get_realtime_stats(self, server_steam_id: int) -> Tuple[Dict[str, Any], str]:
+        return await self.send_request(REALTIME_STATS_PATH, params={"server_steam_id": str(server_steam_id)})
+
+    async def add_realtime_stats(
+        self,
+        live_matches: LiveMatches,
+        budget_secs: float,
+        concurrency_per_key: int = 4
+    ) -> Dict[str, int]:
+        """
+        Fetches the realtime stats of the live matches concurrently and merges
+        them into the matches. The concurrency scales with the healthy keys,
+        so the whole keys pool is used. Requests still running when the budget
+        is over are cancelled and their matches are left without stats
+        """
+        matches = [m for m in live_matches.matches if m.server_steam_id > 0]
+        semaphore = asyncio.Semaphore(max(1, self.api_keys.healthy_keys() * concurrency_per_key))
+
+        async def fetch(match: LiveMatchInfo) -> bool:
+            async with semaphore:
+                data, error_msg = await self.get_realtime_stats(match.server_steam_id)
+
+            if error_msg:
+                return False
+
+            merge_realtime_stats(match, data)
+            return True
+
+        done: set = set()
+        pending: set = set()
+        if matches:
+            done, pending = await asyncio.wait(
+                [asyncio.ensure_future(fetch(m)) for m in matches],
+                timeout=max(budget_secs, 0)
+            )
+
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        merged = sum(1 for task in done if task.exception() is None and task.result())
+        return {
+            "matches": len(matches),
+            "merged": merged,
+            "failed": len(done) - merged,
+            "timed_out": len(pending),
+        }
+
+
+def merge_realtime_stats(match: LiveMatchInfo, data: Dict[str, Any]) -> None:
+    match.game_time = convert_to_int(data.get("match", {}).get("game_time"), 0)[1]
+
+    for team in data.get("teams", []):
+        score = convert_to_int(team.get("score"), 0)[1]
+        net_worth = convert_to_int(team.get("net_worth"), 0)[1]
+
+        if team.get("team_number") == RADIANT_TEAM_NUMBER:
+            match.radiant_score, match.radiant_net_worth = score, net_worth
+        elif team.get("team_number") == DIRE_TEAM_NUMBER:
+            match.dire_score, match.dire_net_worth = score, net_worth
 
 
 class SteamAPIConnection:
@@ -92,5 +285,8 @@ class SteamAPIConnection:
     @classmethod
     def get_instance(cls):
         if not cls._instance:
-            cls._instance = SteamApi()
+            cls._instance = SteamApi(
+                request_timeout=settings.steam_api_request_timeout_secs,
+                max_retries=settings.steam_api_max_retries
+            )
         return cls._instance
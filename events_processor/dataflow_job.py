@@ -1,45 +1,67 @@
 import argparse
 import json
 import os
+from typing import List, Tuple
 
 import apache_beam as beam
+from apache_beam.coders import BytesCoder, TupleCoder, VarIntCoder
+from apache_beam.metrics import Metrics
 from apache_beam.options.pipeline_options import GoogleCloudOptions, PipelineOptions, StandardOptions, WorkerOptions
-from apache_beam.transforms import GroupByKey, window
-from libs.firestore import LiveMatches
+from apache_beam.transforms import window
+from apache_beam.transforms.timeutil import TimeDomain
+from apache_beam.transforms.userstate import ReadModifyWriteStateSpec, TimerSpec, on_timer
+
+# Importing the coder also registers it for GsiEvent passed between the stages
+from libs.coders import GsiEventCoder
+from libs.firestore import GsiEvent, LiveMatches, MatchTrends
+
+# Firestore allows up to 500 writes in a batch
+FIRESTORE_MAX_BATCH_WRITES = 500
 
 
 class Parse(beam.DoFn):
     """
     A DoFn class for parsing and validating messages
 
-    Extracts essential attributes from nested structures of an incoming message
+    Extracts essential attributes from nested structures of an incoming message.
+    Messages are either bytes or PubsubMessage with attributes, compressed
+    events are decompressed by their content encoding attribute
     """
-    def process(self, message: bytes, **kwargs):
-        import json
-        from typing import Tuple
+    def __init__(self, *args, **kwargs):
+        beam.DoFn.__init__(self, *args, **kwargs)
+        self.parsed_counter = Metrics.counter(self.__class__, "events_parsed")
+        self.invalid_counter = Metrics.counter(self.__class__, "events_dropped_invalid")
+        # Valid JSON with no match ID, token or players, e.g. from the menu
+        self.incomplete_counter = Metrics.counter(self.__class__, "events_dropped_incomplete")
 
+    def process(self, message, **kwargs):
         import apache_beam as beam
-        import chardet
+        from libs.codec import CONTENT_ENCODING_ATTRIBUTE, decode_message, decompress_message, json_loads
         from libs.firestore import GsiEvent
+        from libs.helpers import convert_to_int
 
-        def convert_to_int(val, default: int = 0) -> Tuple[bool, int]:
-            try:
-                int_value = int(val)
-                res = True
-            except (ValueError, TypeError):
-                int_value = default
-                res = False
+        data = message
+        content_encoding = ""
 
-            return res, int_value
+        if not isinstance(message, bytes):
+            data = message.data
+            content_encoding = (message.attributes or {}).get(CONTENT_ENCODING_ATTRIBUTE, "")
 
         try:
-            encoding = chardet.detect(message)["encoding"]
-            match_data = message.decode(encoding)
-            event_data = json.loads(match_data)
+            match_data = decode_message(decompress_message(data, content_encoding))
+            event_data = json_loads(match_data)
         except (ValueError, TypeError):
             event_data = {}
             match_data = ""
 
+        if not isinstance(event_data, dict):
+            event_data = {}
+            match_data = ""
+
+        if not match_data:
+            self.invalid_counter.inc()
+            return
+
         gsi_event = GsiEvent(match_data=match_data)
 
         # Pull main nested attributes to the top
@@ -70,31 +92,135 @@ class Parse(beam.DoFn):
         player_data = event_data.get("player", {})
 
         if gsi_event.match_id > 0 and gsi_event.token and player_data.keys():
-            # Return results in the compatible format for windowing
-            yield beam.window.TimestampedValue(gsi_event.model_dump_json(), gsi_event.timestamp)
+            self.parsed_counter.inc()
+            # Return results in the compatible format for windowing. Events are
+            # passed between stages as typed records (see libs.coders)
+            yield beam.window.TimestampedValue(gsi_event, gsi_event.timestamp)
+        else:
+            self.incomplete_counter.inc()
 
 
 class MatchIDSplit(beam.DoFn):
     """
-    DoFn that splits events on key-value pairs, using match_id as the key
+    DoFn that splits events on key-value pairs, using (match_id, token) as
+    the key. The tokens of every window are counted per bundle
     """
-    def process(self, gsi_event_json: str, **kwargs):
-        from libs.firestore import GsiEvent
-        from pydantic_core import ValidationError
+    def __init__(self, *args, **kwargs):
+        beam.DoFn.__init__(self, *args, **kwargs)
+        self.tokens_per_window = Metrics.distribution(self.__class__, "tokens_per_window")
 
-        try:
-            gsi_event = GsiEvent.model_validate_json(gsi_event_json)
-        except ValidationError:
-            gsi_event = None
+    def start_bundle(self):
+        self.window_tokens = {}
+
+    def process(self, gsi_event, window=beam.DoFn.WindowParam, **kwargs):
+        self.window_tokens.setdefault(window, set()).add(gsi_event.token)
+        yield (gsi_event.match_id, gsi_event.token), gsi_event
+
+    def finish_bundle(self):
+        for tokens in self.window_tokens.values():
+            self.tokens_per_window.update(len(tokens))
 
-        if gsi_event:
-            yield gsi_event.match_id, gsi_event_json
+
+class LatestEvent(beam.CombineFn):
+    """
+    CombineFn that keeps only the latest event (by clock time) of a key.
+    Events are combined on the worker that produced them before the shuffle,
+    so only one event per token and window is sent over the network
+    """
+    @staticmethod
+    def is_newer(gsi_event, than_event) -> bool:
+        return (
+            than_event is None or
+            (gsi_event.clock_time, gsi_event.timestamp) > (than_event.clock_time, than_event.timestamp)
+        )
+
+    def create_accumulator(self):
+        return None
+
+    def add_input(self, latest_event, gsi_event):
+        return gsi_event if self.is_newer(gsi_event, latest_event) else latest_event
+
+    def merge_accumulators(self, accumulators):
+        latest_event = None
+
+        for gsi_event in accumulators:
+            if gsi_event is not None and self.is_newer(gsi_event, latest_event):
+                latest_event = gsi_event
+
+        return latest_event
+
+    def extract_output(self, latest_event):
+        return latest_event
+
+    def get_accumulator_coder(self):
+        return beam.coders.NullableCoder(GsiEventCoder())
+
+
+class FreshnessFilter(beam.DoFn):
+    """
+    Stateful DoFn that drops events older than the latest written one of the
+    same token, so there is no need to read the stored event before writing.
+
+    Elements must be keyed by token in the global window. The freshness state
+    of a token expires together with its stored document
+    """
+    LATEST_STATE = ReadModifyWriteStateSpec(
+        "latest",
+        # match_id, game_time, timestamp
+        TupleCoder([VarIntCoder(), VarIntCoder(), VarIntCoder()])
+    )
+    EXPIRY_TIMER = TimerSpec("expiry", TimeDomain.REAL_TIME)
+
+    def __init__(self, state_ttl_secs: int = 3600, *args, **kwargs):
+        beam.DoFn.__init__(self, *args, **kwargs)
+        self.state_ttl_secs = state_ttl_secs
+        self.stale_counter = Metrics.counter(self.__class__, "stale_events_dropped")
+
+    @staticmethod
+    def is_stale(gsi_event: GsiEvent, latest) -> bool:
+        # We need to write the latest matches checking by all timestamp metrics
+        if not latest:
+            return False
+
+        latest_match_id, latest_game_time, latest_timestamp = latest
+
+        if latest_game_time > gsi_event.game_time and latest_match_id == gsi_event.match_id:
+            return True
+
+        return latest_timestamp > gsi_event.timestamp
+
+    def process(
+        self,
+        token_event,
+        latest_state=beam.DoFn.StateParam(LATEST_STATE),
+        expiry_timer=beam.DoFn.TimerParam(EXPIRY_TIMER),
+        **kwargs
+    ):
+        from apache_beam.utils.timestamp import Duration, Timestamp
+
+        _, gsi_event = token_event
+
+        if self.is_stale(gsi_event, latest_state.read()):
+            self.stale_counter.inc()
+            return
+
+        latest_state.write((gsi_event.match_id, gsi_event.game_time, gsi_event.timestamp))
+        expiry_timer.set(Timestamp.now() + Duration(seconds=self.state_ttl_secs))
+
+        yield token_event
+
+    @on_timer(EXPIRY_TIMER)
+    def expire(self, latest_state=beam.DoFn.StateParam(LATEST_STATE)):
+        latest_state.clear()
 
 
 class EnrichWrite(beam.DoFn):
     """
-    DoFn that extracts the latest events for every token, enriches with the
-    live team names and saves in the Firestore
+    DoFn that enriches the latest event of a token with the live team names
+    and the pre-rendered stats and saves it in the storage (Firestore or Redis)
+
+    Events are buffered within a bundle, so they are saved with one batched
+    write. Stale events must be dropped beforehand (see FreshnessFilter)
     """
 
     def __init__(
@@ -103,6 +229,11 @@ class EnrichWrite(beam.DoFn):
         gsi_events_collection_name: str,
         live_matches_collection_name: str,
         database_name: str,
+        live_matches_refresh_secs: int = 5,
+        max_buffer_size: int = 200,
+        ttl_secs: int = 3600,
+        storage_backend: str = "firestore",
+        redis_url: str = "",
         *args,
         **kwargs
     ):
@@ -113,36 +244,69 @@ class EnrichWrite(beam.DoFn):
         self.gsi_events_collection_name = gsi_events_collection_name
         self.live_matches_collection_name = live_matches_collection_name
         self.database_name = database_name
+        self.live_matches_refresh_secs = live_matches_refresh_secs
+        assert 0 < max_buffer_size <= FIRESTORE_MAX_BATCH_WRITES
+        self.max_buffer_size = max_buffer_size
+        self.ttl_secs = ttl_secs
+        self.storage_backend = storage_backend
+        self.redis_url = redis_url
+
+        # An older event of a token is replaced in the buffer, so it's never written
+        self.stale_writes_counter = Metrics.counter(self.__class__, "stale_writes_skipped")
+        self.writes_counter = Metrics.counter(self.__class__, "events_written")
+        self.write_usecs = Metrics.distribution(self.__class__, "storage_write_usecs")
+        self.read_usecs = Metrics.distribution(self.__class__, "live_matches_read_usecs")
+
+    def setup(self):
+        from libs.storage import get_storage_db
+
+        self.storage_db = get_storage_db(
+            backend=self.storage_backend,
+            project_id=self.project_id,
+            database_name=self.database_name,
+            redis_url=self.redis_url,
+            ttl_sec=self.ttl_secs
+        )
 
+        # Live matches indexed by match_id, shared by all the bundles
+        # processed by this DoFn instance on a worker
+        self.live_matches_index = {}
+        self.live_matches_loaded_at = float("-inf")
 
-    def process(
-        self,
-        match_events,
-        **kwargs
-    ):
-        from libs.firestore import FirestoreDb, GsiEvent, LiveMatchInfo
-        from pydantic_core import ValidationError
+    def start_bundle(self):
+        # The latest events of the bundle by token with their windows
+        self.buffer = {}
 
-        fs_client = FirestoreDb(
-            project_id=self.project_id,
-            database_name=self.database_name
-        )
+    def get_live_match(self, match_id: int):
+        import time
 
-        def update_team_names(gsi_event: GsiEvent):
+        now = time.monotonic()
+
+        # The crawler updates live matches every few seconds, so there is no
+        # need to read them for every token
+        if now - self.live_matches_loaded_at >= self.live_matches_refresh_secs:
             # Live Matches are stored in only one document with id == "0"
-            live_matches: LiveMatches = fs_client.query_document(
+            live_matches: LiveMatches = self.storage_db.query_document(
                 document_id="0",
                 collection_name=self.live_matches_collection_name
             )
+            self.read_usecs.update(int(1e6 * (time.monotonic() - now)))
+
+            self.live_matches_index = live_matches.index_by_match_id() if live_matches else {}
+            self.live_matches_loaded_at = now
+
+        return self.live_matches_index.get(match_id)
+
+    def enrich(self, gsi_event: GsiEvent):
+        from libs.codec import json_loads
+        from libs.firestore import LiveMatchInfo
+        from libs.stats import build_match, dump_match_snapshot
 
-            # Filter only needed live match data
-            flt = filter(lambda lm: lm.match_id == gsi_event.match_id, live_matches.matches)
-            live_match: LiveMatchInfo = next(flt, None)
+        live_match: LiveMatchInfo = self.get_live_match(gsi_event.match_id)
 
-            if not live_match:
-                return
+        gsi_match_dict = json_loads(gsi_event.match_data)
 
-            gsi_match_dict = json.loads(gsi_event.match_data)
+        if live_match:
             player_data = gsi_match_dict.get("player", {})
 
             team_radiant_data = player_data.get("team2", {})
@@ -156,65 +320,411 @@ class EnrichWrite(beam.DoFn):
 
             gsi_event.match_data = json.dumps(gsi_match_dict)
 
-        match_id, gsi_event_dumps = match_events
+        # The stats are rendered once per window, so the API serves them
+        # with no parsing of the raw event
+        gsi_event.match_stats = dump_match_snapshot(build_match(gsi_match_dict))
 
-        try:
-            gsi_events = [
-                GsiEvent.model_validate_json(gsi_event_dump)
-                for gsi_event_dump in gsi_event_dumps
-            ]
-        except ValidationError:
-            gsi_events = []
-
-        # One single token means one particular spectator
-        all_tokens= set(e.token for e in gsi_events)
-
-        for token in all_tokens:
-            # Find the latest event
-            max_clock_time = -1
-            latest_event = None
-
-            for e in gsi_events:
-                if e.token == token and e.clock_time >= 0:
-                    clock_time = e.clock_time
-                    if clock_time > max_clock_time:
-                        max_clock_time = clock_time
-                        latest_event = e
-
-            if not latest_event:
-                continue
-
-            update_team_names(gsi_event=latest_event)
-
-            # We are going to write a DB event. We need to write the latest
-            # matches checking by all timestamp metrics
-            write_to_db = True
-
-            # Retrieving the last stored event from the Firestore for the token
-            prev_gsi_event = fs_client.query_document(
-                document_id=token,
-                collection_name=self.gsi_events_collection_name
-            )
+    def flush(self):
+        import time
+
+        from apache_beam.utils.windowed_value import WindowedValue
 
-            if prev_gsi_event:
-                if (
-                    prev_gsi_event.game_time > latest_event.game_time and
-                    prev_gsi_event.match_id == latest_event.match_id
-                ):
-                    write_to_db = False
+        buffer = self.buffer
+        self.buffer = {}
 
-                if prev_gsi_event.timestamp > latest_event.timestamp:
-                    write_to_db = False
+        if not buffer:
+            return
 
-            if not write_to_db:
-                continue
+        for gsi_event, _, _ in buffer.values():
+            self.enrich(gsi_event=gsi_event)
 
-            fs_client.save_documents(
-                docs=[latest_event, ],
-                collection_name=self.gsi_events_collection_name
+        started = time.monotonic()
+        self.storage_db.save_documents(
+            docs=[gsi_event for gsi_event, _, _ in buffer.values()],
+            collection_name=self.gsi_events_collection_name
+        )
+        self.write_usecs.update(int(1e6 * (time.monotonic() - started)))
+        self.writes_counter.inc(len(buffer))
+
+        for _, event_window, timestamp in buffer.values():
+            yield WindowedValue(True, timestamp, [event_window])
+
+    def process(
+        self,
+        token_event,
+        window=beam.DoFn.WindowParam,
+        timestamp=beam.DoFn.TimestampParam,
+        **kwargs
+    ):
+        _, latest_event = token_event
+
+        if not latest_event:
+            return
+
+        buffered = self.buffer.get(latest_event.token)
+
+        # The same token may come in several windows of a bundle
+        if buffered is None or LatestEvent.is_newer(latest_event, buffered[0]):
+            self.buffer[latest_event.token] = (latest_event, window, timestamp)
+
+        if buffered is not None:
+            self.stale_writes_counter.inc()
+
+        if len(self.buffer) >= self.max_buffer_size:
+            yield from self.flush()
+
+    def finish_bundle(self):
+        yield from self.flush()
+
+
+class TrackTrends(beam.DoFn):
+    """
+    Stateful DoFn that keeps a bounded time series of the player features of
+    a match (see libs.trends) and outputs it at most once per write interval.
+
+    Elements must be keyed by match_id in the global window. A point is added
+    at most once per sample interval of the match clock, whichever spectator
+    of the match the event comes from. As the stored series grows up to the
+    capacity, it is output once per write interval of the match clock rather
+    than for each point, so the storage writes per match stay constant
+    """
+    SERIES_STATE = ReadModifyWriteStateSpec("series", BytesCoder())
+    LAST_CLOCK_TIME_STATE = ReadModifyWriteStateSpec("last_clock_time", VarIntCoder())
+    LAST_WRITE_CLOCK_TIME_STATE = ReadModifyWriteStateSpec("last_write_clock_time", VarIntCoder())
+    EXPIRY_TIMER = TimerSpec("expiry", TimeDomain.REAL_TIME)
+
+    def __init__(
+        self,
+        capacity: int = 720,
+        sample_interval_secs: int = 5,
+        write_interval_secs: int = 60,
+        state_ttl_secs: int = 3600,
+        *args,
+        **kwargs
+    ):
+        beam.DoFn.__init__(self, *args, **kwargs)
+        self.capacity = capacity
+        self.sample_interval_secs = sample_interval_secs
+        self.write_interval_secs = write_interval_secs
+        self.state_ttl_secs = state_ttl_secs
+
+    def process(
+        self,
+        match_event,
+        series_state=beam.DoFn.StateParam(SERIES_STATE),
+        last_clock_time_state=beam.DoFn.StateParam(LAST_CLOCK_TIME_STATE),
+        last_write_clock_time_state=beam.DoFn.StateParam(LAST_WRITE_CLOCK_TIME_STATE),
+        expiry_timer=beam.DoFn.TimerParam(EXPIRY_TIMER),
+        **kwargs
+    ):
+        from apache_beam.utils.timestamp import Duration, Timestamp
+        from libs.codec import json_loads
+        from libs.firestore import MatchTrends
+        from libs.trends import TrendSeries, extract_trend_values
+
+        match_id, gsi_event = match_event
+        last_clock_time = last_clock_time_state.read()
+
+        # Checked before the series and the event are decoded, as most events
+        # of a match don't add a point
+        if last_clock_time is not None and gsi_event.clock_time < last_clock_time + self.sample_interval_secs:
+            return
+
+        trend_series = TrendSeries.from_bytes(series_state.read() or b"", self.capacity)
+        values = extract_trend_values(json_loads(gsi_event.match_data))
+
+        if not trend_series.append(gsi_event.clock_time, values, self.sample_interval_secs):
+            return
+
+        series_state.write(trend_series.to_bytes())
+        last_clock_time_state.write(gsi_event.clock_time)
+        expiry_timer.set(Timestamp.now() + Duration(seconds=self.state_ttl_secs))
+
+        last_write = last_write_clock_time_state.read()
+        if last_write is not None and gsi_event.clock_time < last_write + self.write_interval_secs:
+            return
+
+        last_write_clock_time_state.write(gsi_event.clock_time)
+        yield MatchTrends(
+            match_id=match_id,
+            clock_time=gsi_event.clock_time,
+            series=trend_series.to_base64()
+        )
+
+    @on_timer(EXPIRY_TIMER)
+    def expire(
+        self,
+        series_state=beam.DoFn.StateParam(SERIES_STATE),
+        last_clock_time_state=beam.DoFn.StateParam(LAST_CLOCK_TIME_STATE),
+        last_write_clock_time_state=beam.DoFn.StateParam(LAST_WRITE_CLOCK_TIME_STATE)
+    ):
+        series_state.clear()
+        last_clock_time_state.clear()
+        last_write_clock_time_state.clear()
+
+
+class WriteTrends(beam.DoFn):
+    """
+    DoFn that saves the trends of the matches with one batched write per
+    bundle, only the latest trends of a match are saved
+    """
+    def __init__(
+        self,
+        project_id: str,
+        match_trends_collection_name: str,
+        database_name: str,
+        max_buffer_size: int = 200,
+        ttl_secs: int = 3600,
+        storage_backend: str = "firestore",
+        redis_url: str = "",
+        *args,
+        **kwargs
+    ):
+        beam.DoFn.__init__(self, *args, **kwargs)
+        self.project_id = project_id
+        self.match_trends_collection_name = match_trends_collection_name
+        self.database_name = database_name
+        assert 0 < max_buffer_size <= FIRESTORE_MAX_BATCH_WRITES
+        self.max_buffer_size = max_buffer_size
+        self.ttl_secs = ttl_secs
+        self.storage_backend = storage_backend
+        self.redis_url = redis_url
+        self.write_usecs = Metrics.distribution(self.__class__, "storage_write_usecs")
+
+    def setup(self):
+        from libs.storage import get_storage_db
+
+        self.storage_db = get_storage_db(
+            backend=self.storage_backend,
+            project_id=self.project_id,
+            database_name=self.database_name,
+            redis_url=self.redis_url,
+            ttl_sec=self.ttl_secs
+        )
+
+    def start_bundle(self):
+        self.buffer = {}
+
+    def flush(self):
+        import time
+
+        if self.buffer:
+            started = time.monotonic()
+            self.storage_db.save_documents(
+                docs=list(self.buffer.values()),
+                collection_name=self.match_trends_collection_name
             )
+            self.write_usecs.update(int(1e6 * (time.monotonic() - started)))
+            self.buffer = {}
+
+    def process(self, match_trends: MatchTrends, **kwargs):
+        buffered = self.buffer.get(match_trends.match_id)
+
+        if buffered is None or match_trends.clock_time > buffered.clock_time:
+            self.buffer[match_trends.match_id] = match_trends
+
+        if len(self.buffer) >= self.max_buffer_size:
+            self.flush()
+
+    def finish_bundle(self):
+        self.flush()
+
+
+def build_pipeline(
+    messages,
+    project_id: str = "",
+    database_name: str = "",
+    storage_backend: str = "firestore",
+    redis_url: str = "",
+    refresh_rate_secs: int = 3,
+    events_ttl_secs: int = 3600,
+    trends_capacity: int = 720,
+    trends_sample_interval_secs: int = 5,
+    trends_write_interval_secs: int = 60,
+    live_matches_refresh_secs: int = 5,
+    gsi_events_collection_name: str = "gsi-events",
+    live_matches_collection_name: str = "live-matches",
+    match_trends_collection_name: str = "match-trends"
+):
+    """
+    Applies the processing to a collection of messages (bytes or
+    PubsubMessage), so the same graph runs on Dataflow and locally
+    """
+    # Extracting events from messages
+    events = messages | "Parse" >> beam.ParDo(Parse()).with_output_types(GsiEvent)
+
+    # Combine messages into windows by timestamp
+    events_window = (
+        events
+        | "Windowing" >> beam.WindowInto(
+                            window.FixedWindows(refresh_rate_secs)
+                         )
+        | 'Split match_id' >> beam.ParDo(MatchIDSplit()).with_output_types(Tuple[Tuple[int, str], GsiEvent])
+    )
+
+    # Enriching matches with team names and writing to DB
+    fresh_events = (
+            events_window
+            # Keep only the latest event of every token of a match
+            | "Latest event per token" >> beam.CombinePerKey(LatestEvent())
+            | "Key by token" >> beam.MapTuple(
+                                    lambda key, gsi_event: (gsi_event.token, gsi_event)
+                                 ).with_output_types(Tuple[str, GsiEvent])
+            # Freshness of tokens is tracked across windows
+            | "Global window" >> beam.WindowInto(window.GlobalWindows())
+            | "Drop stale events" >> beam.ParDo(
+                                        FreshnessFilter(state_ttl_secs=events_ttl_secs)
+                                     ).with_output_types(Tuple[str, GsiEvent])
+    )
+
+    (
+            fresh_events
+            # Enrich with live matches data
+            | "Enrich & Write" >> beam.ParDo(
+                                        EnrichWrite(
+                                            project_id=project_id,
+                                            gsi_events_collection_name=gsi_events_collection_name,
+                                            live_matches_collection_name=live_matches_collection_name,
+                                            database_name=database_name,
+                                            live_matches_refresh_secs=live_matches_refresh_secs,
+                                            ttl_secs=events_ttl_secs,
+                                            storage_backend=storage_backend,
+                                            redis_url=redis_url
+                                        )
+                                     )
+    )
+
+    # Trends of the player features by match
+    (
+            fresh_events
+            | "Key by match_id" >> beam.MapTuple(
+                                    lambda token, gsi_event: (gsi_event.match_id, gsi_event)
+                                 ).with_output_types(Tuple[int, GsiEvent])
+            | "Track trends" >> beam.ParDo(
+                                    TrackTrends(
+                                        capacity=trends_capacity,
+                                        sample_interval_secs=trends_sample_interval_secs,
+                                        write_interval_secs=trends_write_interval_secs,
+                                        state_ttl_secs=events_ttl_secs
+                                    )
+                                 ).with_output_types(MatchTrends)
+            | "Write trends" >> beam.ParDo(
+                                    WriteTrends(
+                                        project_id=project_id,
+                                        match_trends_collection_name=match_trends_collection_name,
+                                        database_name=database_name,
+                                        ttl_secs=events_ttl_secs,
+                                        storage_backend=storage_backend,
+                                        redis_url=redis_url
+                                    )
+                                 )
+    )
 
-            yield True
+    return fresh_events
+
+
+def dataflow_pipeline_options(args, project_id: str) -> PipelineOptions:
+    options = PipelineOptions(
+        [
+            "--setup_file=./setup.py",
+        ]
+    )
+
+    standard_options = options.view_as(StandardOptions)
+    standard_options.runner = "DataflowRunner"
+    standard_options.streaming = True
+
+    google_cloud_options = options.view_as(GoogleCloudOptions)
+    google_cloud_options.project = project_id
+    google_cloud_options.job_name = args.job_name
+    google_cloud_options.region = args.region
+    google_cloud_options.staging_location = f"gs://{args.gcs_working_folder}/binaries"
+    google_cloud_options.temp_location = f"gs://{args.gcs_working_folder}/tmp"
+
+    worker_options = options.view_as(WorkerOptions)
+    worker_options.num_workers = 1
+    worker_options.max_num_workers = args.max_workers
+    worker_options.machine_type = args.machine_type
+    worker_options.autoscaling_algorithm = "THROUGHPUT_BASED"
+
+    return options
+
+
+def local_pipeline_options(runner: str, streaming: bool, pipeline_args: List[str]) -> PipelineOptions:
+    # Unknown arguments are passed to the runner, e.g. --direct_num_workers.
+    # By default DirectRunner runs the DoFns in this process, so they are
+    # seen by the profiler
+    options = PipelineOptions(pipeline_args)
+
+    standard_options = options.view_as(StandardOptions)
+    standard_options.runner = runner
+    standard_options.streaming = streaming
+
+    return options
+
+
+def run_profiled(pipeline: beam.Pipeline, profile_output: str, top: int = 25):
+    """
+    Runs the pipeline under cProfile, saves the stats and prints the
+    functions of the job by cumulative time with their number of calls, so
+    the throughput of the transforms can be compared.
+
+    DirectRunner processes bundles in its own threads (the real time timers
+    of the stateful DoFns need the bundle based runner), so every thread
+    started by the run gets a profiler too
+    """
+    import cProfile
+    import pstats
+    import threading
+    import time
+
+    profilers = [cProfile.Profile()]
+
+    def profile_thread(frame, event, arg):
+        profiler = cProfile.Profile()
+        profilers.append(profiler)
+        profiler.enable()
+
+    started = time.monotonic()
+    threading.setprofile(profile_thread)
+    profilers[0].enable()
+
+    try:
+        result = pipeline.run()
+        result.wait_until_finish()
+    finally:
+        profilers[0].disable()
+        threading.setprofile(None) # type: ignore[arg-type]
+
+    print(f"Wall time: {time.monotonic() - started:.2f} s")
+
+    stats = pstats.Stats(profilers[0])
+    for profiler in profilers[1:]:
+        profiler.create_stats()
+        if profiler.stats: # type: ignore[attr-defined]
+            stats.add(profiler)
+
+    stats.dump_stats(profile_output)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE)
+    # Only the functions of the job and its libs
+    stats.print_stats(r"dataflow_job|libs", top)
+
+    return result
+
+
+def print_metrics(result) -> None:
+    """Prints the counters and distributions of the transforms after a local run"""
+    metrics = result.metrics().query()
+
+    for counter in metrics["counters"]:
+        print(f"{counter.key.step} {counter.key.metric.name}: {counter.result}")
+
+    for distribution in metrics["distributions"]:
+        data = distribution.result
+        print(
+            f"{distribution.key.step} {distribution.key.metric.name}:"
+            f" count={data.count} mean={data.mean:.0f} min={data.min} max={data.max}"
+        )
 
 
 def run(**kwargs):
@@ -225,35 +735,78 @@ def run(**kwargs):
     parser.add_argument(
         "--google_application_credentials_path",
         type=str,
-        required=True,
+        default="",
         help="Absolute path to the Google Cloud Service Account Credentials JSON key file")
 
     # General parameters
     parser.add_argument(
         "--project_id",
         type=str,
-        required=True,
+        default="",
         help="GCP project where Dataflow job should be launched")
 
     parser.add_argument(
         "--gcs_working_folder",
         type=str,
-        required=True,
+        default="",
         help="File path to the working folder of Dataflow job. Format: <bucket>/<folder>"
     )
 
     parser.add_argument(
         "--pubsub_subscription",
         type=str,
-        required=True,
+        default="",
         help="PubSub subscription name from where to read events"
     )
 
+    parser.add_argument(
+        "--runner",
+        type=str,
+        choices=["DataflowRunner", "DirectRunner", "PrismRunner"],
+        default="DataflowRunner",
+        help="DirectRunner and PrismRunner run the job locally, e.g. for profiling"
+    )
+
+    parser.add_argument(
+        "--input_file",
+        type=str,
+        default="",
+        help="Local runs: file with a GSI event per line to process instead of the PubSub subscription"
+    )
+
+    parser.add_argument(
+        "--input_in_memory",
+        action="store_true",
+        help="Local runs: load the input file in memory beforehand, so reading it isn't profiled"
+    )
+
+    parser.add_argument(
+        "--profile_output",
+        type=str,
+        default="",
+        help="Local runs: file to save the cProfile stats of the job to, a summary is printed too"
+    )
+
+    parser.add_argument(
+        "--storage_backend",
+        type=str,
+        choices=["firestore", "redis", "memory"],
+        default="firestore",
+        help="Storage of processed events and live matches, memory is only for local runs"
+    )
+
     parser.add_argument(
         "--firestore_database_name",
         type=str,
-        required=True,
-        help="Firestore Database name to readn and write processed events"
+        default="",
+        help="Firestore Database name to readn and write processed events (firestore storage)"
+    )
+
+    parser.add_argument(
+        "--redis_url",
+        type=str,
+        default="",
+        help="Redis URL to read and write processed events, e.g. redis://host:6379/0 (redis storage)"
     )
 
     parser.add_argument(
@@ -302,81 +855,126 @@ def run(**kwargs):
         "--refresh_rate_secs",
         type=int,
         default=3,
-        help="Refresh rate of the stats in seconds"
+        help="Refresh rate of the stats in seconds. The API caches the stored "
+             "events for stats_cache_ttl_secs (common/settings.py), keep them equal"
+    )
+
+    parser.add_argument(
+        "--events_ttl_secs",
+        type=int,
+        default=3600,
+        help="How long the processed events are stored and tracked for freshness in seconds"
+    )
+
+    parser.add_argument(
+        "--trends_capacity",
+        type=int,
+        default=720,
+        help="Maximum number of points in the trends of a match"
+    )
+
+    parser.add_argument(
+        "--trends_sample_interval_secs",
+        type=int,
+        default=5,
+        help="Minimum interval between the points of the trends by the match clock in seconds"
+    )
+
+    parser.add_argument(
+        "--trends_write_interval_secs",
+        type=int,
+        default=60,
+        help="Minimum interval between the writes of the trends of a match by the match clock in seconds"
+    )
+
+    parser.add_argument(
+        "--live_matches_refresh_secs",
+        type=int,
+        default=5,
+        help="How often workers re-read live matches (team names) from the DB in seconds"
     )
 
     args, pipeline_args = parser.parse_known_args()
     project_id = args.project_id
+    is_local = args.runner != "DataflowRunner"
 
-    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = args.google_application_credentials_path
+    if not is_local:
+        for arg in ("google_application_credentials_path", "project_id", "gcs_working_folder", "pubsub_subscription"):
+            if not getattr(args, arg):
+                parser.error(f"--{arg} is required by DataflowRunner")
+    elif not (args.input_file or args.pubsub_subscription):
+        parser.error("--input_file or --pubsub_subscription is required")
+
+    if args.storage_backend == "memory" and not is_local:
+        parser.error("Memory storage is only for local runs")
+
+    if args.google_application_credentials_path:
+        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = args.google_application_credentials_path
 
     pubsub_subscription_name = f"projects/{project_id}/subscriptions/{args.pubsub_subscription}"
     firestore_database_name = args.firestore_database_name
 
     collection_gsi_event = "gsi-events"
     collection_live_matches = "live-matches"
+    collection_match_trends = "match-trends"
 
     assert args.refresh_rate_secs > 0
     refresh_rate = args.refresh_rate_secs
 
-    options = PipelineOptions(
-        [
-            "--setup_file=./setup.py",
-        ]
-    )
-
-    standard_options = options.view_as(StandardOptions)
-    standard_options.runner = "DataflowRunner"
-    standard_options.streaming = True
-
-    google_cloud_options = options.view_as(GoogleCloudOptions)
-    google_cloud_options.project = project_id
-    google_cloud_options.job_name = args.job_name
-    google_cloud_options.region = args.region
-    google_cloud_options.staging_location = f"gs://{args.gcs_working_folder}/binaries"
-    google_cloud_options.temp_location = f"gs://{args.gcs_working_folder}/tmp"
+    if is_local:
+        options = local_pipeline_options(args.runner, streaming=not args.input_file, pipeline_args=pipeline_args)
+    else:
+        options = dataflow_pipeline_options(args, project_id)
 
-    worker_options = options.view_as(WorkerOptions)
-    worker_options.num_workers = 1
-    worker_options.max_num_workers = args.max_workers
-    worker_options.machine_type = args.machine_type
-    worker_options.autoscaling_algorithm = "THROUGHPUT_BASED"
+    p = beam.Pipeline(options=options)
 
-    with beam.Pipeline(options=options) as p:
-        events = (
+    if args.input_file and args.input_in_memory:
+        with open(args.input_file, "rb") as f:
+            messages = p | "Read" >> beam.Create([line.rstrip(b"\n") for line in f if line.strip()])
+    elif args.input_file:
+        messages = p | "Read" >> beam.io.ReadFromText(args.input_file, coder=beam.coders.BytesCoder())
+    else:
+        messages = (
             p
             # Read unbound collection from the queue
             | "Read" >> beam.io.ReadFromPubSub(
-                            subscription=pubsub_subscription_name
-                        ).with_input_types(str)
-            # Extracting events from messages
-            | "Parse" >> beam.ParDo(Parse())
+                            subscription=pubsub_subscription_name,
+                            # The attributes tell compressed events apart
+                            with_attributes=True
+                        )
         )
 
-        # Combine messages into windows by timestamp
-        events_window = (
-            events
-            | "Windowing" >> beam.WindowInto(
-                                window.FixedWindows(refresh_rate)
-                             )
-            | 'Split match_id' >> beam.ParDo(MatchIDSplit())
-        )
+    build_pipeline(
+        messages,
+        project_id=project_id,
+        database_name=firestore_database_name,
+        storage_backend=args.storage_backend,
+        redis_url=args.redis_url,
+        refresh_rate_secs=refresh_rate,
+        events_ttl_secs=args.events_ttl_secs,
+        trends_capacity=args.trends_capacity,
+        trends_sample_interval_secs=args.trends_sample_interval_secs,
+        trends_write_interval_secs=args.trends_write_interval_secs,
+        live_matches_refresh_secs=args.live_matches_refresh_secs,
+        gsi_events_collection_name=collection_gsi_event,
+        live_matches_collection_name=collection_live_matches,
+        match_trends_collection_name=collection_match_trends
+    )
+
+    if args.profile_output:
+        result = run_profiled(p, args.profile_output)
+    else:
+        result = p.run()
+        result.wait_until_finish()
+
+    if is_local:
+        print_metrics(result)
+
+    if args.storage_backend == "memory":
+        from libs.memory_db import store
+
+        print(f"Stored documents: {len(store.documents)}")
 
-        # Enriching matches with team names and writing to DB
-        (
-                events_window
-                # Group by match_id
-                | "Aggregate match_id" >> GroupByKey()
-                # Take the last one, enrich with live matches data
-                | "Enrich & Write" >> beam.ParDo(
-                                            EnrichWrite(
-                                                project_id=project_id,
-                                                gsi_events_collection_name=collection_gsi_event,
-                                                live_matches_collection_name=collection_live_matches,
-                                                database_name=firestore_database_name
-                                            )
-                                         )
-        )
 
 if __name__ == "__main__":
     run()
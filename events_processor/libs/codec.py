@@ -0,0 +1,83 @@
+import gzip
+import json
+from typing import Any, Dict, Iterable, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore[assignment]
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None  # type: ignore[assignment]
+
+# Message attribute with the compression of the published event
+CONTENT_ENCODING_ATTRIBUTE = "content_encoding"
+CONTENT_ENCODINGS = ("gzip", "zstd")
+
+# Sections of a GSI event read by the events processor and the API
+EVENT_SECTIONS = ("auth", "provider", "map", "player", "items", "hero")
+
+
+def decode_message(message: bytes) -> str:
+    """
+    Decodes a Pub/Sub message. The ingest API publishes UTF-8 (or even
+    ASCII-only) JSON, so the slow charset detection is only a fallback
+    """
+    try:
+        return message.decode("utf-8")
+    except UnicodeDecodeError:
+        import chardet
+
+        encoding = chardet.detect(message)["encoding"]
+        # Unknown encoding (None) raises TypeError
+        return message.decode(encoding)  # type: ignore[arg-type]
+
+
+def json_loads(data: Union[str, bytes]) -> Any:
+    # orjson.JSONDecodeError is a subclass of ValueError as json's one
+    if orjson is not None:
+        return orjson.loads(data)
+
+    return json.loads(data)
+
+
+def project_event(event_data: Dict[str, Any], sections: Iterable[str] = EVENT_SECTIONS) -> Dict[str, Any]:
+    # Abilities, buildings, draft, wearables and minimap take more than half
+    # of an event, but nothing reads them
+    return {section: event_data[section] for section in sections if section in event_data}
+
+
+def compress_message(data: bytes, content_encoding: str) -> bytes:
+    if content_encoding == "gzip":
+        # The fastest level, most of the gain is from the repeated JSON keys
+        return gzip.compress(data, compresslevel=1)
+
+    if content_encoding == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package")
+        return zstandard.ZstdCompressor(level=3).compress(data)
+
+    raise ValueError(f"Unknown content encoding '{content_encoding}', expected one of {CONTENT_ENCODINGS}")
+
+
+def decompress_message(data: bytes, content_encoding: str) -> bytes:
+    """
+    Reverses compress_message. Raises ValueError if the data can't be
+    decompressed, no content encoding returns the data as it is
+    """
+    if not content_encoding:
+        return data
+
+    try:
+        if content_encoding == "gzip":
+            return gzip.decompress(data)
+
+        if content_encoding == "zstd" and zstandard is not None:
+            return zstandard.ZstdDecompressor().decompress(data)
+    except Exception as ex:
+        # gzip raises OSError or EOFError, zstandard its ZstdError
+        raise ValueError(f"Invalid {content_encoding} data: {repr(ex)}") from ex
+
+    raise ValueError(f"Unsupported content encoding '{content_encoding}'")
@@ -0,0 +1,39 @@
+import apache_beam as beam
+from apache_beam.coders import StrUtf8Coder, TupleCoder, VarIntCoder
+
+from .firestore import GsiEvent
+
+
+class GsiEventCoder(beam.coders.Coder):
+    """
+    Coder passing GsiEvent between pipeline stages as a compact row of its
+    fields. Decoding does not parse JSON and does not validate the event again,
+    since it has been validated once when it was created
+    """
+    FIELDS = ("token", "match_id", "timestamp", "clock_time", "game_time", "match_data", "match_stats")
+
+    def __init__(self):
+        self._row_coder = TupleCoder([
+            StrUtf8Coder(),
+            VarIntCoder(),
+            VarIntCoder(),
+            VarIntCoder(),
+            VarIntCoder(),
+            StrUtf8Coder(),
+            StrUtf8Coder(),
+        ])
+
+    def encode(self, value: GsiEvent) -> bytes:
+        return self._row_coder.encode(tuple(getattr(value, f) for f in self.FIELDS))
+
+    def decode(self, encoded: bytes) -> GsiEvent:
+        return GsiEvent.model_construct(**dict(zip(self.FIELDS, self._row_coder.decode(encoded))))
+
+    def is_deterministic(self) -> bool:
+        return True
+
+    def to_type_hint(self):
+        return GsiEvent
+
+
+beam.coders.registry.register_coder(GsiEvent, GsiEventCoder)
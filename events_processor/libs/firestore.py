@@ -1,10 +1,12 @@
 from abc import ABC, abstractmethod
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, List, Optional, Type, Union
 
 from google.cloud import firestore_v1 as firestore
 from pydantic import BaseModel
 
+from .storage import AsyncStorageDb, StorageDb
+
 
 class FirestoreDocumentModel(ABC):
     @abstractmethod
@@ -23,11 +25,25 @@ class LiveMatchInfo(BaseModel):
     match_id: int = 0
     radiant_team_name: str = ""
     dire_team_name: str = ""
+    server_steam_id: int = 0
+    league_id: int = 0
+    spectators: int = 0
+    radiant_tower_state: int = 0
+    dire_tower_state: int = 0
+    # Realtime stats, 0 when they couldn't be fetched within the crawl budget
+    game_time: int = 0
+    radiant_score: int = 0
+    dire_score: int = 0
+    radiant_net_worth: int = 0
+    dire_net_worth: int = 0
 
 
 class LiveMatches(BaseModel, FirestoreDocumentModel):
     matches: List[LiveMatchInfo] = []
 
+    def index_by_match_id(self) -> Dict[int, LiveMatchInfo]:
+        return {m.match_id: m for m in self.matches}
+
     def dump(self) -> str:
         return self.model_dump_json()
 
@@ -46,6 +62,9 @@ class GsiEvent(BaseModel, FirestoreDocumentModel):
     clock_time: int = 0
     game_time: int = 0
     match_data: str = ""
+    # Match stats pre-rendered by the events processor in JSON, ready to be
+    # served by the API (see libs.stats)
+    match_stats: str = ""
 
     def dump(self) -> str:
         return self.model_dump_json()
@@ -57,16 +76,43 @@ class GsiEvent(BaseModel, FirestoreDocumentModel):
         return self.model_dump()
 
 
-COLLECTION_MODEL_MAP = {
+class MatchTrends(BaseModel, FirestoreDocumentModel):
+    match_id: int = 0
+    # Clock time of the latest point
+    clock_time: int = 0
+    # Series of the player features in base64, see libs.trends.TrendSeries
+    series: str = ""
+
+    def dump(self) -> str:
+        return self.model_dump_json()
+
+    def get_doc_id(self) -> str:
+        return str(self.match_id)
+
+    def get_attributes(self) -> Dict[str, Any]:
+        return self.model_dump()
+
+
+COLLECTION_MODEL_MAP: Dict[str, Type[BaseModel]] = {
     "gsi-events": GsiEvent,
-    "live-matches": LiveMatches
+    "live-matches": LiveMatches,
+    "match-trends": MatchTrends
 }
 
 
+def to_document_model(collection_name: str, doc_dict: Optional[Dict[str, Any]]) -> Union[BaseModel, None]:
+    # Get the corresponding model class for the collection
+    model_class = COLLECTION_MODEL_MAP.get(collection_name)
+    if model_class and doc_dict:
+        return model_class(**doc_dict)
+
+    return None
+
+
 class FirestoreDb:
     client = None
 
-    class Client:
+    class Client(StorageDb):
         def __init__(
             self,
             project_id: str = "",
@@ -126,14 +172,148 @@ class FirestoreDb:
             document = document_ref.get()
 
             if document.exists:
-                # Get the corresponding model class for the collection
-                model_class = COLLECTION_MODEL_MAP.get(collection_name)
-                if model_class:
-                    doc_dict = document.to_dict()
-                    return model_class(**doc_dict) if doc_dict else None
+                return to_document_model(collection_name, document.to_dict())
 
             return None
 
+        # Querying several documents by their IDs in a single round trip
+        def get_documents(
+            self,
+            document_ids: List[str],
+            collection_name: str
+        ) -> Dict[str, BaseModel]:
+            assert collection_name
+
+            if not document_ids:
+                return {}
+
+            collection_ref = self.fs_client.collection(collection_name)
+            document_refs = [collection_ref.document(str(doc_id)) for doc_id in document_ids]
+
+            documents = {}
+
+            for document in self.fs_client.get_all(document_refs):
+                if document.exists:
+                    model = to_document_model(collection_name, document.to_dict())
+                    if model:
+                        documents[document.id] = model
+
+            return documents
+
+    def __new__(
+        cls,
+        project_id: str = "",
+        database_name: str = "",
+        ttl_sec: int = 3600,
+        *args,
+        **kwargs
+    ):
+        if not cls.client:
+            cls.client = cls.Client(
+                project_id,
+                database_name,
+                ttl_sec,
+                *args,
+                **kwargs
+            )
+
+        return cls.client
+
+
+class AsyncFirestoreDb:
+    """
+    The same as FirestoreDb but backed by the Firestore AsyncClient, so reads
+    and writes do not block the event loop
+    """
+    client = None
+
+    class Client(AsyncStorageDb):
+        def __init__(
+            self,
+            project_id: str = "",
+            database_name: str = "",
+            ttl_sec: int = 3600,
+            *args,
+            **kwargs
+        ):
+            self.project_id = project_id
+            self.database_name = database_name
+            self.ttl_sec = ttl_sec
+            self.fs_client = firestore.AsyncClient(
+                project=self.project_id,
+                database=self.database_name
+            )
+
+        # Saving a list of documents by writing them in a batch
+        async def save_documents(self, docs: List[FirestoreDocumentModel], collection_name: str) -> bool:
+            if not (self.project_id and collection_name):
+                return False
+
+            expire_at = datetime.now(timezone.utc) + timedelta(seconds=self.ttl_sec)
+
+            batch = self.fs_client.batch()
+
+            for doc in docs:
+                document_ref = self.fs_client.collection(collection_name).document(
+                    doc.get_doc_id()
+                )
+                document_attributes: Dict[str, Any] = doc.get_attributes()
+
+                # Add TTL field
+                document_attributes["expireAt"] = expire_at
+
+                batch.set(document_ref, document_attributes, merge=True)
+
+            try:
+                await batch.commit()
+                res = True
+            except Exception:
+                res = False
+
+            return res
+
+        # Querying a single document by its document ID in Firestore
+        async def query_document(
+            self,
+            document_id: str,
+            collection_name: str
+        ) -> Union[BaseModel, None]:
+            assert collection_name
+
+            document_ref = self.fs_client.collection(collection_name).document(
+                str(document_id)
+            )
+            document = await document_ref.get()
+
+            if document.exists:
+                return to_document_model(collection_name, document.to_dict())
+
+            return None
+
+        # Querying several documents by their IDs in a single round trip
+        async def get_documents(
+            self,
+            document_ids: List[str],
+            collection_name: str
+        ) -> Dict[str, BaseModel]:
+            assert collection_name
+
+            if not document_ids:
+                return {}
+
+            collection_ref = self.fs_client.collection(collection_name)
+            document_refs = [collection_ref.document(str(doc_id)) for doc_id in document_ids]
+
+            documents = {}
+
+            async for document in self.fs_client.get_all(document_refs):
+                if document.exists:
+                    model = to_document_model(collection_name, document.to_dict())
+                    if model:
+                        documents[document.id] = model
+
+            return documents
+
     def __new__(
         cls,
         project_id: str = "",
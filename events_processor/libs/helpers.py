@@ -0,0 +1,12 @@
+from typing import Tuple
+
+
+def convert_to_int(val, default: int = 0) -> Tuple[bool, int]:
+    try:
+        int_value = int(val)
+        res = True
+    except (ValueError, TypeError):
+        int_value = default
+        res = False
+
+    return res, int_value
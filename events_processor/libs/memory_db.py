@@ -0,0 +1,90 @@
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+from pydantic import BaseModel
+
+from .firestore import FirestoreDocumentModel
+from .storage import AsyncStorageDb, StorageDb, document_key, load_document_model
+
+
+class MemoryStore:
+    """
+    Documents of the in-memory storage shared by all the clients of a
+    process. Like in Redis, a document is the JSON dump of its model under
+    "<collection>:<id>", so reads and writes pay for the serialization
+    """
+    def __init__(self):
+        # Document key -> (expiry time, dump)
+        self.documents: Dict[str, Tuple[float, str]] = {}
+        # (time, collection, dump) of every saved document, when enabled
+        self.writes: Optional[List[Tuple[float, str, str]]] = None
+
+    def save(self, collection_name: str, doc_id: str, dump: str, ttl_sec: int) -> None:
+        now = time.monotonic()
+        self.documents[document_key(collection_name, doc_id)] = (now + ttl_sec, dump)
+
+        if self.writes is not None:
+            self.writes.append((now, collection_name, dump))
+
+    def get(self, collection_name: str, doc_id: str) -> Optional[str]:
+        expires_at, dump = self.documents.get(document_key(collection_name, doc_id), (0.0, ""))
+        return dump if expires_at > time.monotonic() else None
+
+    def clear(self, log_writes: bool = False) -> None:
+        self.documents = {}
+        self.writes = [] if log_writes else None
+
+
+store = MemoryStore()
+
+
+class MemoryDb(StorageDb):
+    """
+    In-memory storage for local runs and load tests, no service is needed.
+    Only the clients of the same process share the documents
+    """
+    def __init__(self, ttl_sec: int = 3600, *args, **kwargs):
+        self.ttl_sec = ttl_sec
+
+    def save_documents(self, docs: List[FirestoreDocumentModel], collection_name: str) -> bool:
+        if not collection_name:
+            return False
+
+        for doc in docs:
+            store.save(collection_name, doc.get_doc_id(), doc.dump(), self.ttl_sec)
+
+        return True
+
+    def query_document(self, document_id: str, collection_name: str) -> Union[BaseModel, None]:
+        assert collection_name
+
+        return load_document_model(collection_name, store.get(collection_name, str(document_id)))
+
+    def get_documents(self, document_ids: List[str], collection_name: str) -> Dict[str, BaseModel]:
+        assert collection_name
+
+        documents = {}
+
+        for doc_id in document_ids:
+            model = self.query_document(doc_id, collection_name)
+            if model:
+                documents[str(doc_id)] = model
+
+        return documents
+
+
+class AsyncMemoryDb(AsyncStorageDb):
+    """
+    The same as MemoryDb but with the async interface of the API
+    """
+    def __init__(self, ttl_sec: int = 3600, *args, **kwargs):
+        self.db = MemoryDb(ttl_sec=ttl_sec)
+
+    async def save_documents(self, docs: List[FirestoreDocumentModel], collection_name: str) -> bool:
+        return self.db.save_documents(docs, collection_name)
+
+    async def query_document(self, document_id: str, collection_name: str) -> Union[BaseModel, None]:
+        return self.db.query_document(document_id, collection_name)
+
+    async def get_documents(self, document_ids: List[str], collection_name: str) -> Dict[str, BaseModel]:
+        return self.db.get_documents(document_ids, collection_name)
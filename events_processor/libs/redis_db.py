@@ -0,0 +1,186 @@
+from typing import Dict, List, Union
+
+import redis
+import redis.asyncio as redis_async
+from pydantic import BaseModel
+
+from .firestore import FirestoreDocumentModel
+from .storage import AsyncStorageDb, StorageDb, document_key, load_document_model
+
+
+class RedisDb:
+    """
+    Redis storage of the documents. A document is a key "<collection>:<id>"
+    with the JSON dump of its model, expiring by the native key TTL
+    """
+    client = None
+
+    class Client(StorageDb):
+        def __init__(
+            self,
+            redis_url: str = "",
+            ttl_sec: int = 3600,
+            *args,
+            **kwargs
+        ):
+            self.redis_url = redis_url
+            self.ttl_sec = ttl_sec
+            self.redis_client = redis.Redis.from_url(redis_url)
+
+        # Saving a list of documents with one pipelined round trip
+        def save_documents(self, docs: List[FirestoreDocumentModel], collection_name: str) -> bool:
+            if not collection_name:
+                return False
+
+            pipeline = self.redis_client.pipeline(transaction=False)
+
+            for doc in docs:
+                pipeline.set(document_key(collection_name, doc.get_doc_id()), doc.dump(), ex=self.ttl_sec)
+
+            try:
+                pipeline.execute()
+                res = True
+            except redis.RedisError:
+                res = False
+
+            return res
+
+        def query_document(
+            self,
+            document_id: str,
+            collection_name: str
+        ) -> Union[BaseModel, None]:
+            assert collection_name
+
+            return load_document_model(
+                collection_name,
+                self.redis_client.get(document_key(collection_name, str(document_id))) # type: ignore[arg-type]
+            )
+
+        def get_documents(
+            self,
+            document_ids: List[str],
+            collection_name: str
+        ) -> Dict[str, BaseModel]:
+            assert collection_name
+
+            if not document_ids:
+                return {}
+
+            dumps = self.redis_client.mget(
+                [document_key(collection_name, str(doc_id)) for doc_id in document_ids]
+            )
+
+            documents = {}
+
+            for doc_id, dump in zip(document_ids, dumps): # type: ignore[arg-type]
+                model = load_document_model(collection_name, dump)
+                if model:
+                    documents[str(doc_id)] = model
+
+            return documents
+
+    def __new__(
+        cls,
+        redis_url: str = "",
+        ttl_sec: int = 3600,
+        *args,
+        **kwargs
+    ):
+        if not cls.client:
+            cls.client = cls.Client(
+                redis_url,
+                ttl_sec,
+                *args,
+                **kwargs
+            )
+
+        return cls.client
+
+
+class AsyncRedisDb:
+    """
+    The same as RedisDb but backed by the asyncio Redis client
+    """
+    client = None
+
+    class Client(AsyncStorageDb):
+        def __init__(
+            self,
+            redis_url: str = "",
+            ttl_sec: int = 3600,
+            *args,
+            **kwargs
+        ):
+            self.redis_url = redis_url
+            self.ttl_sec = ttl_sec
+            self.redis_client = redis_async.Redis.from_url(redis_url)
+
+        async def save_documents(self, docs: List[FirestoreDocumentModel], collection_name: str) -> bool:
+            if not collection_name:
+                return False
+
+            pipeline = self.redis_client.pipeline(transaction=False)
+
+            for doc in docs:
+                pipeline.set(document_key(collection_name, doc.get_doc_id()), doc.dump(), ex=self.ttl_sec)
+
+            try:
+                await pipeline.execute()
+                res = True
+            except redis.RedisError:
+                res = False
+
+            return res
+
+        async def query_document(
+            self,
+            document_id: str,
+            collection_name: str
+        ) -> Union[BaseModel, None]:
+            assert collection_name
+
+            return load_document_model(
+                collection_name,
+                await self.redis_client.get(document_key(collection_name, str(document_id)))
+            )
+
+        async def get_documents(
+            self,
+            document_ids: List[str],
+            collection_name: str
+        ) -> Dict[str, BaseModel]:
+            assert collection_name
+
+            if not document_ids:
+                return {}
+
+            dumps = await self.redis_client.mget(
+                [document_key(collection_name, str(doc_id)) for doc_id in document_ids]
+            )
+
+            documents = {}
+
+            for doc_id, dump in zip(document_ids, dumps):
+                model = load_document_model(collection_name, dump)
+                if model:
+                    documents[str(doc_id)] = model
+
+            return documents
+
+    def __new__(
+        cls,
+        redis_url: str = "",
+        ttl_sec: int = 3600,
+        *args,
+        **kwargs
+    ):
+        if not cls.client:
+            cls.client = cls.Client(
+                redis_url,
+                ttl_sec,
+                *args,
+                **kwargs
+            )
+
+        return cls.client
@@ -0,0 +1,206 @@
+import time
+from typing import Any, Dict
+
+from pydantic import BaseModel
+
+from .helpers import convert_to_int
+
+TEAM_KEYS = {"team2": "radiant", "team3": "dire"}
+
+# See Player's the full list of features here https://snyk.io/advisor/npm-package/dotagsi
+FEATURES = [
+    "activity",
+    "assists",
+    "camps_stacked",
+    "consumable_gold_spent",
+    "deaths",
+    "denies",
+    "gold",
+    "gold_from_creep_kills",
+    "gold_from_hero_kills",
+    "gold_from_income",
+    "gold_from_shared",
+    "gold_lost_to_death",
+    "gold_reliable",
+    "gold_spent_on_buybacks",
+    "gold_unreliable",
+    "gpm",
+    "hero_damage",
+    "hero_healing",
+    "item_gold_spent",
+    "kill_streak",
+    "kills",
+    "last_hits",
+    "net_worth",
+    "runes_activated",
+    "support_gold_spent",
+    "tower_damage",
+    "wards_destroyed",
+    "wards_placed",
+    "wards_purchased",
+    "xpm",
+]
+
+
+class Player(BaseModel):
+    player_name: str = ""
+    # Actions per minute (such as moving units, issuing commands, or using abilities)
+    apm: int = 0
+    # Player"s slot in the event
+    slot: int = 0
+    # Player"s side: radiant or dire
+    side: str = ""
+    # Player's team name
+    team_name: str = ""
+    # Player's Steam ID is the full identifier. Steam uses it universally across all platforms
+    steam_id: int = 0
+    # Player's Account ID is a shorter version for Dota 2 platform
+    account_id: int = 0
+    # Key-Value feature
+    features: Dict[str, str] = {}
+    # Items
+    items: Dict[int, str] = {}
+    # Hero name
+    hero_name: str = ""
+    # Hero level from 1 to 30
+    hero_level: int = 0
+
+    @classmethod
+    def from_event(
+        cls,
+        clock_time: int,
+        slot: int,
+        team_name: str,
+        player_data: Dict,
+        items_data: Dict,
+        hero_data: Dict
+    ) -> "Player":
+        """
+        Builds a player from the sections of a GSI event. The attributes are
+        collected first and validated in one pass instead of being assigned
+        one by one through the model's __setattr__
+        """
+        # APM
+        _, commands_issued = convert_to_int(
+            player_data.get("commands_issued", "0"),
+            0
+        )
+        apm = 60 * int(commands_issued / clock_time) if clock_time > 0 else 0
+
+        # Steam and Account IDs
+        _, steam_id = convert_to_int(
+            player_data.get("steamid", "0"),
+            0
+        )
+        account_id = steam_id - 76561197960265728 if steam_id > 0 else 0
+
+        # Items
+        items = {}
+
+        for s in range(10):
+            slot_data = items_data.get(f"slot{s}")
+            items[s] = (slot_data.get("name") or "") if isinstance(slot_data, dict) else ""
+
+        # Hero info
+        _, hero_level = convert_to_int(hero_data.get("level", "0"), 0)
+
+        return cls.model_validate({
+            "player_name": player_data.get("name") or "",
+            "apm": apm,
+            "slot": slot,
+            "side": team_name,
+            "team_name": player_data.get("team_name") or "",
+            "steam_id": steam_id,
+            "account_id": account_id,
+            # Non-mandatory features of a player
+            "features": {f: str(player_data.get(f) or "") for f in FEATURES},
+            "items": items,
+            "hero_name": hero_data.get("name") or "",
+            "hero_level": hero_level,
+        })
+
+
+class Match(BaseModel):
+    # model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    match_id: int = -1
+    clock_time: str = "..."
+    win_team: str = ""
+    players: dict[str, Player] = {}
+    # How old is the provided match information is (in seconds). -1 means the
+    # age is unknown
+    event_age_seconds: int = -1
+    message: str = "We have not got any incoming events for your token yet"
+
+
+def build_match(event_match_data: Dict[str, Any]) -> Match:
+    """
+    Projects a raw GSI event onto the Match served by the API. The age of the
+    event is left unknown as it depends on the moment of reading
+    """
+    match = Match()
+
+    clock_time = 0
+    # Ok, now we retrieve all the stats from the different sections of the event
+    map_data = event_match_data.get("map")
+
+    if isinstance(map_data, dict):
+        _, match.match_id = convert_to_int(map_data.get("matchid"), 0)
+        _, clock_time = convert_to_int(map_data.get("clock_time"),0)
+        match.win_team = map_data.get("win_team", "")
+
+    player = event_match_data.get("player")
+    items = event_match_data.get("items")
+    hero = event_match_data.get("hero")
+
+    if isinstance(player, dict):
+        for team_key, team_name in TEAM_KEYS.items():
+            player_data = player.get(team_key)
+            items_data = items.get(team_key, {}) if isinstance(items, dict) else {}
+            hero_data = hero.get(team_key, {}) if isinstance(hero, dict) else {}
+
+            if isinstance(player_data, dict):
+                # each event has 20 random slots for both teams cumulatively to
+                # store a player information
+                for slot in range(20):
+                    player_name = f"player{slot}"
+                    player_n = player_data.get(player_name)
+                    player_n_items = items_data.get(player_name) or {}
+                    player_n_hero = hero_data.get(player_name) or {}
+
+                    if isinstance(player_n, dict):
+                        match.players[player_name] = Player.from_event(
+                            clock_time=clock_time,
+                            slot=slot,
+                            team_name=team_name,
+                            player_data=player_n,
+                            items_data=player_n_items,
+                            hero_data=player_n_hero,
+                        )
+
+    mask = "%H:%M:%S" if clock_time >= 3600 else "%M:%S" # noqa: PLR2004
+    match.clock_time = time.strftime(mask, time.gmtime(clock_time))
+    match.message = ""
+
+    return match
+
+
+def dump_match_snapshot(match: Match) -> str:
+    # The age is excluded and added at reading time by render_match_snapshot
+    return match.model_dump_json(exclude={"event_age_seconds"})
+
+
+def render_match_snapshot(match_stats: str, event_age_seconds: int) -> bytes:
+    """
+    Turns a stored snapshot into the response body by inserting the age of
+    the event at its field position, before the message (the last field).
+    The snapshot isn't parsed and the body is byte-identical to the dumped
+    Match
+    """
+    snapshot = match_stats.encode("utf-8")
+    # Quotes in the string values are escaped, only the key of the Match field matches
+    position = snapshot.rfind(b',"message":')
+    if position < 0:
+        position = len(snapshot) - 1
+
+    return b'%s,"event_age_seconds":%d%s' % (snapshot[:position], event_age_seconds, snapshot[position:])
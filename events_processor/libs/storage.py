@@ -0,0 +1,111 @@
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Union
+
+from pydantic import BaseModel
+
+STORAGE_BACKENDS = ("firestore", "redis", "memory")
+
+
+def document_key(collection_name: str, document_id: str) -> str:
+    # Key of a document in the key-value backends (Redis, memory)
+    return f"{collection_name}:{document_id}"
+
+
+def load_document_model(collection_name: str, dump: Optional[Union[str, bytes]]) -> Union[BaseModel, None]:
+    # Documents of the key-value backends are JSON dumps of their models. The
+    # models module imports this one, so it's imported at call time
+    from .firestore import COLLECTION_MODEL_MAP
+
+    model_class = COLLECTION_MODEL_MAP.get(collection_name)
+    if model_class and dump:
+        return model_class.model_validate_json(dump)
+
+    return None
+
+
+class StorageDb(ABC):
+    """
+    Storage of the documents (processed events, live matches) shared by the
+    crawler, the events processor and the API
+    """
+    @abstractmethod
+    def save_documents(self, docs: List, collection_name: str) -> bool:
+        pass
+
+    @abstractmethod
+    def query_document(self, document_id: str, collection_name: str) -> Union[BaseModel, None]:
+        pass
+
+    @abstractmethod
+    def get_documents(self, document_ids: List[str], collection_name: str) -> Dict[str, BaseModel]:
+        pass
+
+
+class AsyncStorageDb(ABC):
+    """
+    The same as StorageDb but with non-blocking calls, for the API
+    """
+    @abstractmethod
+    async def save_documents(self, docs: List, collection_name: str) -> bool:
+        pass
+
+    @abstractmethod
+    async def query_document(self, document_id: str, collection_name: str) -> Union[BaseModel, None]:
+        pass
+
+    @abstractmethod
+    async def get_documents(self, document_ids: List[str], collection_name: str) -> Dict[str, BaseModel]:
+        pass
+
+
+def get_storage_db(
+    backend: str = "firestore",
+    project_id: str = "",
+    database_name: str = "",
+    redis_url: str = "",
+    ttl_sec: int = 3600
+) -> StorageDb:
+    # Backends are imported lazily, so only the chosen one needs its client library
+    if backend == "firestore":
+        from .firestore import FirestoreDb
+
+        return FirestoreDb(project_id=project_id, database_name=database_name, ttl_sec=ttl_sec) # type: ignore[return-value]
+
+    if backend == "redis":
+        from .redis_db import RedisDb
+
+        return RedisDb(redis_url=redis_url, ttl_sec=ttl_sec) # type: ignore[return-value]
+
+    if backend == "memory":
+        # Documents are shared only within the process, for local runs
+        from .memory_db import MemoryDb
+
+        return MemoryDb(ttl_sec=ttl_sec) # type: ignore[return-value]
+
+    raise ValueError(f"Unknown storage backend '{backend}', expected one of {STORAGE_BACKENDS}")
+
+
+def get_async_storage_db(
+    backend: str = "firestore",
+    project_id: str = "",
+    database_name: str = "",
+    redis_url: str = "",
+    ttl_sec: int = 3600
+) -> AsyncStorageDb:
+    if backend == "firestore":
+        from .firestore import AsyncFirestoreDb
+
+        return AsyncFirestoreDb(project_id=project_id, database_name=database_name, ttl_sec=ttl_sec) # type: ignore[return-value]
+
+    if backend == "redis":
+        from .redis_db import AsyncRedisDb
+
+        return AsyncRedisDb(redis_url=redis_url, ttl_sec=ttl_sec) # type: ignore[return-value]
+
+    if backend == "memory":
+        # Documents are shared only within the process, for local runs
+        from .memory_db import AsyncMemoryDb
+
+        return AsyncMemoryDb(ttl_sec=ttl_sec) # type: ignore[return-value]
+
+    raise ValueError(f"Unknown storage backend '{backend}', expected one of {STORAGE_BACKENDS}")
@@ -0,0 +1,206 @@
+import base64
+import struct
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from .stats import TEAM_KEYS
+
+# Numeric features of the players tracked over the match
+TREND_FEATURES = ["gpm", "xpm", "net_worth", "last_hits", "hero_damage"]
+
+# Players of a match: player0-4 of radiant (team2) and player5-9 of dire (team3)
+TREND_PLAYERS = [f"player{slot}" for slot in range(10)]
+
+_PLAYER_INDEX = {name: i for i, name in enumerate(TREND_PLAYERS)}
+
+# Serialized series: number of points, then the clock times and the values
+_HEADER = struct.Struct("<I")
+
+
+def extract_trend_values(event_match_data: Dict[str, Any]) -> np.ndarray:
+    """
+    Returns the tracked features of the players of a GSI event as an array of
+    (players, features). Missing values are NaN
+    """
+    values = np.full((len(TREND_PLAYERS), len(TREND_FEATURES)), np.nan, dtype=np.float32)
+    player = event_match_data.get("player")
+
+    if not isinstance(player, dict):
+        return values
+
+    for team_key in TEAM_KEYS:
+        team_data = player.get(team_key)
+
+        if not isinstance(team_data, dict):
+            continue
+
+        for player_name, player_data in team_data.items():
+            i = _PLAYER_INDEX.get(player_name)
+
+            if i is None or not isinstance(player_data, dict):
+                continue
+
+            for j, feature in enumerate(TREND_FEATURES):
+                try:
+                    values[i, j] = float(player_data[feature])
+                except (KeyError, ValueError, TypeError):
+                    pass
+
+    return values
+
+
+class TrendSeries:
+    """
+    Bounded time series of the tracked features of a match, stored in
+    fixed-size arrays used as a ring buffer. Once full, every new point
+    overwrites the oldest one
+    """
+    def __init__(self, capacity: int = 720):
+        assert capacity > 0
+
+        self.capacity = capacity
+        self.clock_times = np.zeros(capacity, dtype=np.int32)
+        self.values = np.full((capacity, len(TREND_PLAYERS), len(TREND_FEATURES)), np.nan, dtype=np.float32)
+        # Position of the next point and the number of points
+        self.head = 0
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def last_clock_time(self) -> int:
+        if not self.size:
+            return -1
+
+        return int(self.clock_times[(self.head - 1) % self.capacity])
+
+    def append(self, clock_time: int, values: np.ndarray, min_interval_secs: int = 0) -> bool:
+        """
+        Adds a point if it's at least the interval after the last one. Events
+        of the same match come from several spectators, so repeated and late
+        points are skipped
+        """
+        if self.size and clock_time < self.last_clock_time() + max(1, min_interval_secs):
+            return False
+
+        self.clock_times[self.head] = clock_time
+        self.values[self.head] = values
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+        return True
+
+    def series(self) -> Tuple[np.ndarray, np.ndarray]:
+        # The points in chronological order
+        if self.size < self.capacity:
+            return self.clock_times[:self.size], self.values[:self.size]
+
+        order = np.roll(np.arange(self.capacity), -self.head)
+        return self.clock_times[order], self.values[order]
+
+    def to_bytes(self) -> bytes:
+        clock_times, values = self.series()
+        return _HEADER.pack(self.size) + clock_times.tobytes() + values.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes, capacity: int = 720) -> "TrendSeries":
+        trend_series = cls(capacity)
+
+        if not data:
+            return trend_series
+
+        (size,) = _HEADER.unpack_from(data)
+        offset = _HEADER.size
+        clock_times = np.frombuffer(data, dtype=np.int32, count=size, offset=offset)
+        offset += clock_times.nbytes
+        values = np.frombuffer(data, dtype=np.float32, offset=offset).reshape(
+            size, len(TREND_PLAYERS), len(TREND_FEATURES)
+        )
+
+        # Only the latest points fit into a smaller capacity
+        n = min(size, capacity)
+        trend_series.clock_times[:n] = clock_times[size - n:]
+        trend_series.values[:n] = values[size - n:]
+        trend_series.size = n
+        trend_series.head = n % capacity
+
+        return trend_series
+
+    def to_base64(self) -> str:
+        return base64.b64encode(self.to_bytes()).decode("ascii")
+
+    @classmethod
+    def from_base64(cls, data: str, capacity: int = 720) -> "TrendSeries":
+        return cls.from_bytes(base64.b64decode(data), capacity)
+
+
+def rates_per_minute(clock_times: np.ndarray, values: np.ndarray, window: int = 12) -> np.ndarray:
+    """
+    Rolling rates of the features per minute of the match: the change over
+    the last `window` points divided by the time between them. The first
+    points use the window available so far
+    """
+    if not len(clock_times):
+        return np.empty_like(values)
+
+    indexes = np.arange(len(clock_times))
+    start = np.maximum(indexes - window, 0)
+
+    elapsed = (clock_times - clock_times[start]).astype(np.float32)
+    # No time between the points means no rate
+    elapsed[elapsed <= 0] = np.nan
+
+    return (values - values[start]) * 60 / elapsed[:, None, None]
+
+
+def point_deltas(values: np.ndarray) -> np.ndarray:
+    # Change of the features from the previous point, unknown for the first one
+    deltas = np.full_like(values, np.nan)
+    deltas[1:] = np.diff(values, axis=0)
+    return deltas
+
+
+def downsample(clock_times: np.ndarray, values: np.ndarray, points: int) -> Tuple[np.ndarray, np.ndarray]:
+    # Evenly spaced points of the series, the first and the last ones included
+    if points <= 0 or len(clock_times) <= points:
+        return clock_times, values
+
+    indexes = np.unique(np.linspace(0, len(clock_times) - 1, points).round().astype(int))
+    return clock_times[indexes], values[indexes]
+
+
+def _to_list(values: np.ndarray) -> List:
+    # NaN has no JSON representation, it becomes null
+    rounded = values.astype(np.float64).round(2).astype(object)
+    rounded[np.isnan(values)] = None
+    return rounded.tolist()
+
+
+def trends_report(trend_series: TrendSeries, points: int = 0, window: int = 12) -> Dict[str, Any]:
+    """
+    Returns the series of the tracked features by player with their changes
+    and rolling rates per minute, downsampled to the number of points (0 is
+    for all). The changes are between the returned points
+    """
+    clock_times, values = trend_series.series()
+    rates = rates_per_minute(clock_times, values, window)
+
+    sampled_clock_times, sampled_values = downsample(clock_times, values, points)
+    _, sampled_rates = downsample(clock_times, rates, points)
+    sampled_deltas = point_deltas(sampled_values)
+
+    return {
+        "clock_times": sampled_clock_times.tolist(),
+        "players": {
+            player_name: {
+                feature: {
+                    "values": _to_list(sampled_values[:, i, j]),
+                    "deltas": _to_list(sampled_deltas[:, i, j]),
+                    "rates_per_min": _to_list(sampled_rates[:, i, j]),
+                }
+                for j, feature in enumerate(TREND_FEATURES)
+            }
+            for i, player_name in enumerate(TREND_PLAYERS)
+        },
+    }
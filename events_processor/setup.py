@@ -7,8 +7,11 @@ setuptools.setup(
         "dill==0.3.9",
         "pydantic==2.9.2",
         "chardet==5.2.0",
+        "orjson==3.10.11",
         "google-cloud-firestore==2.19.0",
         "google-cloud-secret-manager==2.21.0",
+        "redis==5.2.0",
+        "zstandard==0.23.0",
     ],
     packages=setuptools.find_packages()
 )
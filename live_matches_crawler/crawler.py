@@ -1,29 +1,188 @@
+import asyncio
+import hashlib
+import logging
 import time
+from typing import Dict, Optional
 
+from common.logging_config import setup_logging
 from common.settings import Settings
 from common.steam_api import SteamAPIConnection
-from events_processor.libs.firestore import FirestoreDb
+from events_processor.libs.firestore import LiveMatches
+from events_processor.libs.storage import StorageDb, get_storage_db
 
 settings = Settings()
+logger = logging.getLogger(__name__)
 
 
-def main():
-    while True:
-        steam_api = SteamAPIConnection.get_instance()
-        live_matches = steam_api.get_live_matches()
+def fingerprint(live_matches: LiveMatches) -> str:
+    # The order of the matches in the Steam API response doesn't matter
+    matches = sorted(
+        (m.match_id, m.radiant_team_name, m.dire_team_name) for m in live_matches.matches
+    )
+    return hashlib.blake2b(repr(matches).encode("utf-8"), digest_size=16).hexdigest()
+
+
+class LiveMatchesCrawler:
+    """
+    Polls the live league matches and saves them only when they change. The
+    poll interval adapts: it's reset to the minimum when the matches change
+    and backs off up to the maximum while they are the same or the Steam API
+    fails
+
+    With realtime stats, the stats of every match are fetched concurrently
+    and a crawl cycle is kept within the budget. The stats change on every
+    poll, so they don't count as a change: they are fetched and saved with
+    the matches when these change and every realtime stats interval
+
+    An unchanged document is still re-saved every refresh interval, so it
+    doesn't expire in the storage
+    """
+    def __init__(
+        self,
+        steam_api,
+        storage_db: StorageDb,
+        collection_name: str,
+        min_interval_secs: float = 3,
+        max_interval_secs: float = 30,
+        backoff_factor: float = 1.5,
+        refresh_secs: float = 600,
+        realtime_stats: bool = False,
+        realtime_stats_interval_secs: float = 15,
+        cycle_budget_secs: float = 4,
+        concurrency_per_key: int = 4
+    ):
+        assert 0 < min_interval_secs <= max_interval_secs
+        assert backoff_factor >= 1
+
+        self.steam_api = steam_api
+        self.storage_db = storage_db
+        self.collection_name = collection_name
+        self.min_interval_secs = min_interval_secs
+        self.max_interval_secs = max_interval_secs
+        self.backoff_factor = backoff_factor
+        self.refresh_secs = refresh_secs
+        self.realtime_stats = realtime_stats
+        self.realtime_stats_interval_secs = realtime_stats_interval_secs
+        self.cycle_budget_secs = cycle_budget_secs
+        self.concurrency_per_key = concurrency_per_key
+
+        self.interval_secs = min_interval_secs
+        self.saved_fingerprint: Optional[str] = None
+        self.saved_at = float("-inf")
+
+        self.polls = 0
+        self.writes = 0
+        self.skipped_writes = 0
+        self.errors = 0
+        self.realtime_stats_merged = 0
+        self.realtime_stats_timed_out = 0
+
+    def resave_secs(self) -> float:
+        if self.realtime_stats:
+            return min(self.realtime_stats_interval_secs, self.refresh_secs)
+        return self.refresh_secs
+
+    def back_off(self) -> None:
+        self.interval_secs = min(self.interval_secs * self.backoff_factor, self.max_interval_secs)
+
+    async def poll(self) -> float:
+        """
+        Polls the live matches once, saves them if needed and returns the
+        number of seconds to wait before the next poll
+        """
+        self.polls += 1
+        started = time.monotonic()
+        live_matches, error_msg = await self.steam_api.get_live_matches()
+
+        if error_msg:
+            # The saved matches are kept, a failed request doesn't mean no matches
+            self.errors += 1
+            self.back_off()
+            return self.interval_secs
 
-        fs_client = FirestoreDb(
+        live_matches_fingerprint = fingerprint(live_matches)
+        changed = live_matches_fingerprint != self.saved_fingerprint
+        now = time.monotonic()
+
+        if not changed and now - self.saved_at < self.resave_secs():
+            self.skipped_writes += 1
+            self.back_off()
+            return self.interval_secs
+
+        # The stats are only requested for the polls that are saved
+        if self.realtime_stats:
+            realtime_stats = await self.steam_api.add_realtime_stats(
+                live_matches,
+                budget_secs=self.cycle_budget_secs - (time.monotonic() - started),
+                concurrency_per_key=self.concurrency_per_key
+            )
+            self.realtime_stats_merged += realtime_stats["merged"]
+            self.realtime_stats_timed_out += realtime_stats["timed_out"]
+
+        if self.storage_db.save_documents(docs=[live_matches, ], collection_name=self.collection_name):
+            self.writes += 1
+            self.saved_fingerprint = live_matches_fingerprint
+            self.saved_at = now
+        else:
+            self.errors += 1
+
+        # Matches started or ended, more changes are likely to follow
+        if changed:
+            self.interval_secs = self.min_interval_secs
+        else:
+            self.back_off()
+
+        return self.interval_secs
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "polls": self.polls,
+            "writes": self.writes,
+            "skipped_writes": self.skipped_writes,
+            "errors": self.errors,
+            "realtime_stats_merged": self.realtime_stats_merged,
+            "realtime_stats_timed_out": self.realtime_stats_timed_out,
+            "interval_secs": self.interval_secs,
+        }
+
+
+async def crawl():
+    steam_api = SteamAPIConnection.get_instance()
+    crawler = LiveMatchesCrawler(
+        steam_api=steam_api,
+        storage_db=get_storage_db(
+            backend=settings.storage_backend,
             project_id=settings.google_project_id,
-            database_name=settings.firestore_database_name
-        )
+            database_name=settings.firestore_database_name,
+            redis_url=settings.redis_url
+        ),
+        collection_name=settings.live_matches_collection_name,
+        min_interval_secs=settings.crawler_min_interval_secs,
+        max_interval_secs=settings.crawler_max_interval_secs,
+        refresh_secs=settings.crawler_refresh_secs,
+        realtime_stats=settings.crawler_realtime_stats,
+        realtime_stats_interval_secs=settings.crawler_realtime_stats_interval_secs,
+        cycle_budget_secs=settings.crawler_cycle_budget_secs,
+        concurrency_per_key=settings.steam_api_concurrency_per_key
+    )
+
+    try:
+        while True:
+            interval_secs = await crawler.poll()
 
-        fs_client.save_documents(
-            docs=[live_matches, ],
-            collection_name=settings.live_matches_collection_name
-        )
+            if crawler.polls % 100 == 0:
+                logger.info(f"Live Matches Crawler stats: {crawler.stats()}")
+                logger.info(f"Steam API keys: {steam_api.api_keys.stats()}")
 
-        # There is no need to collect live matches information more frequently
-        time.sleep(5)
+            await asyncio.sleep(interval_secs)
+    finally:
+        await steam_api.close()
+
+
+def main():
+    # The crawler runs in a subprocess of the cron, which has its own logging
+    setup_logging()
+    asyncio.run(crawl())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,18 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+DATA_DIR = Path(__file__).parent / "data"
+
+# The events processor is deployed on its own, its modules import "libs" as
+# a top-level package
+sys.path.append(str(Path(__file__).parent.parent / "events_processor"))
+
+
+@pytest.fixture
+def gsi_event_data():
+    # A spectator's GSI event of a pro match with all the sections sent by Dota 2
+    with open(DATA_DIR / "gsi_event.json") as f:
+        return json.load(f)
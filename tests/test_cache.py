@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from common.cache import TTLCache
+
+
+def test_get_or_load_counts_hits_and_misses():
+    cache = TTLCache(ttl_secs=60)
+    loads = []
+
+    async def load():
+        loads.append(1)
+        return "value"
+
+    async def run():
+        return [await cache.get_or_load("token", load) for _ in range(3)]
+
+    assert asyncio.run(run()) == ["value"] * 3
+    assert len(loads) == 1
+    assert cache.stats() == {"size": 1, "hits": 2, "misses": 1, "coalesced": 0}
+
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("common.cache.time.monotonic", lambda: now[0])
+
+    cache = TTLCache(ttl_secs=3)
+    cache.set("token", "value")
+    assert cache.get("token") == "value"
+
+    now[0] += 3
+    assert cache.get("token") is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(ttl_secs=60, max_size=2)
+    cache.set("a", "value_a")
+    cache.set("b", "value_b")
+    # "a" becomes the most recently used one
+    assert cache.get("a") == "value_a"
+
+    cache.set("c", "value_c")
+    assert cache.get("b") is None
+    assert cache.get("a") == "value_a"
+    assert cache.get("c") == "value_c"
+
+
+def test_concurrent_misses_are_coalesced():
+    cache = TTLCache(ttl_secs=60)
+    loads = []
+
+    async def load():
+        loads.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def run():
+        return await asyncio.gather(*[cache.get_or_load("token", load) for _ in range(10)])
+
+    assert asyncio.run(run()) == ["value"] * 10
+    assert len(loads) == 1
+    assert cache.stats() == {"size": 1, "hits": 0, "misses": 10, "coalesced": 9}
+
+
+def test_failed_load_is_not_cached():
+    cache = TTLCache(ttl_secs=60)
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("Backend is unavailable")
+
+    async def run():
+        return await asyncio.gather(
+            *[cache.get_or_load("token", fail) for _ in range(3)],
+            return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert len(cache) == 0
+
+    async def load():
+        return "value"
+
+    assert asyncio.run(cache.get_or_load("token", load)) == "value"
+
+
+def test_max_size_must_be_positive():
+    with pytest.raises(AssertionError):
+        TTLCache(ttl_secs=1, max_size=0)
@@ -0,0 +1,79 @@
+import asyncio
+
+from app.coalescer import EventCoalescer
+
+
+class FakePublisher:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.messages: list = []
+
+    async def publish(self, message, attributes):
+        if self.fail:
+            raise RuntimeError("Publishing failed")
+
+        self.messages.append((message, attributes))
+        return str(len(self.messages))
+
+
+def test_only_latest_event_of_token_is_published():
+    publisher = FakePublisher()
+    coalescer = EventCoalescer(publish=publisher.publish, interval_secs=0.01)
+
+    async def run():
+        for i in range(10):
+            coalescer.submit("token1", f"event{i}", {"token": "token1"})
+        coalescer.submit("token2", "event", {"token": "token2"})
+        await asyncio.sleep(0.05)
+
+    asyncio.run(run())
+
+    assert sorted(publisher.messages) == [("event", {"token": "token2"}), ("event9", {"token": "token1"})]
+    assert coalescer.stats() == {
+        "received": 11,
+        "coalesced": 9,
+        "published": 2,
+        "failed": 0,
+        "pending": 0,
+        "coalescing_ratio": 5.5,
+    }
+
+
+def test_every_interval_publishes_the_latest_event():
+    publisher = FakePublisher()
+    coalescer = EventCoalescer(publish=publisher.publish, interval_secs=60)
+
+    async def run():
+        coalescer.submit("token", "event0", {})
+        coalescer.submit("token", "event1", {})
+        await coalescer.flush()
+        coalescer.submit("token", "event2", {})
+        await coalescer.flush()
+
+    asyncio.run(run())
+    assert [m for m, _ in publisher.messages] == ["event1", "event2"]
+
+
+def test_too_many_tokens_are_published_right_away():
+    publisher = FakePublisher()
+    coalescer = EventCoalescer(publish=publisher.publish, interval_secs=60, max_tokens=2)
+
+    async def run():
+        coalescer.submit("token1", "event", {})
+        coalescer.submit("token2", "event", {})
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert len(publisher.messages) == 2 # noqa: PLR2004
+
+
+def test_failed_publishing_is_counted():
+    coalescer = EventCoalescer(publish=FakePublisher(fail=True).publish, interval_secs=60)
+
+    async def run():
+        coalescer.submit("token", "event", {})
+        await coalescer.flush()
+
+    asyncio.run(run())
+    assert coalescer.stats()["failed"] == 1
+    assert coalescer.stats()["published"] == 0
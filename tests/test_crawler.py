@@ -0,0 +1,132 @@
+import asyncio
+
+from events_processor.libs.firestore import LiveMatches, LiveMatchInfo
+from live_matches_crawler.crawler import LiveMatchesCrawler, fingerprint
+
+
+class FakeSteamApi:
+    def __init__(self):
+        self.responses: list = []
+        self.game_time = 0
+
+    async def get_live_matches(self):
+        return self.responses.pop(0)
+
+    async def add_realtime_stats(self, live_matches, budget_secs, concurrency_per_key):
+        self.game_time += 1
+        for match in live_matches.matches:
+            match.game_time = self.game_time
+        return {"matches": len(live_matches.matches), "merged": len(live_matches.matches), "failed": 0, "timed_out": 0}
+
+
+class FakeStorageDb:
+    def __init__(self):
+        self.saved: list = []
+
+    def save_documents(self, docs, collection_name):
+        self.saved.append(docs[0])
+        return True
+
+
+def make_live_matches(*match_ids: int) -> LiveMatches:
+    return LiveMatches(matches=[LiveMatchInfo(match_id=m, radiant_team_name=f"team{m}") for m in match_ids])
+
+
+def make_crawler(steam_api, storage_db, **kwargs) -> LiveMatchesCrawler:
+    return LiveMatchesCrawler(
+        steam_api=steam_api,
+        storage_db=storage_db,
+        collection_name="live-matches",
+        min_interval_secs=2,
+        max_interval_secs=8,
+        backoff_factor=2,
+        **kwargs
+    )
+
+
+def test_fingerprint_ignores_order():
+    assert fingerprint(make_live_matches(1, 2)) == fingerprint(make_live_matches(2, 1))
+    assert fingerprint(make_live_matches(1, 2)) != fingerprint(make_live_matches(1))
+
+
+def test_unchanged_matches_are_not_written_and_interval_adapts():
+    steam_api, storage_db = FakeSteamApi(), FakeStorageDb()
+    steam_api.responses = [
+        (make_live_matches(1, 2), ""),
+        (make_live_matches(2, 1), ""),
+        (make_live_matches(1, 2), ""),
+        (make_live_matches(1, 2), ""),
+        (make_live_matches(1, 2, 3), ""),
+    ]
+    crawler = make_crawler(steam_api, storage_db)
+
+    intervals = [asyncio.run(crawler.poll()) for _ in range(5)]
+
+    assert intervals == [2, 4, 8, 8, 2]
+    assert storage_db.saved == [make_live_matches(1, 2), make_live_matches(1, 2, 3)]
+    assert crawler.stats() == {
+        "polls": 5,
+        "writes": 2,
+        "skipped_writes": 3,
+        "errors": 0,
+        "realtime_stats_merged": 0,
+        "realtime_stats_timed_out": 0,
+        "interval_secs": 2,
+    }
+
+
+def test_api_errors_back_off_and_keep_saved_matches():
+    steam_api, storage_db = FakeSteamApi(), FakeStorageDb()
+    steam_api.responses = [
+        (make_live_matches(1), ""),
+        (LiveMatches(), "429 Too Many Requests"),
+        (LiveMatches(), "429 Too Many Requests"),
+        (make_live_matches(1), ""),
+    ]
+    crawler = make_crawler(steam_api, storage_db)
+
+    intervals = [asyncio.run(crawler.poll()) for _ in range(4)]
+
+    assert intervals == [2, 4, 8, 8]
+    assert storage_db.saved == [make_live_matches(1)]
+    assert crawler.errors == 2 # noqa: PLR2004
+
+
+def test_unchanged_matches_are_refreshed_before_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("live_matches_crawler.crawler.time.monotonic", lambda: now[0])
+
+    steam_api, storage_db = FakeSteamApi(), FakeStorageDb()
+    steam_api.responses = [(make_live_matches(1), "")] * 3
+    crawler = make_crawler(steam_api, storage_db, refresh_secs=60)
+
+    asyncio.run(crawler.poll())
+    now[0] += 30
+    asyncio.run(crawler.poll())
+    now[0] += 30
+    asyncio.run(crawler.poll())
+
+    assert len(storage_db.saved) == 2 # noqa: PLR2004
+    assert crawler.skipped_writes == 1
+
+
+def test_realtime_stats_are_saved_every_realtime_stats_interval(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("live_matches_crawler.crawler.time.monotonic", lambda: now[0])
+
+    steam_api, storage_db = FakeSteamApi(), FakeStorageDb()
+    steam_api.responses = [(make_live_matches(1), "") for _ in range(10)]
+    crawler = make_crawler(steam_api, storage_db, realtime_stats=True, realtime_stats_interval_secs=10)
+
+    intervals = []
+    for _ in range(10):
+        intervals.append(asyncio.run(crawler.poll()))
+        now[0] += intervals[-1]
+
+    # The changing stats don't reset the interval, the matches are the same
+    assert intervals == [2, 4, 8, 8, 8, 8, 8, 8, 8, 8]
+    # Saved at 0, 14, 30, 46, 62 s, the stats are only fetched for the writes
+    assert [m.matches[0].game_time for m in storage_db.saved] == [1, 2, 3, 4, 5]
+    assert crawler.writes == 5 # noqa: PLR2004
+    assert crawler.skipped_writes == 5 # noqa: PLR2004
+    assert crawler.realtime_stats_merged == 5 # noqa: PLR2004
@@ -0,0 +1,131 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import core, deltas
+from app.deltas import SnapshotRing, diff_match, live_match_delta
+from app.main import app
+from events_processor.libs.firestore import GsiEvent
+from events_processor.libs.stats import build_match, dump_match_snapshot
+
+TOKEN = "00000000-0000-4000-8000-000000000000"
+
+
+@pytest.fixture(autouse=True)
+def clear_rings():
+    deltas.snapshot_rings.clear()
+
+
+def make_event(gsi_event_data, timestamp: int, gold: int) -> GsiEvent:
+    gsi_event_data["player"]["team2"]["player0"]["gold"] = gold
+    return GsiEvent(
+        token=TOKEN,
+        timestamp=timestamp,
+        match_stats=dump_match_snapshot(build_match(gsi_event_data))
+    )
+
+
+def test_diff_match():
+    old = {
+        "clock_time": "10:00",
+        "win_team": "",
+        "players": {
+            "player0": {"features": {"gold": "100", "kills": "1"}, "items": {"0": "item_tango"}},
+            "player1": {"features": {"gold": "200"}},
+        },
+    }
+    new = {
+        "clock_time": "10:03",
+        "win_team": "",
+        "players": {
+            "player0": {"features": {"gold": "150", "kills": "1"}, "items": {"0": "item_tango"}},
+            "player2": {"features": {"gold": "0"}},
+        },
+    }
+
+    assert diff_match(old, new) == {
+        "clock_time": "10:03",
+        "players": {
+            "player0": {"features": {"gold": "150"}},
+            "player2": {"features": {"gold": "0"}},
+        },
+        "removed_players": ["player1"],
+    }
+    assert diff_match(new, new) == {"players": {}}
+
+
+def test_oldest_snapshot_leaves_the_ring():
+    ring = SnapshotRing(size=2)
+    for version in ("1-0", "2-0", "3-0"):
+        ring.add(version, {"version": version})
+
+    assert ring.get("1-0") is None
+    assert ring.get("3-0") == {"version": "3-0"}
+
+
+def test_delta_since_a_recent_version(gsi_event_data):
+    first = make_event(gsi_event_data, timestamp=1000, gold=100)
+    stats, is_delta = live_match_delta(first, since="")
+    assert not is_delta
+    assert json.loads(stats)["players"]["player0"]["features"]["gold"] == "100"
+
+    second = make_event(gsi_event_data, timestamp=1003, gold=150)
+    delta, is_delta = live_match_delta(second, since="1000-0")
+
+    assert is_delta
+    assert json.loads(delta) == {
+        "event_age_seconds": core.event_age_seconds(second),
+        "players": {"player0": {"features": {"gold": "150"}}},
+    }
+
+
+def test_full_resync_for_unknown_version(gsi_event_data):
+    gsi_event = make_event(gsi_event_data, timestamp=1000, gold=100)
+
+    stats, is_delta = live_match_delta(gsi_event, since="990-0")
+
+    assert not is_delta
+    assert stats == core.render_live_match(gsi_event)
+
+
+def test_ring_of_a_polled_token_does_not_expire(monkeypatch, gsi_event_data):
+    now = [1000.0]
+    monkeypatch.setattr("common.cache.time.monotonic", lambda: now[0])
+    ttl_secs = deltas.snapshot_rings.ttl_secs
+
+    live_match_delta(make_event(gsi_event_data, timestamp=1000, gold=100), since="")
+
+    for timestamp in range(1003, 1012, 3):
+        now[0] += ttl_secs / 2
+        gsi_event = make_event(gsi_event_data, timestamp=timestamp, gold=timestamp)
+        _, is_delta = live_match_delta(gsi_event, since=f"{timestamp - 3}-0")
+        assert is_delta
+
+    now[0] += ttl_secs
+    _, is_delta = live_match_delta(make_event(gsi_event_data, timestamp=1012, gold=150), since="1009-0")
+    assert not is_delta
+
+
+def test_stats_endpoint_with_since(monkeypatch, gsi_event_data):
+    events = [
+        make_event(gsi_event_data, timestamp=1000, gold=100),
+        make_event(gsi_event_data, timestamp=1003, gold=150),
+    ]
+
+    async def query_gsi_event(token):
+        return events[0]
+
+    monkeypatch.setattr(core, "query_gsi_event", query_gsi_event)
+    client = TestClient(app)
+
+    response = client.get(f"/dota2-gsi/live-match/stats?token={TOKEN}&since=0")
+    assert response.headers["X-Stats-Version"] == "1000-0"
+    assert response.headers["X-Stats-Delta"] == "false"
+    assert len(response.json()["players"]) == len(gsi_event_data["player"]["team2"]) * 2
+
+    events.pop(0)
+    response = client.get(f"/dota2-gsi/live-match/stats?token={TOKEN}&since=1000-0")
+    assert response.headers["X-Stats-Version"] == "1003-0"
+    assert response.headers["X-Stats-Delta"] == "true"
+    assert response.json()["players"] == {"player0": {"features": {"gold": "150"}}}
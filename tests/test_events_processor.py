@@ -0,0 +1,433 @@
+import json
+
+import pytest
+
+beam = pytest.importorskip("apache_beam")
+
+from apache_beam.testing.util import assert_that, equal_to  # noqa: E402
+from apache_beam.transforms.window import GlobalWindow  # noqa: E402
+from apache_beam.utils.timestamp import Timestamp  # noqa: E402
+from dataflow_job import (  # type: ignore[import-not-found]  # noqa: E402
+    EnrichWrite,
+    FreshnessFilter,
+    LatestEvent,
+    MatchIDSplit,
+    Parse,
+    TrackTrends,
+    WriteTrends,
+)
+from libs.coders import GsiEventCoder  # type: ignore[import-not-found]  # noqa: E402
+from libs.firestore import GsiEvent, MatchTrends  # type: ignore[import-not-found]  # noqa: E402
+from libs.trends import TrendSeries  # type: ignore[import-not-found]  # noqa: E402
+
+
+def make_message(gsi_event_data, token: str, clock_time: int) -> bytes:
+    gsi_event_data["auth"]["token"] = token
+    gsi_event_data["map"]["clock_time"] = clock_time
+    gsi_event_data["provider"]["timestamp"] += 1
+    return json.dumps(gsi_event_data, ensure_ascii=True).encode("utf-8")
+
+
+def test_parse(gsi_event_data):
+    clock_time = 100
+    message = make_message(gsi_event_data, token="token", clock_time=clock_time)
+
+    (timestamped_event, ) = Parse().process(message)
+    gsi_event = timestamped_event.value
+
+    assert gsi_event.token == "token"
+    assert gsi_event.match_id == int(gsi_event_data["map"]["matchid"])
+    assert gsi_event.clock_time == clock_time
+    assert gsi_event.game_time == gsi_event_data["map"]["game_time"]
+    assert gsi_event.timestamp == gsi_event_data["provider"]["timestamp"]
+    assert json.loads(gsi_event.match_data) == gsi_event_data
+
+
+def test_parse_decodes_non_utf8_messages(gsi_event_data):
+    gsi_event_data["player"]["team2"]["player0"]["name"] = "Fröhlich"
+    message = json.dumps(gsi_event_data, ensure_ascii=False).encode("latin-1")
+
+    (timestamped_event, ) = Parse().process(message)
+    assert json.loads(timestamped_event.value.match_data)["player"]["team2"]["player0"]["name"] == "Fröhlich"
+
+
+@pytest.mark.parametrize("content_encoding", ["gzip", "zstd"])
+def test_parse_decompresses_messages(gsi_event_data, content_encoding):
+    from apache_beam.io.gcp.pubsub import PubsubMessage
+    from libs.codec import compress_message  # type: ignore[import-not-found]
+
+    message = PubsubMessage(
+        data=compress_message(make_message(gsi_event_data, token="token", clock_time=100), content_encoding),
+        attributes={"content_encoding": content_encoding, "token": "token"}
+    )
+
+    (timestamped_event, ) = Parse().process(message)
+    assert timestamped_event.value.token == "token"
+    assert json.loads(timestamped_event.value.match_data) == gsi_event_data
+
+
+def test_parse_drops_undecompressable_messages():
+    from apache_beam.io.gcp.pubsub import PubsubMessage
+
+    message = PubsubMessage(data=b'{"auth": {"token": "token"}}', attributes={"content_encoding": "gzip"})
+    assert list(Parse().process(message)) == []
+
+
+@pytest.mark.parametrize("message", [b"", b"not a json", b"[]", b'{"auth": {"token": "token"}}'])
+def test_parse_drops_invalid_events(message):
+    assert list(Parse().process(message)) == []
+
+
+def test_gsi_event_coder_round_trip():
+    coder = GsiEventCoder()
+    gsi_event = GsiEvent(
+        token="token",
+        match_id=8036203164,
+        timestamp=1732101234,
+        clock_time=-90,
+        game_time=5,
+        match_data='{"map": {}}',
+        match_stats='{"players": {}}'
+    )
+
+    assert coder.decode(coder.encode(gsi_event)) == gsi_event
+
+
+def test_latest_event_per_token(gsi_event_data):
+    messages = [
+        make_message(gsi_event_data, token="token1", clock_time=100),
+        make_message(gsi_event_data, token="token1", clock_time=102),
+        make_message(gsi_event_data, token="token1", clock_time=101),
+        make_message(gsi_event_data, token="token2", clock_time=50),
+    ]
+    match_id = int(gsi_event_data["map"]["matchid"])
+
+    with beam.Pipeline() as p:
+        latest_events = (
+            p
+            | beam.Create(messages)
+            | beam.ParDo(Parse()).with_output_types(GsiEvent)
+            | beam.ParDo(MatchIDSplit())
+            | beam.CombinePerKey(LatestEvent())
+            | beam.MapTuple(lambda key, gsi_event: (key, gsi_event.clock_time))
+        )
+
+        assert_that(
+            latest_events,
+            equal_to([((match_id, "token1"), 102), ((match_id, "token2"), 50)])
+        )
+
+
+class FakeFirestoreDb:
+    """In-memory stand-in for FirestoreDb.Client"""
+    def __init__(self, *args, **kwargs):
+        self.documents = {}
+        self.batched_writes = []
+        self.reads = []
+
+    def query_document(self, document_id, collection_name):
+        self.reads.append((collection_name, document_id))
+        return self.documents.get((collection_name, document_id))
+
+    def save_documents(self, docs, collection_name):
+        self.batched_writes.append(sorted(doc.get_doc_id() for doc in docs))
+        for doc in docs:
+            self.documents[(collection_name, doc.get_doc_id())] = doc
+        return True
+
+
+def test_enrich_write_batches_writes_per_bundle(monkeypatch):
+    from libs import firestore  # type: ignore[import-not-found]
+
+    fake_db = FakeFirestoreDb()
+    monkeypatch.setattr(firestore, "FirestoreDb", lambda *args, **kwargs: fake_db)
+
+    match_id = 1
+    fake_db.documents[("live-matches", "0")] = firestore.LiveMatches(
+        matches=[firestore.LiveMatchInfo(match_id=match_id, radiant_team_name="Radiant", dire_team_name="Dire")]
+    )
+
+    match_data = json.dumps({"map": {"matchid": match_id}, "player": {"team2": {"player0": {"name": "p0"}}}})
+
+    enrich_write = EnrichWrite(
+        project_id="project",
+        gsi_events_collection_name="gsi-events",
+        live_matches_collection_name="live-matches",
+        database_name="database"
+    )
+    enrich_write.setup()
+    enrich_write.start_bundle()
+
+    outputs = []
+    for token in ("token1", "token2"):
+        gsi_event = GsiEvent(token=token, match_id=match_id, timestamp=1000, match_data=match_data)
+        outputs += list(
+            enrich_write.process(((match_id, token), gsi_event), window=GlobalWindow(), timestamp=Timestamp(1000))
+        )
+    # Nothing is written until the bundle is finished
+    assert outputs == []
+    assert fake_db.batched_writes == []
+
+    outputs = list(enrich_write.finish_bundle())
+
+    assert len(outputs) == len(["token1", "token2"])
+    assert fake_db.batched_writes == [["token1", "token2"]]
+
+    stored_event = fake_db.documents[("gsi-events", "token1")]
+    assert json.loads(stored_event.match_data)["player"]["team2"]["player0"]["team_name"] == "Radiant"
+    assert json.loads(stored_event.match_stats)["players"]["player0"]["team_name"] == "Radiant"
+
+
+def test_enrich_write_reads_live_matches_once_per_refresh(monkeypatch):
+    from libs import firestore  # type: ignore[import-not-found]
+
+    now = [1000.0]
+    monkeypatch.setattr("time.monotonic", lambda: now[0])
+    fake_db = FakeFirestoreDb()
+    monkeypatch.setattr(firestore, "FirestoreDb", lambda *args, **kwargs: fake_db)
+
+    def store_live_matches(radiant_team_name):
+        fake_db.documents[("live-matches", "0")] = firestore.LiveMatches(matches=[
+            firestore.LiveMatchInfo(match_id=match_id, radiant_team_name=f"{radiant_team_name}{match_id}")
+            for match_id in (1, 2)
+        ])
+
+    store_live_matches("Radiant")
+    enrich_write = EnrichWrite(
+        project_id="project",
+        gsi_events_collection_name="gsi-events",
+        live_matches_collection_name="live-matches",
+        database_name="database",
+        live_matches_refresh_secs=5
+    )
+    enrich_write.setup()
+
+    # The lookups of a refresh interval hit the index
+    assert enrich_write.get_live_match(1).radiant_team_name == "Radiant1"
+    assert enrich_write.get_live_match(2).radiant_team_name == "Radiant2"
+    assert enrich_write.get_live_match(3) is None
+    assert fake_db.reads == [("live-matches", "0")]
+
+    store_live_matches("Renamed")
+    now[0] += 4
+    assert enrich_write.get_live_match(1).radiant_team_name == "Radiant1"
+    assert len(fake_db.reads) == 1
+
+    now[0] += 1
+    assert enrich_write.get_live_match(1).radiant_team_name == "Renamed1"
+    assert enrich_write.get_live_match(2).radiant_team_name == "Renamed2"
+    assert len(fake_db.reads) == 2 # noqa: PLR2004
+
+
+class FakeState:
+    def __init__(self):
+        self.value = None
+
+    def read(self):
+        return self.value
+
+    def write(self, value):
+        self.value = value
+
+    def clear(self):
+        self.value = None
+
+
+class FakeTimer:
+    def __init__(self):
+        self.fire_at = None
+
+    def set(self, timestamp):
+        self.fire_at = timestamp
+
+
+def test_freshness_filter_drops_stale_events():
+    freshness_filter = FreshnessFilter(state_ttl_secs=3600)
+    latest_state, expiry_timer = FakeState(), FakeTimer()
+
+    def process(match_id: int, game_time: int, timestamp: int) -> bool:
+        gsi_event = GsiEvent(token="token", match_id=match_id, game_time=game_time, timestamp=timestamp)
+        outputs = freshness_filter.process(
+            ("token", gsi_event),
+            latest_state=latest_state,
+            expiry_timer=expiry_timer
+        )
+        return bool(list(outputs))
+
+    assert process(match_id=1, game_time=100, timestamp=1000)
+    assert expiry_timer.fire_at is not None
+    # Older by game time of the same match
+    assert not process(match_id=1, game_time=99, timestamp=1001)
+    # Older by timestamp
+    assert not process(match_id=2, game_time=200, timestamp=999)
+    # Next match of the token
+    assert process(match_id=2, game_time=10, timestamp=1002)
+    assert latest_state.read() == (2, 10, 1002)
+
+    freshness_filter.expire(latest_state=latest_state)
+    assert process(match_id=1, game_time=1, timestamp=1)
+
+
+def test_track_trends_samples_match_clock(gsi_event_data):
+    track_trends = TrackTrends(capacity=10, sample_interval_secs=5, write_interval_secs=0)
+    series_state, last_clock_time_state, expiry_timer = FakeState(), FakeState(), FakeTimer()
+    last_write_clock_time_state = FakeState()
+
+    def process(token: str, clock_time: int, gpm: int):
+        gsi_event_data["player"]["team2"]["player0"]["gpm"] = gpm
+        gsi_event = GsiEvent(token=token, match_id=1, clock_time=clock_time, match_data=json.dumps(gsi_event_data))
+        return list(track_trends.process(
+            (1, gsi_event),
+            series_state=series_state,
+            last_clock_time_state=last_clock_time_state,
+            last_write_clock_time_state=last_write_clock_time_state,
+            expiry_timer=expiry_timer
+        ))
+
+    (match_trends, ) = process("token1", clock_time=100, gpm=400)
+    # Another spectator of the match within the sample interval
+    assert process("token2", clock_time=103, gpm=410) == []
+    (match_trends, ) = process("token2", clock_time=105, gpm=420)
+
+    assert match_trends.match_id == 1
+    assert match_trends.clock_time == 105 # noqa: PLR2004
+    clock_times, values = TrendSeries.from_base64(match_trends.series).series()
+    assert clock_times.tolist() == [100, 105]
+    assert values[:, 0, 0].tolist() == [400, 420]
+
+    track_trends.expire(
+        series_state=series_state,
+        last_clock_time_state=last_clock_time_state,
+        last_write_clock_time_state=last_write_clock_time_state
+    )
+    assert series_state.read() is None
+    assert len(process("token1", clock_time=1, gpm=0)) == 1
+
+
+def test_track_trends_writes_once_per_write_interval(gsi_event_data):
+    track_trends = TrackTrends(capacity=10, sample_interval_secs=5, write_interval_secs=60)
+    series_state, last_clock_time_state, last_write_clock_time_state = FakeState(), FakeState(), FakeState()
+
+    def process(clock_time: int):
+        gsi_event = GsiEvent(token="token", match_id=1, clock_time=clock_time, match_data=json.dumps(gsi_event_data))
+        return list(track_trends.process(
+            (1, gsi_event),
+            series_state=series_state,
+            last_clock_time_state=last_clock_time_state,
+            last_write_clock_time_state=last_write_clock_time_state,
+            expiry_timer=FakeTimer()
+        ))
+
+    outputs = [process(clock_time) for clock_time in range(0, 125, 5)]
+
+    # Every sample adds a point, but the series is only output once a minute
+    assert [len(output) for output in outputs].count(1) == 3 # noqa: PLR2004
+    (match_trends, ) = outputs[-1]
+    assert match_trends.clock_time == 120 # noqa: PLR2004
+    assert len(TrendSeries.from_base64(match_trends.series).series()[0]) == 10 # noqa: PLR2004
+
+
+def test_write_trends_keeps_latest_per_match(monkeypatch):
+    from libs import firestore  # type: ignore[import-not-found]
+
+    fake_db = FakeFirestoreDb()
+    monkeypatch.setattr(firestore, "FirestoreDb", lambda *args, **kwargs: fake_db)
+
+    write_trends = WriteTrends(project_id="project", match_trends_collection_name="match-trends", database_name="db")
+    write_trends.setup()
+    write_trends.start_bundle()
+
+    for match_id, clock_time in ((1, 105), (1, 100), (2, 50)):
+        write_trends.process(MatchTrends(match_id=match_id, clock_time=clock_time))
+    assert fake_db.batched_writes == []
+
+    write_trends.finish_bundle()
+    assert fake_db.batched_writes == [["1", "2"]]
+    assert fake_db.documents[("match-trends", "1")].clock_time == 105 # noqa: PLR2004
+
+
+def test_pipeline_stores_latest_event_and_trends(gsi_event_data):
+    from apache_beam.options.pipeline_options import PipelineOptions
+    from dataflow_job import build_pipeline  # type: ignore[import-not-found]
+    from libs import memory_db  # type: ignore[import-not-found]
+
+    memory_db.store.clear()
+    messages = [make_message(gsi_event_data, token, clock_time)
+                for clock_time in (100, 110) for token in ("token1", "token2")]
+
+    with beam.Pipeline(options=PipelineOptions(["--direct_running_mode=in_memory"])) as p:
+        build_pipeline(p | beam.Create(messages), storage_backend="memory", trends_write_interval_secs=10)
+
+    db = memory_db.MemoryDb()
+    match_id = int(gsi_event_data["map"]["matchid"])
+    for token in ("token1", "token2"):
+        gsi_event = db.query_document(document_id=token, collection_name="gsi-events")
+        assert gsi_event.clock_time == 110 # noqa: PLR2004
+        assert gsi_event.match_stats
+
+    match_trends = db.query_document(document_id=str(match_id), collection_name="match-trends")
+    assert TrendSeries.from_base64(match_trends.series).series()[0].tolist() == [100, 110]
+
+
+def test_pipeline_metrics(gsi_event_data):
+    from apache_beam.metrics.metric import MetricsFilter
+    from apache_beam.options.pipeline_options import PipelineOptions
+    from dataflow_job import build_pipeline  # type: ignore[import-not-found]
+    from libs import memory_db  # type: ignore[import-not-found]
+
+    memory_db.store.clear()
+    messages = [make_message(gsi_event_data, token, clock_time)
+                for clock_time in (100, 110) for token in ("token1", "token2")]
+    messages += [b"not json", b'{"auth": {"token": "token3"}}']
+
+    p = beam.Pipeline(options=PipelineOptions(["--direct_running_mode=in_memory"]))
+    build_pipeline(p | beam.Create(messages), storage_backend="memory")
+    result = p.run()
+    result.wait_until_finish()
+
+    def counter(name: str) -> int:
+        (metric, ) = result.metrics().query(MetricsFilter().with_name(name))["counters"]
+        return metric.result
+
+    assert counter("events_parsed") == 4 # noqa: PLR2004
+    assert counter("events_dropped_invalid") == 1
+    assert counter("events_dropped_incomplete") == 1
+    assert counter("events_written") == 2 # noqa: PLR2004
+
+    distributions = result.metrics().query(MetricsFilter().with_name("tokens_per_window"))["distributions"]
+    assert max(d.result.max for d in distributions) == 2 # noqa: PLR2004
+
+
+def test_local_run_from_file(gsi_event_data, tmp_path, monkeypatch, capsys):
+    import dataflow_job  # type: ignore[import-not-found]
+    from libs import memory_db  # type: ignore[import-not-found]
+
+    memory_db.store.clear()
+    input_file = tmp_path / "events.jsonl"
+    input_file.write_bytes(b"\n".join(make_message(gsi_event_data, f"token{i % 3}", 100 + i) for i in range(9)))
+    profile_output = tmp_path / "job.prof"
+
+    monkeypatch.setattr("sys.argv", [
+        "dataflow_job.py",
+        "--runner=DirectRunner",
+        f"--input_file={input_file}",
+        "--storage_backend=memory",
+        f"--profile_output={profile_output}",
+    ])
+    dataflow_job.run()
+
+    db = memory_db.MemoryDb()
+    assert db.query_document(document_id="token2", collection_name="gsi-events").clock_time == 108 # noqa: PLR2004
+    assert profile_output.exists()
+    out = capsys.readouterr().out
+    assert "dataflow_job.py" in out
+    assert "events_parsed: 9" in out
+
+
+def test_dataflow_run_requires_gcp_arguments(monkeypatch):
+    import dataflow_job  # type: ignore[import-not-found]
+
+    monkeypatch.setattr("sys.argv", ["dataflow_job.py", "--project_id=project"])
+
+    with pytest.raises(SystemExit):
+        dataflow_job.run()
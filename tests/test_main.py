@@ -0,0 +1,195 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import core
+from app.main import app
+from events_processor.libs.codec import EVENT_SECTIONS, decompress_message
+from events_processor.libs.firestore import GsiEvent
+
+TOKEN = "00000000-0000-4000-8000-000000000000"
+STATS_URL = f"/dota2-gsi/live-match/stats?token={TOKEN}"
+
+
+@pytest.fixture
+def stored_event(monkeypatch):
+    gsi_event = GsiEvent(token=TOKEN, timestamp=1000, game_time=600, match_data="{}")
+    renders = []
+
+    async def query_gsi_event(token):
+        return gsi_event
+
+    def render_live_match(event):
+        renders.append(event)
+        return b"{}"
+
+    monkeypatch.setattr(core, "query_gsi_event", query_gsi_event)
+    monkeypatch.setattr(core, "render_live_match", render_live_match)
+
+    return renders
+
+
+def test_stats_have_etag_of_stored_event(stored_event):
+    response = TestClient(app).get(STATS_URL)
+
+    assert response.status_code == 200 # noqa: PLR2004
+    assert response.headers["ETag"] == 'W/"1000-600"'
+    assert len(stored_event) == 1
+
+
+@pytest.mark.parametrize("if_none_match", ['W/"1000-600"', '"1000-600"', 'W/"1-1", W/"1000-600"', "*"])
+def test_matching_etag_is_not_modified(stored_event, if_none_match):
+    response = TestClient(app).get(STATS_URL, headers={"If-None-Match": if_none_match})
+
+    assert response.status_code == 304 # noqa: PLR2004
+    assert response.content == b""
+    assert response.headers["ETag"] == 'W/"1000-600"'
+    # Nothing is rendered for the client having the same event
+    assert stored_event == []
+
+
+def test_changed_event_is_sent(stored_event):
+    response = TestClient(app).get(STATS_URL, headers={"If-None-Match": 'W/"990-597"'})
+
+    assert response.status_code == 200 # noqa: PLR2004
+    assert response.content == b"{}"
+
+
+def test_no_etag_without_stored_event(monkeypatch):
+    async def query_gsi_event(token):
+        return None
+
+    monkeypatch.setattr(core, "query_gsi_event", query_gsi_event)
+
+    response = TestClient(app).get(STATS_URL, headers={"If-None-Match": "*"})
+
+    assert response.status_code == 200 # noqa: PLR2004
+    assert "ETag" not in response.headers
+
+
+class FakePubSub:
+    def __init__(self):
+        self.messages: list = []
+
+    async def publish_messages(self, message, attributes=None):
+        self.messages.append((message, attributes))
+        return str(len(self.messages))
+
+
+@pytest.fixture
+def fake_pub_sub(monkeypatch):
+    pub_sub = FakePubSub()
+    monkeypatch.setattr(core, "get_pub_sub", lambda: pub_sub)
+    # Every event is published at once
+    monkeypatch.setattr("app.core.settings.ingest_coalesce_interval_ms", 0)
+    return pub_sub
+
+
+@pytest.fixture
+def raw_ingest(monkeypatch):
+    monkeypatch.setattr("app.main.settings.ingest_raw_events", True)
+
+
+def test_raw_event_is_published_unchanged(fake_pub_sub, raw_ingest, gsi_event_data):
+    body = json.dumps(gsi_event_data, ensure_ascii=False, indent=1).encode("utf-8")
+
+    response = TestClient(app).post("/dota2-gsi/dota2-event", content=body)
+
+    assert response.json() == {"registered": True, "reg_id": "1"}
+    assert fake_pub_sub.messages == [(
+        body,
+        {"token": gsi_event_data["auth"]["token"], "match_id": gsi_event_data["map"]["matchid"]}
+    )]
+
+
+@pytest.mark.parametrize("body", [b"", b"[1, 2]", b'{"auth": {}}', b'{"auth": {"token": "t"'])
+def test_invalid_raw_event_is_rejected(fake_pub_sub, raw_ingest, body):
+    response = TestClient(app).post("/dota2-gsi/dota2-event", content=body)
+
+    assert response.status_code == 400 # noqa: PLR2004
+    assert fake_pub_sub.messages == []
+
+
+def test_raw_ingest_does_not_validate_the_json(fake_pub_sub, monkeypatch):
+    # Only the braces and the token are checked, the events processor drops
+    # the malformed event. Parsed ingest (the default) rejects it
+    body = b'{"auth": {"token": "token"},}'
+    client = TestClient(app)
+
+    assert client.post("/dota2-gsi/dota2-event", content=body).status_code == 400 # noqa: PLR2004
+
+    monkeypatch.setattr("app.main.settings.ingest_raw_events", True)
+    response = client.post("/dota2-gsi/dota2-event", content=body)
+
+    assert response.json() == {"registered": True, "reg_id": "1"}
+    assert fake_pub_sub.messages == [(body, {"token": "token"})]
+
+
+def test_too_large_event_is_rejected(fake_pub_sub, monkeypatch):
+    monkeypatch.setattr("app.main.settings.ingest_max_body_bytes", 10)
+
+    response = TestClient(app).post("/dota2-gsi/dota2-event", content=b'{"auth": {"token": "token"}}')
+
+    assert response.status_code == 413 # noqa: PLR2004
+    assert fake_pub_sub.messages == []
+
+
+def test_events_are_published_at_once_by_default(monkeypatch, gsi_event_data):
+    pub_sub = FakePubSub()
+    monkeypatch.setattr(core, "get_pub_sub", lambda: pub_sub)
+
+    response = TestClient(app).post("/dota2-gsi/dota2-event", content=json.dumps(gsi_event_data).encode("utf-8"))
+
+    # Coalescing is opt-in, the sender gets the Pub/Sub message ID
+    assert core.settings.ingest_coalesce_interval_ms == 0
+    assert response.json() == {"registered": True, "reg_id": "1"}
+    assert len(pub_sub.messages) == 1
+
+
+def test_parsed_event_ingest(fake_pub_sub, monkeypatch):
+    monkeypatch.setattr("app.main.settings.ingest_raw_events", False)
+
+    response = TestClient(app).post("/dota2-gsi/dota2-event", content=b'{"auth": {"token": "\xc3\xa4"}}')
+
+    assert response.json()["registered"]
+    assert fake_pub_sub.messages == [('{"auth": {"token": "\\u00e4"}}', None)]
+
+
+def test_coalesced_events_are_acknowledged_at_once(fake_pub_sub, monkeypatch):
+    monkeypatch.setattr("app.core.settings.ingest_coalesce_interval_ms", 60_000)
+    monkeypatch.setattr(core, "event_coalescer", core.EventCoalescer(publish=fake_pub_sub.publish_messages))
+    client = TestClient(app)
+
+    for i in range(3):
+        response = client.post("/dota2-gsi/dota2-event", content=b'{"n": %d, "auth": {"token": "token"}}' % i)
+        assert response.json() == {"registered": True, "reg_id": ""}
+
+    assert fake_pub_sub.messages == []
+    assert client.get("/dota2-gsi/ingest/stats").json()["coalesced"] == 2 # noqa: PLR2004
+
+
+def test_raw_event_is_projected_and_compressed(fake_pub_sub, raw_ingest, monkeypatch, gsi_event_data):
+    monkeypatch.setattr("app.core.settings.ingest_projection", True)
+    monkeypatch.setattr("app.core.settings.ingest_compression", "gzip")
+    body = json.dumps(gsi_event_data).encode("utf-8")
+
+    TestClient(app).post("/dota2-gsi/dota2-event", content=body)
+
+    ((message, attributes), ) = fake_pub_sub.messages
+    assert attributes["content_encoding"] == "gzip"
+    assert attributes["token"] == gsi_event_data["auth"]["token"]
+    assert json.loads(decompress_message(message, "gzip")) == {s: gsi_event_data[s] for s in EVENT_SECTIONS}
+
+
+def test_metrics_of_ingested_events(fake_pub_sub, raw_ingest, gsi_event_data):
+    client = TestClient(app)
+    client.post("/dota2-gsi/dota2-event", content=json.dumps(gsi_event_data).encode("utf-8"))
+
+    response = client.get("/dota2-gsi/metrics")
+
+    assert response.status_code == 200 # noqa: PLR2004
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'dota2_json_parse_seconds_count{operation="extract_routing_keys"}' in response.text
+    assert "dota2_pubsub_publish_seconds_count" in response.text
+    assert "dota2_ingest_coalescer_received" in response.text
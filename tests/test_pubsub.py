@@ -0,0 +1,167 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from common.pubsub import PubSub
+
+
+class FakePublisher:
+    """In-memory stand-in for PublisherAsyncClient"""
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.requests: list = []
+        self.published = 0
+
+    async def publish(self, topic, messages):
+        self.requests.append([m.data for m in messages])
+        if self.fail:
+            raise RuntimeError("Publishing failed")
+
+        ids = [str(self.published + i) for i in range(len(messages))]
+        self.published += len(messages)
+        return SimpleNamespace(message_ids=ids)
+
+
+def make_client(publisher: FakePublisher, **kwargs) -> PubSub.Client:
+    client = PubSub.Client(project_id="project", topic_name="topic", **kwargs)
+    client.publisher = publisher # type: ignore[assignment]
+    client.topic_path = "projects/project/topics/topic"
+    return client
+
+
+def test_publish_without_batching():
+    publisher = FakePublisher()
+    client = make_client(publisher)
+
+    async def publish():
+        return [await client.publish_messages(f"event{i}") for i in range(3)]
+
+    assert asyncio.run(publish()) == ["0", "1", "2"]
+    # One publish request per message
+    assert [len(r) for r in publisher.requests] == [1, 1, 1]
+
+
+def test_batch_flushes_on_max_messages():
+    publisher = FakePublisher()
+    client = make_client(publisher, batch_max_messages=5, batch_max_latency_ms=60_000)
+
+    async def publish():
+        return await asyncio.gather(
+            *[client.publish_messages(f"event{i}") for i in range(10)]
+        )
+
+    # Every caller gets the ID of its own message back
+    assert asyncio.run(publish()) == [str(i) for i in range(10)]
+    assert publisher.requests == [
+        [f"event{i}".encode() for i in range(5)],
+        [f"event{i}".encode() for i in range(5, 10)],
+    ]
+
+
+def test_batch_flushes_on_latency():
+    publisher = FakePublisher()
+    client = make_client(publisher, batch_max_messages=100, batch_max_latency_ms=5)
+
+    async def publish():
+        return await asyncio.gather(
+            *[client.publish_messages(f"event{i}") for i in range(3)]
+        )
+
+    assert asyncio.run(asyncio.wait_for(publish(), timeout=1)) == ["0", "1", "2"]
+    assert len(publisher.requests) == 1
+
+
+def test_batch_flushes_on_max_bytes():
+    publisher = FakePublisher()
+    client = make_client(
+        publisher,
+        batch_max_messages=100,
+        batch_max_bytes=10,
+        batch_max_latency_ms=5
+    )
+
+    async def publish():
+        return await asyncio.gather(
+            *[client.publish_messages("1234") for _ in range(5)]
+        )
+
+    assert asyncio.run(publish()) == [str(i) for i in range(5)]
+    # Two 4-byte messages fit into 10 bytes, the third one starts a new batch
+    assert [len(r) for r in publisher.requests] == [2, 2, 1]
+
+
+def test_batch_failure_propagates_to_every_caller():
+    publisher = FakePublisher(fail=True)
+    client = make_client(publisher, batch_max_messages=2, batch_max_latency_ms=60_000)
+
+    async def publish():
+        return await asyncio.gather(
+            client.publish_messages("event0"),
+            client.publish_messages("event1"),
+            return_exceptions=True
+        )
+
+    results = asyncio.run(publish())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_cancelled_batch_cancels_every_caller():
+    publisher = FakePublisher()
+    client = make_client(publisher, batch_max_messages=2, batch_max_latency_ms=60_000)
+    published = asyncio.Event()
+
+    async def publish(topic, messages):
+        published.set()
+        await asyncio.sleep(60)
+
+    publisher.publish = publish # type: ignore[method-assign]
+
+    async def run():
+        callers = [asyncio.ensure_future(client.publish_messages(f"event{i}")) for i in range(2)]
+        await published.wait()
+        for task in client._publish_tasks:
+            task.cancel()
+        return await asyncio.wait_for(asyncio.gather(*callers, return_exceptions=True), timeout=1)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, asyncio.CancelledError) for r in results)
+
+
+def test_flush_sends_pending_messages():
+    publisher = FakePublisher()
+    client = make_client(publisher, batch_max_messages=100, batch_max_latency_ms=60_000)
+
+    async def publish():
+        task = asyncio.ensure_future(client.publish_messages("event0"))
+        await asyncio.sleep(0)
+        await client.flush()
+        return await task
+
+    assert asyncio.run(publish()) == "0"
+
+
+@pytest.mark.parametrize("max_messages, expected", [(0, 1), (1, 1), (5000, 1000)])
+def test_batch_max_messages_is_clamped(max_messages, expected):
+    client = PubSub.Client(
+        project_id="project",
+        topic_name="topic",
+        batch_max_messages=max_messages
+    )
+    assert client.batch_max_messages == expected
+
+
+def test_bytes_are_published_with_attributes():
+    publisher = FakePublisher()
+    client = make_client(publisher)
+    published = []
+
+    async def publish(topic, messages):
+        published.extend(messages)
+        return SimpleNamespace(message_ids=["0"])
+
+    publisher.publish = publish # type: ignore[method-assign]
+
+    assert asyncio.run(client.publish_messages(b'{"a": 1}', attributes={"token": "t"})) == "0"
+    assert published[0].data == b'{"a": 1}'
+    assert dict(published[0].attributes) == {"token": "t"}
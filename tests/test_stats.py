@@ -0,0 +1,76 @@
+import asyncio
+import json
+
+from app import core
+from events_processor.libs.firestore import GsiEvent
+from events_processor.libs.stats import FEATURES, Match, build_match, dump_match_snapshot, render_match_snapshot
+
+
+def test_build_match(gsi_event_data):
+    match = build_match(gsi_event_data)
+
+    assert match.match_id == int(gsi_event_data["map"]["matchid"])
+    assert match.clock_time == "38:05"
+    assert match.win_team == "dire"
+    assert match.message == ""
+    assert sorted(match.players) == sorted(f"player{i}" for i in range(10))
+
+    player = match.players["player0"]
+    assert player.side == "radiant"
+    assert player.player_name == gsi_event_data["player"]["team2"]["player0"]["name"]
+    assert list(player.features) == FEATURES
+    assert player.features["gpm"] == str(gsi_event_data["player"]["team2"]["player0"]["gpm"])
+    assert player.items[0] == gsi_event_data["items"]["team2"]["player0"]["slot0"]["name"]
+    assert match.players["player9"].side == "dire"
+
+
+def test_rendered_snapshot_is_the_match_json(gsi_event_data):
+    match = build_match(gsi_event_data)
+    snapshot = dump_match_snapshot(match)
+
+    match.event_age_seconds = 7
+    assert render_match_snapshot(snapshot, 7) == match.model_dump_json().encode("utf-8")
+
+
+def test_live_match_stat_serves_stored_snapshot(monkeypatch, gsi_event_data):
+    match_stats = dump_match_snapshot(build_match(gsi_event_data))
+    gsi_event = GsiEvent(token="token", match_data="{}", match_stats=match_stats)
+
+    async def query_gsi_event(token):
+        return gsi_event
+
+    monkeypatch.setattr(core, "query_gsi_event", query_gsi_event)
+
+    stats = json.loads(asyncio.run(core.live_match_stat("token")))
+    assert stats["event_age_seconds"] == -1
+    assert stats["players"] == json.loads(match_stats)["players"]
+
+
+def test_live_match_stat_builds_stats_without_snapshot(monkeypatch, gsi_event_data):
+    gsi_event = GsiEvent(token="token", match_data=json.dumps(gsi_event_data))
+
+    async def query_gsi_event(token):
+        return gsi_event
+
+    monkeypatch.setattr(core, "query_gsi_event", query_gsi_event)
+
+    stats = json.loads(asyncio.run(core.live_match_stat("token")))
+    assert stats == json.loads(build_match(gsi_event_data).model_dump_json())
+
+
+def test_live_match_stat_without_events(monkeypatch):
+    async def query_gsi_event(token):
+        return None
+
+    monkeypatch.setattr(core, "query_gsi_event", query_gsi_event)
+
+    assert Match.model_validate_json(asyncio.run(core.live_match_stat("token"))) == Match()
+
+
+def test_player_from_event_round_trips_through_json(gsi_event_data):
+    match = build_match(gsi_event_data)
+
+    assert Match.model_validate_json(match.model_dump_json()) == match
+    assert match.players["player0"].items == {
+        s: gsi_event_data["items"]["team2"]["player0"].get(f"slot{s}", {}).get("name", "") for s in range(10)
+    }
@@ -0,0 +1,197 @@
+import asyncio
+import time
+
+import httpx
+
+from common.steam_api import LIVE_LEAGUE_GAMES_PATH, ApiKeys, SteamApi
+from events_processor.libs.firestore import LiveMatches, LiveMatchInfo
+
+LIVE_GAMES = {
+    "result": {
+        "games": [
+            {
+                "match_id": 1,
+                "server_steam_id": "90000000000000001",
+                "spectators": 1500,
+                "radiant_team": {"team_name": "Radiant"},
+                "dire_team": {"team_name": "Dire"},
+                "scoreboard": {"radiant": {"tower_state": 1974}, "dire": {"tower_state": 2047}},
+            },
+            {"match_id": 0},
+        ]
+    }
+}
+
+
+class SteamApiStandIn:
+    """Local stand-in for the Steam API answering with the status of every key"""
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.requests: list = []
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        key = request.url.params["key"]
+        self.requests.append((request.url.path, key))
+        status = self.statuses[key]
+        if status == "timeout":
+            raise httpx.ReadTimeout("Timed out", request=request)
+        return httpx.Response(status, json=LIVE_GAMES if status == 200 else {}) # noqa: PLR2004
+
+
+def make_steam_api(stand_in, keys, max_retries=2):
+    return SteamApi(
+        api_keys=ApiKeys(api_keys=keys, cooldown_secs=60),
+        max_retries=max_retries,
+        backoff_secs=0,
+        transport=httpx.MockTransport(stand_in.handle)
+    )
+
+
+def test_live_matches_are_parsed():
+    stand_in = SteamApiStandIn({"key1": 200})
+    steam_api = make_steam_api(stand_in, ["key1"])
+
+    live_matches, error_msg = asyncio.run(steam_api.get_live_matches())
+
+    assert error_msg == ""
+    assert [(m.match_id, m.radiant_team_name, m.dire_team_name) for m in live_matches.matches] == [
+        (1, "Radiant", "Dire")
+    ]
+    match = live_matches.matches[0]
+    assert (match.server_steam_id, match.spectators) == (90000000000000001, 1500)
+    assert (match.radiant_tower_state, match.dire_tower_state) == (1974, 2047)
+    assert stand_in.requests == [(LIVE_LEAGUE_GAMES_PATH, "key1")]
+
+
+def test_rate_limited_key_cools_down():
+    stand_in = SteamApiStandIn({"key1": 429, "key2": 200})
+    steam_api = make_steam_api(stand_in, ["key1", "key2"])
+
+    async def run():
+        return [await steam_api.send_request(LIVE_LEAGUE_GAMES_PATH) for _ in range(3)]
+
+    results = asyncio.run(run())
+
+    assert all(error_msg == "" for _, error_msg in results)
+    # The rate limited key is retried with the next one and skipped afterwards
+    assert [key for _, key in stand_in.requests] == ["key1", "key2", "key2", "key2"]
+    assert steam_api.api_keys.healthy_keys() == 1
+    stats = {s["key"]: s for s in steam_api.api_keys.stats()}
+    assert stats["...key1"]["rate_limited"] == 1
+    assert stats["...key1"]["cooling_down"]
+    assert stats["...key2"]["requests"] == 3 # noqa: PLR2004
+
+
+def test_forbidden_key_is_evicted():
+    stand_in = SteamApiStandIn({"key1": 403, "key2": 200})
+    steam_api = make_steam_api(stand_in, ["key1", "key2"], max_retries=0)
+
+    # A rejected key doesn't cost a retry
+    data, error_msg = asyncio.run(steam_api.send_request(LIVE_LEAGUE_GAMES_PATH))
+
+    assert data == LIVE_GAMES
+    assert error_msg == ""
+    assert steam_api.api_keys.get_next_key() == "key2"
+    assert steam_api.api_keys.get_next_key() == "key2"
+    assert steam_api.api_keys.stats()[0]["evicted"]
+
+
+def test_no_healthy_keys():
+    stand_in = SteamApiStandIn({"key1": 403})
+    steam_api = make_steam_api(stand_in, ["key1"])
+
+    async def run():
+        return [await steam_api.send_request(LIVE_LEAGUE_GAMES_PATH) for _ in range(2)]
+
+    (_, first_error), (_, second_error) = asyncio.run(run())
+
+    assert first_error == "403 Forbidden"
+    assert second_error == "No healthy Steam API keys"
+    assert len(stand_in.requests) == 1
+
+
+def test_failed_requests_are_retried():
+    stand_in = SteamApiStandIn({"key1": "timeout"})
+    steam_api = make_steam_api(stand_in, ["key1"], max_retries=2)
+
+    live_matches, error_msg = asyncio.run(steam_api.get_live_matches())
+
+    assert live_matches.matches == []
+    assert error_msg.startswith("ReadTimeout")
+    assert "key1" not in error_msg
+    assert len(stand_in.requests) == 3 # noqa: PLR2004
+    assert steam_api.api_keys.stats()[0]["failed"] == 3 # noqa: PLR2004
+
+
+def test_client_errors_are_not_retried():
+    stand_in = SteamApiStandIn({"key1": 404})
+    steam_api = make_steam_api(stand_in, ["key1"])
+
+    _, error_msg = asyncio.run(steam_api.send_request("/unknown/"))
+
+    assert error_msg == "404 Not Found"
+    assert len(stand_in.requests) == 1
+
+
+REALTIME_STATS = {
+    "match": {"server_steam_id": "90000000000000001", "game_time": 754},
+    "teams": [
+        {"team_number": 2, "score": 12, "net_worth": 25000},
+        {"team_number": 3, "score": 9, "net_worth": 23000},
+    ],
+}
+
+
+class RealtimeStatsStandIn:
+    """Answers the realtime stats after a delay, tracking concurrent requests"""
+    def __init__(self, delay_secs: float):
+        self.delay_secs = delay_secs
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay_secs)
+        finally:
+            self.in_flight -= 1
+        return httpx.Response(200, json=REALTIME_STATS)
+
+
+def make_live_matches(n: int) -> LiveMatches:
+    return LiveMatches(matches=[LiveMatchInfo(match_id=i, server_steam_id=90000000000000000 + i) for i in range(n)])
+
+
+def test_realtime_stats_are_fetched_concurrently_and_merged():
+    stand_in = RealtimeStatsStandIn(delay_secs=0.05)
+    steam_api = SteamApi(api_keys=ApiKeys(api_keys=["key1", "key2"]), transport=httpx.MockTransport(stand_in.handle))
+    live_matches = make_live_matches(8)
+    live_matches.matches.append(LiveMatchInfo(match_id=100))
+
+    started = time.monotonic()
+    stats = asyncio.run(steam_api.add_realtime_stats(live_matches, budget_secs=5, concurrency_per_key=2))
+
+    # 2 keys with 2 requests each, so 2 rounds of 4 requests
+    assert stand_in.max_in_flight == 4 # noqa: PLR2004
+    assert time.monotonic() - started < 0.5 # noqa: PLR2004
+    assert stats == {"matches": 8, "merged": 8, "failed": 0, "timed_out": 0}
+    match = live_matches.matches[0]
+    assert (match.game_time, match.radiant_score, match.dire_score) == (754, 12, 9)
+    assert (match.radiant_net_worth, match.dire_net_worth) == (25000, 23000)
+    # Without the server Steam ID the stats can't be requested
+    assert live_matches.matches[-1].game_time == 0
+
+
+def test_realtime_stats_are_cancelled_after_budget():
+    stand_in = RealtimeStatsStandIn(delay_secs=10)
+    steam_api = SteamApi(api_keys=ApiKeys(api_keys=["key1"]), transport=httpx.MockTransport(stand_in.handle))
+    live_matches = make_live_matches(3)
+
+    started = time.monotonic()
+    stats = asyncio.run(steam_api.add_realtime_stats(live_matches, budget_secs=0.05))
+
+    assert time.monotonic() - started < 1
+    assert stats == {"matches": 3, "merged": 0, "failed": 0, "timed_out": 3}
+    assert stand_in.in_flight == 0
+    assert all(m.game_time == 0 for m in live_matches.matches)
@@ -0,0 +1,240 @@
+import asyncio
+import subprocess
+import sys
+from pathlib import Path
+
+import fakeredis
+import pytest
+
+from events_processor.libs import firestore, memory_db, redis_db
+from events_processor.libs.firestore import AsyncFirestoreDb, GsiEvent, LiveMatches, LiveMatchInfo
+from events_processor.libs.storage import get_async_storage_db, get_storage_db
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        redis_db.redis.Redis, "from_url",
+        lambda url: fakeredis.FakeRedis(server=server)
+    )
+    monkeypatch.setattr(
+        redis_db.redis_async.Redis, "from_url",
+        lambda url: fakeredis.FakeAsyncRedis(server=server)
+    )
+    # Backends are singletons
+    monkeypatch.setattr(redis_db.RedisDb, "client", None)
+    monkeypatch.setattr(redis_db.AsyncRedisDb, "client", None)
+
+    return fakeredis.FakeRedis(server=server)
+
+
+def test_redis_save_and_query(fake_redis):
+    db = get_storage_db(backend="redis", redis_url="redis://localhost", ttl_sec=60)
+    gsi_event = GsiEvent(token="token1", match_id=1, timestamp=1000, match_data="{}")
+    live_matches = LiveMatches(matches=[LiveMatchInfo(match_id=1, radiant_team_name="Radiant")])
+
+    assert db.save_documents(docs=[gsi_event, ], collection_name="gsi-events")
+    assert db.save_documents(docs=[live_matches, ], collection_name="live-matches")
+
+    assert db.query_document(document_id="token1", collection_name="gsi-events") == gsi_event
+    assert db.query_document(document_id="0", collection_name="live-matches") == live_matches
+    assert db.query_document(document_id="token2", collection_name="gsi-events") is None
+
+
+def test_redis_documents_expire_with_key_ttl(fake_redis):
+    db = get_storage_db(backend="redis", redis_url="redis://localhost", ttl_sec=60)
+    db.save_documents(docs=[GsiEvent(token="token1"), ], collection_name="gsi-events")
+
+    assert 0 < fake_redis.ttl("gsi-events:token1") <= 60 # noqa: PLR2004
+    assert "expireAt" not in fake_redis.get("gsi-events:token1").decode()
+
+
+def test_redis_get_documents(fake_redis):
+    db = get_storage_db(backend="redis", redis_url="redis://localhost")
+    db.save_documents(
+        docs=[GsiEvent(token="token1"), GsiEvent(token="token2")],
+        collection_name="gsi-events"
+    )
+
+    documents = db.get_documents(document_ids=["token1", "token2", "token3"], collection_name="gsi-events")
+
+    assert sorted(documents) == ["token1", "token2"]
+    assert documents["token2"] == GsiEvent(token="token2")
+    assert db.get_documents(document_ids=[], collection_name="gsi-events") == {}
+
+
+def test_async_redis_reads_documents_saved_by_sync_client(fake_redis):
+    get_storage_db(backend="redis", redis_url="redis://localhost").save_documents(
+        docs=[GsiEvent(token="token1", match_id=1)],
+        collection_name="gsi-events"
+    )
+    db = get_async_storage_db(backend="redis", redis_url="redis://localhost")
+
+    async def query():
+        return (
+            await db.query_document(document_id="token1", collection_name="gsi-events"),
+            await db.get_documents(document_ids=["token1", "token2"], collection_name="gsi-events"),
+        )
+
+    gsi_event, documents = asyncio.run(query())
+    assert gsi_event == GsiEvent(token="token1", match_id=1)
+    assert documents == {"token1": gsi_event}
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocumentRef:
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+
+    async def get(self):
+        self.client.reads += 1
+        return FakeSnapshot(self.path[1], self.client.documents.get(self.path))
+
+
+class FakeCollectionRef:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def document(self, doc_id):
+        return FakeDocumentRef(self.client, (self.name, doc_id))
+
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self.client = client
+        self.writes = []
+
+    def set(self, document_ref, attributes, merge=False):
+        self.writes.append((document_ref.path, attributes))
+
+    async def commit(self):
+        self.client.commits += 1
+        for path, attributes in self.writes:
+            self.client.documents[path] = attributes
+
+
+class FakeAsyncClient:
+    """In-memory stand-in for the Firestore AsyncClient"""
+    def __init__(self, *args, **kwargs):
+        self.documents = {}
+        self.reads = 0
+        self.commits = 0
+
+    def collection(self, name):
+        return FakeCollectionRef(self, name)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    async def get_all(self, document_refs):
+        self.reads += 1
+        for ref in document_refs:
+            yield FakeSnapshot(ref.path[1], self.documents.get(ref.path))
+
+
+@pytest.fixture
+def fake_async_firestore(monkeypatch):
+    monkeypatch.setattr(firestore.firestore, "AsyncClient", FakeAsyncClient)
+    return AsyncFirestoreDb.Client(project_id="project", database_name="database")
+
+
+def test_async_firestore_maps_documents_to_models(fake_async_firestore):
+    db = fake_async_firestore
+    gsi_event = GsiEvent(token="token1", match_id=1, match_stats='{"players": {}}')
+    live_matches = LiveMatches(matches=[LiveMatchInfo(match_id=1, radiant_team_name="Radiant")])
+
+    async def run():
+        assert await db.save_documents(docs=[gsi_event, GsiEvent(token="token2")], collection_name="gsi-events")
+        assert await db.save_documents(docs=[live_matches, ], collection_name="live-matches")
+        return (
+            await db.query_document(document_id="token1", collection_name="gsi-events"),
+            await db.query_document(document_id="0", collection_name="live-matches"),
+            await db.query_document(document_id="token3", collection_name="gsi-events"),
+            await db.get_documents(document_ids=["token2", "token3"], collection_name="gsi-events"),
+        )
+
+    stored_event, stored_matches, missing, documents = asyncio.run(run())
+
+    # One batched write per call, the documents expire by their TTL field
+    assert db.fs_client.commits == 2 # noqa: PLR2004
+    assert "expireAt" in db.fs_client.documents[("gsi-events", "token1")]
+    assert stored_event == gsi_event
+    assert stored_matches == live_matches
+    assert missing is None
+    assert documents == {"token2": GsiEvent(token="token2")}
+
+
+def test_async_firestore_does_not_save_without_project(fake_async_firestore):
+    fake_async_firestore.project_id = ""
+
+    saved = asyncio.run(fake_async_firestore.save_documents(docs=[GsiEvent()], collection_name="gsi-events"))
+
+    assert not saved
+    assert fake_async_firestore.fs_client.documents == {}
+
+
+@pytest.fixture
+def memory_store(monkeypatch):
+    store = memory_db.MemoryStore()
+    monkeypatch.setattr(memory_db, "store", store)
+    return store
+
+
+def test_memory_documents_are_shared_by_clients(memory_store):
+    gsi_event = GsiEvent(token="token1", match_id=1, timestamp=1000, match_data="{}")
+    assert get_storage_db(backend="memory").save_documents(docs=[gsi_event, ], collection_name="gsi-events")
+
+    db = get_async_storage_db(backend="memory")
+
+    async def query():
+        return (
+            await db.query_document(document_id="token1", collection_name="gsi-events"),
+            await db.get_documents(document_ids=["token1", "token2"], collection_name="gsi-events"),
+        )
+
+    assert asyncio.run(query()) == (gsi_event, {"token1": gsi_event})
+
+
+def test_memory_documents_expire(memory_store):
+    db = get_storage_db(backend="memory", ttl_sec=0)
+    db.save_documents(docs=[GsiEvent(token="token1"), ], collection_name="gsi-events")
+
+    assert db.query_document(document_id="token1", collection_name="gsi-events") is None
+
+
+def test_memory_writes_are_logged(memory_store):
+    memory_store.clear(log_writes=True)
+    get_storage_db(backend="memory").save_documents(docs=[GsiEvent(token="token1"), ], collection_name="gsi-events")
+
+    ((_, collection_name, dump), ) = memory_store.writes
+    assert collection_name == "gsi-events"
+    assert GsiEvent.model_validate_json(dump).token == "token1"
+
+
+def test_memory_backend_does_not_need_redis():
+    # A None module fails to import like a missing package. A new interpreter,
+    # so the modules imported by the other tests don't count
+    code = (
+        "import sys; sys.modules['redis'] = None\n"
+        "from events_processor.libs.storage import get_storage_db\n"
+        "get_storage_db(backend='memory')"
+    )
+
+    subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).parent.parent, check=True)
+
+
+def test_unknown_storage_backend():
+    with pytest.raises(ValueError):
+        get_storage_db(backend="sqlite")
@@ -0,0 +1,159 @@
+import asyncio
+
+from app.streaming import LiveMatchStreams, sse_events
+from events_processor.libs.firestore import GsiEvent
+
+
+class FakeStorage:
+    """Stored events by token, counting the reads"""
+    def __init__(self):
+        self.events: dict = {}
+        self.reads = 0
+
+    async def load(self, token):
+        self.reads += 1
+        return self.events.get(token)
+
+
+def render(gsi_event):
+    return str(gsi_event.timestamp if gsi_event else 0).encode()
+
+
+def make_streams(storage: FakeStorage) -> LiveMatchStreams:
+    return LiveMatchStreams(load=storage.load, render=render, poll_interval_secs=0.005)
+
+
+async def take(stream, n: int):
+    return [await stream.__anext__() for _ in range(n)]
+
+
+def test_payload_is_pushed_only_when_event_changes():
+    storage = FakeStorage()
+    storage.events["token"] = GsiEvent(token="token", timestamp=1)
+    streams = make_streams(storage)
+
+    async def run():
+        stream = streams.subscribe("token", timeout=1)
+        payloads = await take(stream, 1)
+
+        # Several polls of the same event push nothing
+        await asyncio.sleep(0.05)
+        storage.events["token"] = GsiEvent(token="token", timestamp=2)
+        payloads += await take(stream, 1)
+
+        await stream.aclose()
+        return payloads
+
+    assert asyncio.run(run()) == [b"1", b"2"]
+    assert streams.reads > 2 # noqa: PLR2004
+    assert streams.pushes == 2 # noqa: PLR2004
+
+
+def test_subscribers_of_a_token_share_one_poller():
+    storage = FakeStorage()
+    storage.events["token1"] = GsiEvent(token="token1", timestamp=1)
+    storage.events["token2"] = GsiEvent(token="token2", timestamp=2)
+    streams = make_streams(storage)
+
+    async def run():
+        streams1 = [streams.subscribe("token1", timeout=1) for _ in range(10)]
+        stream2 = streams.subscribe("token2", timeout=1)
+
+        payloads = await asyncio.gather(*[take(s, 1) for s in streams1 + [stream2]])
+        assert streams.pollers() == 2 # noqa: PLR2004
+        assert streams.subscribers("token1") == 10 # noqa: PLR2004
+
+        storage.reads = 0
+        await asyncio.sleep(0.05)
+        reads = storage.reads
+
+        for stream in streams1 + [stream2]:
+            await stream.aclose()
+
+        return payloads, reads
+
+    payloads, reads = asyncio.run(run())
+    assert payloads == [[b"1"]] * 10 + [[b"2"]]
+    # Two pollers at a 5 ms interval, whatever the number of subscribers
+    assert reads <= 2 * 0.05 / 0.005 + 2
+
+
+def test_poller_stops_with_the_last_subscriber():
+    storage = FakeStorage()
+    streams = make_streams(storage)
+
+    async def run():
+        stream1 = streams.subscribe("token", timeout=1)
+        stream2 = streams.subscribe("token", timeout=1)
+        await asyncio.gather(take(stream1, 1), take(stream2, 1))
+
+        await stream1.aclose()
+        assert streams.pollers() == 1
+
+        await stream2.aclose()
+        assert streams.pollers() == 0
+        assert streams.subscribers("token") == 0
+
+        reads = storage.reads
+        await asyncio.sleep(0.02)
+        return reads
+
+    reads = asyncio.run(run())
+    assert storage.reads == reads
+
+
+def test_late_subscriber_gets_the_latest_payload():
+    storage = FakeStorage()
+    storage.events["token"] = GsiEvent(token="token", timestamp=1)
+    streams = make_streams(storage)
+
+    async def run():
+        stream1 = streams.subscribe("token", timeout=1)
+        await take(stream1, 1)
+
+        stream2 = streams.subscribe("token", timeout=1)
+        payloads = await take(stream2, 1)
+
+        await stream1.aclose()
+        await stream2.aclose()
+        return payloads
+
+    assert asyncio.run(run()) == [b"1"]
+    assert streams.pushes == 1
+
+
+def test_failed_reads_keep_the_poller_running():
+    storage = FakeStorage()
+    storage.events["token"] = GsiEvent(token="token", timestamp=1)
+    failures = [RuntimeError("Storage is unavailable")] * 2
+
+    async def load(token):
+        if failures:
+            raise failures.pop()
+        return await storage.load(token)
+
+    streams = LiveMatchStreams(load=load, render=render, poll_interval_secs=0.005)
+
+    async def run():
+        stream = streams.subscribe("token", timeout=1)
+        payloads = await take(stream, 1)
+        await stream.aclose()
+        return payloads
+
+    assert asyncio.run(run()) == [b"1"]
+
+
+def test_sse_events_format(monkeypatch):
+    monkeypatch.setattr("app.streaming.settings.stream_keepalive_secs", 0.01)
+    storage = FakeStorage()
+    storage.events["token"] = GsiEvent(token="token", timestamp=1)
+    streams = make_streams(storage)
+
+    async def run():
+        events = sse_events("token", streams)
+        # The payload, then a comment as nothing changes within the keep-alive
+        chunks = await take(events, 2)
+        await events.aclose()
+        return chunks
+
+    assert asyncio.run(run()) == [b"data: 1\n\n", b": keep-alive\n\n"]
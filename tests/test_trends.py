@@ -0,0 +1,119 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from app import core
+from events_processor.libs.firestore import GsiEvent, MatchTrends
+from events_processor.libs.trends import (
+    TREND_FEATURES,
+    TREND_PLAYERS,
+    TrendSeries,
+    downsample,
+    extract_trend_values,
+    rates_per_minute,
+    trends_report,
+)
+
+
+def make_values(value: float) -> np.ndarray:
+    return np.full((len(TREND_PLAYERS), len(TREND_FEATURES)), value, dtype=np.float32)
+
+
+def test_extract_trend_values(gsi_event_data):
+    values = extract_trend_values(gsi_event_data)
+
+    assert values.shape == (len(TREND_PLAYERS), len(TREND_FEATURES))
+    assert values[0, TREND_FEATURES.index("gpm")] == gsi_event_data["player"]["team2"]["player0"]["gpm"]
+    assert values[9, TREND_FEATURES.index("net_worth")] == gsi_event_data["player"]["team3"]["player9"]["net_worth"]
+    assert np.isnan(extract_trend_values({"player": {}})).all()
+
+
+def test_ring_overwrites_oldest_points():
+    trend_series = TrendSeries(capacity=3)
+    for clock_time in range(0, 50, 10):
+        assert trend_series.append(clock_time, make_values(clock_time))
+
+    clock_times, values = trend_series.series()
+    assert clock_times.tolist() == [20, 30, 40]
+    assert values[:, 0, 0].tolist() == [20, 30, 40]
+
+
+def test_late_and_frequent_points_are_skipped():
+    trend_series = TrendSeries()
+    assert trend_series.append(100, make_values(1), min_interval_secs=5)
+    assert not trend_series.append(100, make_values(2), min_interval_secs=5)
+    assert not trend_series.append(104, make_values(2), min_interval_secs=5)
+    assert not trend_series.append(90, make_values(2), min_interval_secs=5)
+    assert len(trend_series) == 1
+
+
+@pytest.mark.parametrize("capacity", [3, 10])
+def test_serialization_round_trip(capacity):
+    trend_series = TrendSeries(capacity=5)
+    for clock_time in range(7):
+        trend_series.append(clock_time, make_values(clock_time))
+
+    restored = TrendSeries.from_base64(trend_series.to_base64(), capacity=capacity)
+    clock_times, values = restored.series()
+
+    expected = list(range(7))[-min(capacity, 5):]
+    assert clock_times.tolist() == expected
+    assert values[:, 3, 2].tolist() == expected
+    # Appending goes on after the restored points
+    assert restored.append(10, make_values(10))
+    assert restored.series()[0].tolist()[-1] == 10 # noqa: PLR2004
+
+
+def test_rates_per_minute():
+    clock_times = np.array([0, 30, 60, 90], dtype=np.int32)
+    values = np.stack([make_values(v) for v in (0, 100, 200, 300)])
+
+    rates = rates_per_minute(clock_times, values, window=2)
+
+    assert np.isnan(rates[0]).all()
+    assert rates[1:, 0, 0].tolist() == [200, 200, 200]
+
+
+def test_downsample_keeps_first_and_last_points():
+    clock_times = np.arange(100, dtype=np.int32)
+    values = np.arange(100, dtype=np.float32)
+
+    sampled_clock_times, sampled_values = downsample(clock_times, values, points=5)
+
+    assert sampled_clock_times.tolist() == [0, 25, 50, 74, 99]
+    assert sampled_values.tolist() == [0, 25, 50, 74, 99]
+    assert downsample(clock_times, values, points=200)[0] is clock_times
+
+
+def test_trends_report():
+    trend_series = TrendSeries()
+    for clock_time in range(0, 600, 5):
+        trend_series.append(clock_time, make_values(clock_time * 10))
+
+    report = trends_report(trend_series, points=4)
+
+    assert report["clock_times"] == [0, 200, 395, 595]
+    gpm = report["players"]["player0"]["gpm"]
+    assert gpm["values"] == [0, 2000, 3950, 5950]
+    assert gpm["deltas"] == [None, 2000, 1950, 2000]
+    assert gpm["rates_per_min"] == [None, 600, 600, 600]
+
+
+def test_live_match_trends(monkeypatch):
+    trend_series = TrendSeries()
+    trend_series.append(100, make_values(1))
+
+    async def query_gsi_event(token):
+        return GsiEvent(token=token, match_id=7)
+
+    async def query_match_trends(match_id):
+        return MatchTrends(match_id=match_id, clock_time=100, series=trend_series.to_base64())
+
+    monkeypatch.setattr(core, "query_gsi_event", query_gsi_event)
+    monkeypatch.setattr(core, "query_match_trends", query_match_trends)
+
+    trends = asyncio.run(core.live_match_trends("token", points=10))
+    assert trends["match_id"] == 7 # noqa: PLR2004
+    assert trends["clock_times"] == [100]
+    assert sorted(trends["players"]) == sorted(TREND_PLAYERS)